@@ -1,6 +1,16 @@
 from flask import Flask
 from config import Config
 from .db import init_app_db
+from .rollups import init_app_rollups
+from .geocoding import init_app_geocoding
+from .dispatch import init_app_dispatch
+from .lifecycle import init_app_lifecycle
+from .payroll import init_app_payroll
+from .transfer import init_app_transfer
+from .metrics import init_app_metrics
+from .query_plans import init_app_query_plans
+from .assets import init_app_assets
+from .menu_images import init_app_menu_images
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -13,12 +23,43 @@ def create_app(config_class=Config):
     # Initialize Database
     init_app_db(app)
 
-    from .routes import auth, main, admin, worker, driver
+    # Dashboard rollup commands
+    init_app_rollups(app)
+
+    # Geocode cache backfill
+    init_app_geocoding(app)
+
+    # Driver dispatch command
+    init_app_dispatch(app)
+
+    # Order latency report
+    init_app_lifecycle(app)
+
+    # Payroll report/close commands
+    init_app_payroll(app)
+
+    # Bulk export/import commands
+    init_app_transfer(app)
+
+    # Request/SQL timing (no-op unless METRICS_ENABLED)
+    init_app_metrics(app)
+
+    # Query plan audit (debug/QUERY_PLAN_AUDIT) and the query-plans report
+    init_app_query_plans(app)
+
+    # Fingerprinted static assets (manifest from `flask assets build`)
+    init_app_assets(app)
+
+    # Menu image variants: template helpers and the menu-images backfill
+    init_app_menu_images(app)
+
+    from .routes import auth, main, admin, worker, driver, kitchen
     app.register_blueprint(auth.bp)
     app.register_blueprint(main.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(worker.bp)
     app.register_blueprint(driver.bp)
+    app.register_blueprint(kitchen.bp)
     # app.register_blueprint(api.bp) # API blueprint not created yet, maybe part of driver/main
 
     return app
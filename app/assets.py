@@ -0,0 +1,229 @@
+"""Build-time static asset pipeline and the template helpers that use it.
+
+``flask assets build`` walks ``app/static`` and writes into ``static/dist``:
+
+* a fingerprinted copy of each file (``style.3f2a9c1e04b7.css``): the name
+  changes whenever the content does, so it can be cached for a year,
+* a ``.gz`` next to text assets (CSS, JS, SVG, ...) when it is smaller,
+  served as is to clients that accept gzip,
+* for JPEG/PNG/WebP images, WebP plus JPEG (PNG when there is
+  transparency) derivatives at each of ``ASSET_IMAGE_WIDTHS`` narrower than
+  the original. This needs Pillow, which is optional: without it images are
+  only fingerprinted.
+
+``url()`` references inside CSS are rewritten to the fingerprinted names.
+Everything is listed in ``dist/manifest.json``, which ``init_app_assets``
+reads once at startup. Templates call ``asset_url('style.css')`` and
+``asset_srcset('burger.jpg')``; both fall back to the plain static URL for
+files the manifest does not know, so a missing build only costs caching.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+GZIP_TYPES = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.xml', '.ico'}
+IMAGE_TYPES = {'.jpg', '.jpeg', '.png', '.webp'}
+SKIP_TYPES = {'.md', '.gz'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: only needed for resized derivatives
+    Image = ImageOps = None
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+def _hashed_name(path, digest, suffix=''):
+    stem, ext = posixpath.splitext(path)
+    return f'{stem}.{digest}{suffix}{ext}'
+
+def _write(root, relpath, data):
+    target = os.path.join(root, *relpath.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+
+def _gzip(root, relpath, data):
+    # mtime=0 keeps the output byte-identical between builds
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) >= len(data):
+        return False
+    _write(root, relpath + '.gz', compressed)
+    return True
+
+def _rewrite_css(css, css_path, manifest):
+    """Point relative ``url()``s at fingerprinted files, relative to the CSS file's new home."""
+    source_dir = posixpath.dirname(css_path)
+    output_dir = posixpath.dirname(manifest[css_path]['file']) if css_path in manifest else posixpath.join(DIST_DIR, source_dir)
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^(?:[a-z]+:|/|#)', url, re.IGNORECASE):
+            return match.group(0)
+        path, _, rest = url.partition('?')
+        target = posixpath.normpath(posixpath.join(source_dir, path))
+        resolved = manifest[target]['file'] if target in manifest else target
+        new = posixpath.relpath(resolved, output_dir or '.')
+        return f"url({quote}{new}{'?' + rest if rest else ''}{quote})"
+
+    return _CSS_URL.sub(replace, css)
+
+def _image_variants(static_root, relpath, digest, widths, quality):
+    """Write resized WebP + JPEG/PNG copies; returns ``[{'width', 'webp', 'fallback'}]``."""
+    with Image.open(os.path.join(static_root, *relpath.split('/'))) as original:
+        # Camera photos store rotation in EXIF, which is dropped on save
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        fallback_ext = '.png' if has_alpha else '.jpg'
+        source = image.convert('RGBA' if has_alpha else 'RGB')
+        variants = []
+        for width in sorted(w for w in widths if w < image.width):
+            height = max(1, round(image.height * width / image.width))
+            resized = source.resize((width, height), Image.LANCZOS)
+            stem = posixpath.splitext(_hashed_name(relpath, digest, f'.{width}w'))[0]
+            entry = {'width': width}
+            for key, ext, options in (('webp', '.webp', {'quality': quality, 'method': 6}),
+                                      ('fallback', fallback_ext, {'quality': quality, 'optimize': True, 'progressive': True}
+                                       if fallback_ext == '.jpg' else {'optimize': True})):
+                out = posixpath.join(DIST_DIR, stem + ext)
+                target = os.path.join(static_root, *out.split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                resized.save(target, **options)
+                entry[key] = out
+            variants.append(entry)
+        return variants, image.width
+
+def build_assets(static_root, widths=(320, 640, 1024, 1600), quality=80, exclude=(), log=print):
+    """Rebuild ``static_root/dist`` and its manifest, skipping the ``exclude`` directories; returns the manifest."""
+    dist_root = os.path.join(static_root, DIST_DIR)
+    shutil.rmtree(dist_root, ignore_errors=True)
+    if Image is None:
+        log('Pillow is not installed: images are fingerprinted but not resized (pip install Pillow).')
+
+    sources = []
+    for directory, dirnames, filenames in os.walk(static_root):
+        rel_dir = os.path.relpath(directory, static_root).replace(os.sep, '/')
+        if any(rel_dir == skip or rel_dir.startswith(skip + '/') for skip in (DIST_DIR,) + tuple(exclude)):
+            dirnames[:] = []
+            continue
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.startswith('.') or posixpath.splitext(filename)[1].lower() in SKIP_TYPES:
+                continue
+            sources.append(posixpath.normpath(posixpath.join(rel_dir, filename)))
+
+    # CSS last, so its url()s can point at already fingerprinted files
+    sources.sort(key=lambda path: path.lower().endswith('.css'))
+    manifest = {}
+    for relpath in sources:
+        with open(os.path.join(static_root, *relpath.split('/')), 'rb') as f:
+            data = f.read()
+        ext = posixpath.splitext(relpath)[1].lower()
+        if ext == '.css':
+            manifest[relpath] = {'file': posixpath.join(DIST_DIR, _hashed_name(relpath, fingerprint(data)))}
+            data = _rewrite_css(data.decode('utf-8'), relpath, manifest).encode('utf-8')
+        digest = fingerprint(data)
+        out = posixpath.join(DIST_DIR, _hashed_name(relpath, digest))
+        _write(static_root, out, data)
+        entry = {'file': out, 'size': len(data)}
+        if ext in GZIP_TYPES:
+            entry['gzip'] = _gzip(static_root, out, data)
+        if ext in IMAGE_TYPES and Image is not None:
+            try:
+                entry['variants'], entry['width'] = _image_variants(static_root, relpath, digest, widths, quality)
+            except OSError as e:
+                log(f'  could not resize {relpath}: {e}')
+        manifest[relpath] = entry
+        log(f"  {relpath} -> {out}" + (f" (+{len(entry.get('variants', []))} sizes)" if entry.get('variants') else ''))
+
+    with open(os.path.join(dist_root, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+def load_manifest(static_root):
+    try:
+        with open(os.path.join(static_root, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# --- Template helpers ---
+
+def _manifest():
+    return current_app.extensions.get('asset_manifest', {})
+
+def asset_url(filename):
+    """Fingerprinted static URL for ``filename``, or the plain one if it was not built."""
+    entry = _manifest().get(filename)
+    return url_for('static', filename=entry['file'] if entry else filename)
+
+def asset_srcset(filename, format='webp'):
+    """``srcset`` value for an image: each built width, plus the original at its own width."""
+    entry = _manifest().get(filename)
+    if not entry or not entry.get('variants'):
+        return ''
+    key = 'webp' if format == 'webp' else 'fallback'
+    candidates = [f"{url_for('static', filename=variant[key])} {variant['width']}w" for variant in entry['variants']]
+    if format != 'webp' and entry.get('width'):
+        candidates.append(f"{url_for('static', filename=entry['file'])} {entry['width']}w")
+    return ', '.join(candidates)
+
+# --- Serving ---
+
+def _serve_static(filename):
+    """Static view that sends the ``.gz`` twin when the client accepts it and marks hashed files immutable."""
+    static_folder = current_app.static_folder
+    immutable = filename.startswith(DIST_DIR + '/')
+    if immutable and 'gzip' in request.headers.get('Accept-Encoding', '') and \
+            os.path.isfile(os.path.join(static_folder, *filename.split('/')) + '.gz'):
+        response = send_from_directory(static_folder, filename + '.gz', mimetype=_mimetype(filename))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(static_folder, filename)
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+    return response
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+@click.group('assets')
+def assets_cli():
+    """Static asset fingerprinting, compression and resizing."""
+
+@assets_cli.command('build')
+@click.option('--width', 'widths', type=int, multiple=True, help='Image widths to generate (repeatable).')
+@click.option('--quality', type=int, default=None, help='WebP/JPEG quality (1-95).')
+@with_appcontext
+def assets_build_command(widths, quality):
+    """Rebuild static/dist and its manifest."""
+    config = current_app.config
+    manifest = build_assets(
+        current_app.static_folder,
+        widths=widths or config.get('ASSET_IMAGE_WIDTHS', (320, 640, 1024, 1600)),
+        quality=quality or config.get('ASSET_IMAGE_QUALITY', 80),
+        exclude=config.get('ASSET_EXCLUDE', ()),
+        log=click.echo
+    )
+    click.echo(f'Built {len(manifest)} assets; restart the app to load the new manifest.')
+
+def init_app_assets(app):
+    app.cli.add_command(assets_cli)
+    # Read once: a rebuild takes effect on the next restart, together with the templates using it
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_srcset=asset_srcset)
+    app.view_functions['static'] = _serve_static
@@ -0,0 +1,49 @@
+"""Per-worker caches invalidated through ``cache_generations``.
+
+A ``GenerationCache`` holds whatever its loader builds from the database and
+serves it without SQL. Writers in this worker call ``invalidate()``; triggers
+on the source tables bump the named generation row, which other workers
+compare at most every ``check_interval`` seconds.
+"""
+import threading
+import time
+
+class GenerationCache:
+    def __init__(self, name, loader, check_interval=1.0):
+        self.name = name
+        self.loader = loader
+        self.check_interval = check_interval
+        self.version = 0
+        self._value = None
+        self._loaded = False
+        self._generation = None
+        self._loaded_version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def generation(self, db):
+        row = db.execute("SELECT generation FROM cache_generations WHERE name = ?", (self.name,)).fetchone()
+        return row['generation'] if row else 0
+
+    def get(self, db):
+        if self._loaded and self._loaded_version == self.version:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self._value
+            # One primary-key read tells us whether another worker wrote
+            if self.generation(db) == self._generation:
+                self._checked_at = time.monotonic()
+                return self._value
+
+        with self._lock:
+            version = self.version
+            generation = self.generation(db)
+            self._value = self.loader(db)
+            self._generation = generation
+            self._loaded_version = version
+            self._loaded = True
+            self._checked_at = time.monotonic()
+            return self._value
@@ -0,0 +1,88 @@
+"""Server-side shopping cart.
+
+Lines live in ``cart_items`` (one ``carts`` row per user) and the session
+only keeps ``cart_id`` plus ``cart_count`` for the nav badge, so the signed
+cookie stays a constant size. Adding an item already in the cart with the
+same allergies note bumps that line's quantity instead of adding a new one.
+Names and prices come from the menu catalog when the cart is read.
+"""
+from flask import session
+from app.catalog import get_catalog
+
+MAX_LINE_QUANTITY = 99
+
+def get_cart_id(db, user_id):
+    cart_id = session.get('cart_id')
+    if cart_id is not None:
+        return cart_id
+
+    db.execute("INSERT OR IGNORE INTO carts (user_id) VALUES (?)", (user_id,))
+    cart_id = db.execute("SELECT cart_id FROM carts WHERE user_id = ?", (user_id,)).fetchone()['cart_id']
+    db.commit()
+    session['cart_id'] = cart_id
+
+    # Fold in a cart left in the session cookie by the previous implementation
+    legacy = session.pop('cart', None)
+    if legacy:
+        for line in legacy:
+            add_item(db, cart_id, line['item_id'], line.get('quantity', 1), line.get('allergies', ''), commit=False)
+        db.commit()
+    refresh_count(db, cart_id)
+    return cart_id
+
+def refresh_count(db, cart_id):
+    session['cart_count'] = db.execute(
+        "SELECT COUNT(*) FROM cart_items WHERE cart_id = ?", (cart_id,)
+    ).fetchone()[0]
+
+def add_item(db, cart_id, item_id, quantity, allergies='', commit=True):
+    quantity = max(1, min(int(quantity), MAX_LINE_QUANTITY))
+    db.execute("""
+        INSERT INTO cart_items (cart_id, item_id, quantity, allergies) VALUES (?, ?, ?, ?)
+        ON CONFLICT (cart_id, item_id, allergies) DO UPDATE SET
+            quantity = min(quantity + excluded.quantity, ?)
+    """, (cart_id, item_id, quantity, (allergies or '').strip(), MAX_LINE_QUANTITY))
+    if commit:
+        db.commit()
+        refresh_count(db, cart_id)
+
+def set_quantity(db, cart_id, line_id, quantity):
+    if quantity <= 0:
+        remove_line(db, cart_id, line_id)
+        return
+    db.execute(
+        "UPDATE cart_items SET quantity = ? WHERE id = ? AND cart_id = ?",
+        (min(quantity, MAX_LINE_QUANTITY), line_id, cart_id)
+    )
+    db.commit()
+
+def remove_line(db, cart_id, line_id):
+    db.execute("DELETE FROM cart_items WHERE id = ? AND cart_id = ?", (line_id, cart_id))
+    db.commit()
+    refresh_count(db, cart_id)
+
+def clear(db, cart_id):
+    """Empty the cart inside the caller's transaction."""
+    db.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+    session['cart_count'] = 0
+
+def get_lines(db, cart_id):
+    """Return cart lines priced from the catalog; items no longer on the menu, or withdrawn, are skipped."""
+    catalog = get_catalog(db)
+    lines = []
+    rows = db.execute(
+        "SELECT id, item_id, quantity, allergies FROM cart_items WHERE cart_id = ? ORDER BY id", (cart_id,)
+    ).fetchall()
+    for row in rows:
+        item = catalog.get_item(row['item_id'])
+        if item is None:
+            continue
+        lines.append({
+            'line_id': row['id'],
+            'item_id': row['item_id'],
+            'name': item['name'],
+            'price': float(item['price']),
+            'quantity': row['quantity'],
+            'allergies': row['allergies'],
+        })
+    return lines
@@ -0,0 +1,66 @@
+"""In-process cache of the menu catalog.
+
+The menu changes a few times a day but is read on almost every page, so each
+worker keeps an immutable snapshot (all items, active items grouped by
+category, category list, id -> item map) and serves it without SQL.
+``by_name`` and ``get_item`` only see active items, so withdrawn dishes
+cannot be featured, added to a cart or ordered; ``items`` and ``by_id``
+keep every row for the admin pages.
+
+Invalidation is two-level (see ``app.cache.GenerationCache``):
+
+* ``invalidate_catalog()`` bumps the local version immediately after an
+  admin write in this worker.
+* Triggers on ``menu_items`` bump ``cache_generations.generation`` for
+  'menu'; other workers compare it at most every ``CATALOG_CHECK_INTERVAL``
+  seconds and reload when it moved.
+"""
+from flask import current_app
+from app.cache import GenerationCache
+
+class CatalogSnapshot:
+    def __init__(self, rows):
+        self.items = [dict(row) for row in rows]
+        self.by_id = {item['item_id']: item for item in self.items}
+        self.by_name = {}
+        self.by_category = {}
+        for item in self.items:
+            if not item['is_active']:
+                continue
+            self.by_name.setdefault(item['name'], item)
+            self.by_category.setdefault(item['category'], []).append(item)
+        self.categories = sorted(self.by_category)
+        self.all_categories = sorted({item['category'] for item in self.items})
+
+    @property
+    def active_items(self):
+        return [item for items in self.by_category.values() for item in items]
+
+    def get_item(self, item_id):
+        """The active item with ``item_id``, or None if it is unknown or withdrawn."""
+        try:
+            item = self.by_id.get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+        return item if item and item['is_active'] else None
+
+def load_snapshot(db):
+    return CatalogSnapshot(db.execute("SELECT * FROM menu_items ORDER BY item_id").fetchall())
+
+def _catalog(app=None):
+    app = app or current_app
+    catalog = app.extensions.get('menu_catalog')
+    if catalog is None:
+        catalog = app.extensions.setdefault(
+            'menu_catalog',
+            GenerationCache('menu', load_snapshot, app.config.get('CATALOG_CHECK_INTERVAL', 1.0))
+        )
+    return catalog
+
+def get_catalog(db):
+    """Return the current ``CatalogSnapshot``, reloading it if the menu changed."""
+    return _catalog().get(db)
+
+def invalidate_catalog():
+    """Call after committing a menu write so this worker reloads immediately."""
+    _catalog().invalidate()
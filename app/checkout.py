@@ -0,0 +1,111 @@
+"""Order placement.
+
+``place_order`` turns a user's cart into an order in one ``BEGIN IMMEDIATE``
+transaction: lines are re-priced from the menu catalog, inserted with a
+single ``executemany``, folded into the dashboard rollups and the cart is
+emptied before the commit. The checkout form carries a one-time token that
+is stored as ``orders.idempotency_key`` (unique), so a double submit or a
+retried request returns the order the first attempt created. A coupon is
+validated against the re-priced subtotal and redeemed atomically in the
+same transaction (see ``app.coupons``).
+"""
+import secrets
+import sqlite3
+from app import cart as carts
+from app.rollups import record_order
+from app.lifecycle import record_event
+from app.kitchen import notify_kitchen
+from app import coupons
+
+def new_checkout_token():
+    return secrets.token_urlsafe(16)
+
+def cart_subtotal(lines):
+    return sum(line['price'] * line['quantity'] for line in lines)
+
+def quote(lines, tax_rate, delivery_fee, tip=0, discount=0):
+    subtotal = cart_subtotal(lines)
+    # Tax applies to the discounted subtotal
+    tax = (subtotal - discount) * tax_rate
+    return {
+        'subtotal': subtotal,
+        'discount': discount,
+        'tax': tax,
+        'delivery_fee': delivery_fee,
+        'tip': tip,
+        'total': subtotal - discount + tax + delivery_fee + tip,
+    }
+
+def find_order_by_key(db, user_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    row = db.execute(
+        "SELECT order_id FROM orders WHERE idempotency_key = ? AND user_id = ?",
+        (idempotency_key, user_id)
+    ).fetchone()
+    return row['order_id'] if row else None
+
+def place_order(db, user_id, cart_id, idempotency_key, tax_rate, delivery_fee, tip=0, coupon_code=None):
+    """Create an order from the cart.
+
+    Returns ``(order_id, created)``; ``created`` is False when the key was
+    already used and the existing order is returned. Returns ``(None, False)``
+    when the cart is empty. Raises ``coupons.CouponError`` (with nothing
+    written) when the coupon no longer applies.
+    """
+    existing = find_order_by_key(db, user_id, idempotency_key)
+    if existing:
+        return existing, False
+
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        # A concurrent submit of the same form may have won the write lock
+        existing = find_order_by_key(db, user_id, idempotency_key)
+        if existing:
+            db.rollback()
+            return existing, False
+
+        lines = carts.get_lines(db, cart_id)
+        if not lines:
+            db.rollback()
+            return None, False
+
+        discount = 0
+        if coupon_code:
+            coupon, discount = coupons.validate(db, coupon_code, cart_subtotal(lines))
+            coupons.redeem(db, coupon)
+            coupon_code = coupon['code']
+
+        totals = quote(lines, tax_rate, delivery_fee, tip, discount)
+        cursor = db.execute(
+            """INSERT INTO orders (user_id, subtotal, tax, delivery_fee, tip, total, status,
+                                   coupon_code, discount, idempotency_key)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (user_id, totals['subtotal'], totals['tax'], totals['delivery_fee'], totals['tip'],
+             totals['total'], 'pending', coupon_code or None, discount, idempotency_key or None)
+        )
+        order_id = cursor.lastrowid
+
+        db.executemany(
+            "INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies) VALUES (?, ?, ?, ?, ?, ?)",
+            [(order_id, line['item_id'], line['name'], line['price'], line['quantity'], line['allergies'])
+             for line in lines]
+        )
+
+        record_order(db, order_id)
+        record_event(db, order_id, None, 'pending', f'customer:{user_id}')
+        carts.clear(db, cart_id)
+        db.commit()
+    except sqlite3.IntegrityError:
+        db.rollback()
+        existing = find_order_by_key(db, user_id, idempotency_key)
+        if existing:
+            return existing, False
+        raise
+    except Exception:
+        db.rollback()
+        raise
+    notify_kitchen()
+    return order_id, True
@@ -0,0 +1,76 @@
+"""Coupon validation and redemption.
+
+Coupon definitions are cached per worker (``GenerationCache`` on the
+'coupons' generation), so validating a code at checkout costs no SQL.
+``used_count`` is never read from the cache: redemption is one conditional
+``UPDATE ... SET used_count = used_count + 1 WHERE used_count < usage_limit``
+inside the checkout transaction, so concurrent redemptions cannot oversell
+a limited coupon and never need a read-modify-write.
+"""
+from datetime import date
+from flask import current_app
+from app.cache import GenerationCache
+
+class CouponError(Exception):
+    """Raised when a coupon cannot be applied; the message is user-facing."""
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+def load_coupons(db):
+    rows = db.execute("SELECT * FROM coupons WHERE is_active = 1").fetchall()
+    return {normalize_code(row['code']): dict(row) for row in rows}
+
+def _cache(app=None):
+    app = app or current_app
+    cache = app.extensions.get('coupon_cache')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'coupon_cache',
+            GenerationCache('coupons', load_coupons, app.config.get('CATALOG_CHECK_INTERVAL', 1.0))
+        )
+    return cache
+
+def invalidate_coupons():
+    _cache().invalidate()
+
+def _is_expired(coupon, today):
+    expiry = (coupon['expiry_date'] or '').strip()
+    return bool(expiry) and expiry[:10] < today.isoformat()
+
+def compute_discount(coupon, subtotal):
+    if coupon['discount_type'] == 'percentage':
+        discount = subtotal * float(coupon['discount_value']) / 100
+    else:
+        discount = float(coupon['discount_value'])
+    if coupon['max_discount'] is not None:
+        discount = min(discount, float(coupon['max_discount']))
+    return round(max(0.0, min(discount, subtotal)), 2)
+
+def validate(db, code, subtotal, today=None):
+    """Return ``(coupon, discount)`` for an applicable code or raise ``CouponError``.
+
+    The usage limit is only advisory here; ``redeem`` enforces it.
+    """
+    today = today or date.today()
+    coupon = _cache().get(db).get(normalize_code(code))
+    if coupon is None:
+        raise CouponError('Invalid coupon code')
+    if _is_expired(coupon, today):
+        raise CouponError('This coupon has expired')
+    if subtotal < float(coupon['min_order'] or 0):
+        raise CouponError(f"Minimum order of ${float(coupon['min_order']):.2f} required for this coupon")
+    return coupon, compute_discount(coupon, subtotal)
+
+def redeem(db, coupon, today=None):
+    """Atomically claim one use of ``coupon`` inside the caller's transaction."""
+    today = today or date.today()
+    cursor = db.execute("""
+        UPDATE coupons SET used_count = coalesce(used_count, 0) + 1
+        WHERE id = ?
+          AND is_active = 1
+          AND (usage_limit IS NULL OR coalesce(used_count, 0) < usage_limit)
+          AND (expiry_date IS NULL OR expiry_date = '' OR substr(expiry_date, 1, 10) >= ?)
+    """, (coupon['id'], today.isoformat()))
+    if cursor.rowcount != 1:
+        raise CouponError('This coupon has reached its usage limit')
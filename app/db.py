@@ -4,14 +4,138 @@ from flask import current_app, g
 from flask.cli import with_appcontext
 import os
 import json
+import queue
+import threading
+from . import migrations
+from .metrics import get_metrics, timed_connection_class
+from .query_plans import trace_connection
+
+class ConnectionPool:
+    """Per-worker pool of pre-configured SQLite connections.
+
+    Connections are opened lazily up to ``size`` and handed back to the pool
+    at teardown, so requests skip the connect + PRAGMA cost and keep each
+    connection's prepared-statement cache warm.
+    """
+
+    def __init__(self, path, size=5, timeout=5.0, busy_timeout_ms=5000,
+                 cache_size_kb=8000, mmap_size=134217728, statement_cache_size=256,
+                 factory=sqlite3.Connection):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.statement_cache_size = statement_cache_size
+        self.factory = factory
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            factory=self.factory
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f'Timed out waiting for a database connection (pool size {self.size})')
+
+    def release(self, conn):
+        # Reset state left behind by the request; drop the connection if it is unhealthy
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.set_trace_callback(None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+_pool_lock = threading.Lock()
+
+def get_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    # Gunicorn forks workers after create_app(); never share connections across processes
+    with _pool_lock:
+        pool = app.extensions.get('db_pool')
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+        config = app.config
+        # Statement timing is opt-in; otherwise connections are plain sqlite3
+        metrics = get_metrics(app)
+        pool = ConnectionPool(
+            config['DATABASE_URI'].replace('sqlite:///', ''),
+            size=config.get('DB_POOL_SIZE', 5),
+            timeout=config.get('DB_POOL_TIMEOUT', 5.0),
+            busy_timeout_ms=config.get('DB_BUSY_TIMEOUT_MS', 5000),
+            cache_size_kb=config.get('DB_CACHE_SIZE_KB', 8000),
+            mmap_size=config.get('DB_MMAP_SIZE', 134217728),
+            statement_cache_size=config.get('DB_STATEMENT_CACHE_SIZE', 256),
+            factory=timed_connection_class(metrics) if metrics else sqlite3.Connection
+        )
+        app.extensions['db_pool'] = pool
+    return pool
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE_URI'].replace('sqlite:///', ''),
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().acquire()
+        if 'query_plan_auditor' in current_app.extensions:
+            trace_connection(g.db)
 
     return g.db
 
@@ -19,126 +143,13 @@ def close_db(e=None):
     db = g.pop('db', None)
 
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
 def init_db():
     db = get_db()
     
-    # Enable foreign keys
-    db.execute("PRAGMA foreign_keys = ON")
-    
-    # Create Tables
-    db.executescript('''
-        -- Users Table
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            name TEXT NOT NULL,
-            phone TEXT,
-            address TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        -- Employees Table (Merged from existing schema)
-        CREATE TABLE IF NOT EXISTS employees (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT UNIQUE NOT NULL,
-            first_name TEXT NOT NULL,
-            last_name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            gender TEXT,
-            dob TEXT,
-            mobile TEXT,
-            address TEXT,
-            job_title TEXT,
-            notes TEXT,
-            status TEXT DEFAULT 'active',
-            schedule TEXT, -- JSON string
-            hours_this_period REAL DEFAULT 0,
-            last_paid_date TEXT,
-            profile_picture TEXT,
-            hourly_rate REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        -- Menu Items Table
-        CREATE TABLE IF NOT EXISTS menu_items (
-            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            category TEXT NOT NULL,
-            image TEXT,
-            is_active BOOLEAN DEFAULT 1
-        );
-
-        -- Orders Table
-        CREATE TABLE IF NOT EXISTS orders (
-            order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            subtotal REAL NOT NULL,
-            tax REAL NOT NULL,
-            delivery_fee REAL NOT NULL,
-            tip REAL DEFAULT 0,
-            total REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            coupon_code TEXT,
-            discount REAL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        );
-
-        -- Order Items Table (New for normalization)
-        CREATE TABLE IF NOT EXISTS order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            item_id INTEGER,
-            name TEXT NOT NULL, -- Snapshot of name at time of order
-            price REAL NOT NULL, -- Snapshot of price
-            quantity INTEGER NOT NULL,
-            allergies TEXT,
-            FOREIGN KEY (order_id) REFERENCES orders (order_id),
-            FOREIGN KEY (item_id) REFERENCES menu_items (item_id)
-        );
-
-        -- Coupons Table
-        CREATE TABLE IF NOT EXISTS coupons (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT UNIQUE NOT NULL,
-            discount_type TEXT NOT NULL, -- 'percentage' or 'fixed'
-            discount_value REAL NOT NULL,
-            min_order REAL DEFAULT 0,
-            max_discount REAL,
-            usage_limit INTEGER,
-            used_count INTEGER DEFAULT 0,
-            expiry_date TEXT,
-            is_active BOOLEAN DEFAULT 1
-        );
-        
-        -- Attendance Table
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT NOT NULL,
-            date TEXT NOT NULL,
-            check_in_time TEXT,
-            check_out_time TEXT,
-            hours_worked REAL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (employee_id) REFERENCES employees (employee_id),
-            UNIQUE(employee_id, date)
-        );
-        
-        -- Wishlist (New Table)
-        CREATE TABLE IF NOT EXISTS wishlist (
-            user_id INTEGER NOT NULL,
-            item_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (user_id, item_id),
-            FOREIGN KEY (user_id) REFERENCES users (user_id),
-            FOREIGN KEY (item_id) REFERENCES menu_items (item_id)
-        );
-    ''')
+    # Create tables and indexes by applying every pending migration
+    migrations.upgrade(db)
 
 @click.command('init-db')
 @with_appcontext
@@ -147,6 +158,25 @@ def init_db_command():
     init_db()
     click.echo('Initialized the database.')
 
+@click.command('db-upgrade')
+@click.option('--target', type=int, default=None, help='Stop at this schema version.')
+@with_appcontext
+def db_upgrade_command(target):
+    """Apply pending schema migrations."""
+    db = get_db()
+    before = migrations.current_version(db)
+    applied = migrations.upgrade(db, target=target, log=click.echo)
+    if applied:
+        click.echo(f'Upgraded schema from version {before} to {applied[-1]}.')
+    else:
+        click.echo(f'Schema is up to date (version {before}).')
+
 def init_app_db(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(db_upgrade_command)
+
+    # Startup only reads PRAGMA user_version when the schema is current
+    if app.config.get('DB_AUTO_MIGRATE', True):
+        with app.app_context():
+            migrations.upgrade(get_db())
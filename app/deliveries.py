@@ -0,0 +1,152 @@
+"""Driver delivery feed.
+
+``delivery_changes`` (maintained by triggers) is an append-only log of
+orders whose delivery state changed; its ``seq`` is a monotonically
+increasing cursor. Clients hold the last ``seq`` they saw and either:
+
+* send it back as an ``If-None-Match`` ETag to the pending endpoint (304
+  when nothing changed, without running the orders/users join),
+* poll ``changes_since`` through the long-poll endpoint, or
+* keep the SSE stream open and receive only added/removed stops.
+
+Waiting streams share one ``DeliveryFeed`` per worker, which reads the
+latest ``seq`` at most once per ``DELIVERY_POLL_INTERVAL`` and wakes every
+waiter when it moves (``notify()`` wakes them at once for writes made in
+this worker).
+"""
+import threading
+import time
+from flask import current_app
+from app.db import get_pool
+
+MAX_CHANGES_PER_BATCH = 500
+
+STOP_QUERY = """
+    SELECT o.order_id, u.name, u.address, u.phone, o.total, g.lat, g.lng
+    FROM orders o
+    JOIN users u ON o.user_id = u.user_id
+    LEFT JOIN geocode_cache g ON g.address_key = u.address_key
+    WHERE o.status = 'out_for_delivery'
+"""
+
+def _stop(row):
+    return {
+        'id': row['order_id'],
+        'name': row['name'],
+        'address': row['address'],
+        'phone': row['phone'],
+        'total': row['total'],
+        # Null until the address is geocoded (see app.geocoding)
+        'lat': row['lat'],
+        'lng': row['lng']
+    }
+
+def pending_stops(db, order_ids=None):
+    query, params = STOP_QUERY, []
+    if order_ids is not None:
+        if not order_ids:
+            return []
+        query += f" AND o.order_id IN ({','.join(['?'] * len(order_ids))})"
+        params = list(order_ids)
+    return [_stop(row) for row in db.execute(query, params).fetchall()]
+
+def current_seq(db):
+    return db.execute("SELECT coalesce(max(seq), 0) FROM delivery_changes").fetchone()[0]
+
+def etag_for(seq):
+    return f'deliveries-{seq}'
+
+def changes_since(db, seq, limit=MAX_CHANGES_PER_BATCH):
+    """Collapse the log after ``seq`` into ``{'seq', 'added', 'removed'}``.
+
+    ``added`` holds the current stop payload for every changed order that is
+    (still) out for delivery, which also covers contact-detail updates;
+    ``removed`` lists the ids of the ones that no longer are.
+    """
+    rows = db.execute(
+        "SELECT seq, order_id FROM delivery_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+        (seq, limit)
+    ).fetchall()
+    if not rows:
+        return {'seq': seq, 'added': [], 'removed': []}
+
+    order_ids = list(dict.fromkeys(row['order_id'] for row in rows))
+    added = pending_stops(db, order_ids)
+    still_pending = {stop['id'] for stop in added}
+    return {
+        'seq': rows[-1]['seq'],
+        'added': added,
+        'removed': [order_id for order_id in order_ids if order_id not in still_pending]
+    }
+
+class DeliveryFeed:
+    def __init__(self, pool, poll_interval=2.0):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self._seq = None
+        self._checked_at = 0.0
+        self._condition = threading.Condition()
+        self._refresh_lock = threading.Lock()
+
+    def _refresh(self):
+        conn = self.pool.acquire()
+        try:
+            seq = current_seq(conn)
+        finally:
+            self.pool.release(conn)
+        with self._condition:
+            self._checked_at = time.monotonic()
+            if seq != self._seq:
+                self._seq = seq
+                self._condition.notify_all()
+        return seq
+
+    def latest(self):
+        if self._seq is None or time.monotonic() - self._checked_at >= self.poll_interval:
+            # One waiter reads the log for everybody; the rest keep the cached seq
+            if self._refresh_lock.acquire(blocking=self._seq is None):
+                try:
+                    return self._refresh()
+                finally:
+                    self._refresh_lock.release()
+        return self._seq
+
+    def notify(self):
+        """Wake waiters after this worker committed a delivery change."""
+        self._refresh()
+
+    def wait_for_change(self, seq, timeout):
+        """Block until the latest seq passes ``seq`` or ``timeout`` elapses; returns the latest seq."""
+        deadline = time.monotonic() + timeout
+        while True:
+            latest = self.latest()
+            remaining = deadline - time.monotonic()
+            if latest > seq or remaining <= 0:
+                return latest
+            with self._condition:
+                self._condition.wait(min(self.poll_interval, remaining))
+
+    # Reads borrow a pooled connection only for the query so long-lived
+    # streams never pin one
+    def read_changes(self, seq):
+        conn = self.pool.acquire()
+        try:
+            return changes_since(conn, seq)
+        finally:
+            self.pool.release(conn)
+
+    def read_snapshot(self):
+        conn = self.pool.acquire()
+        try:
+            return {'seq': current_seq(conn), 'stops': pending_stops(conn)}
+        finally:
+            self.pool.release(conn)
+
+def get_feed(app=None):
+    app = app or current_app
+    pool = get_pool(app)
+    feed = app.extensions.get('delivery_feed')
+    if feed is None or feed.pool is not pool:
+        feed = DeliveryFeed(pool, app.config.get('DELIVERY_POLL_INTERVAL', 2.0))
+        app.extensions['delivery_feed'] = feed
+    return feed
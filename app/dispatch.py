@@ -0,0 +1,275 @@
+"""Multi-driver dispatch.
+
+Out-for-delivery orders are split between the drivers on shift (employees
+whose job title contains "driver" with an open check-in from today or, for
+overnight shifts, yesterday). ``order_assignments`` records which driver has each order and its
+position in that driver's route.
+
+* ``rebalance`` re-plans every open order from scratch (sweep clustering,
+  then one route per driver) - for the start of a shift or when the admin
+  asks for it.
+* ``assign_pending`` only places orders nobody has yet (new orders, or ones
+  whose driver went off shift) by cheapest insertion into the existing
+  routes, leaving stops already promised to a driver where they are.
+
+Orders whose address has no coordinates (no geocoder configured, or not
+geocoded yet) cannot be routed; both hand them to the least-loaded driver,
+at the end of the route, rather than leaving them with nobody.
+
+Both run inside ``BEGIN IMMEDIATE`` so concurrent callers cannot assign
+the same order twice. ``assign_pending`` runs when something changes: an
+order goes out for delivery, or a driver checks in or out. Page views never
+trigger it. Orders it could not place (no coordinates yet, every driver at
+capacity) wait for the next of those events; the driver dashboard lists them
+meanwhile. Running ``flask dispatch`` every
+minute or so from cron also picks up addresses geocoded in the meantime.
+"""
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.db import get_db
+from app.deliveries import pending_stops
+from app.routing import plan_routes, insertion_cost
+
+def active_drivers(db, today=None):
+    """Employee ids of drivers on shift, in check-in order.
+
+    Same rule as worker checkout: an open check-in dated today or yesterday,
+    so drivers on an overnight shift stay on shift past midnight.
+    """
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    rows = db.execute(
+        """
+        SELECT e.employee_id
+        FROM employees e
+        JOIN attendance a ON a.employee_id = e.employee_id AND a.date >= date(?, '-1 day')
+        WHERE lower(e.job_title) LIKE '%driver%'
+          AND coalesce(e.status, 'active') = 'active'
+          AND a.check_in_time IS NOT NULL AND a.check_out_time IS NULL
+        GROUP BY e.employee_id
+        ORDER BY min(a.check_in_time), e.employee_id
+        """,
+        (today,)
+    ).fetchall()
+    return [row['employee_id'] for row in rows]
+
+def current_routes(db):
+    """``{employee_id: [order_id, ...]}`` for assigned orders still out for delivery."""
+    rows = db.execute(
+        """
+        SELECT a.employee_id, a.order_id
+        FROM order_assignments a
+        JOIN orders o ON o.order_id = a.order_id
+        WHERE o.status = 'out_for_delivery'
+        ORDER BY a.employee_id, a.sequence
+        """
+    ).fetchall()
+    routes = {}
+    for row in rows:
+        routes.setdefault(row['employee_id'], []).append(row['order_id'])
+    return routes
+
+def driver_order_ids(db, employee_id):
+    rows = db.execute(
+        """
+        SELECT a.order_id
+        FROM order_assignments a
+        JOIN orders o ON o.order_id = a.order_id
+        WHERE a.employee_id = ? AND o.status = 'out_for_delivery'
+        ORDER BY a.sequence
+        """,
+        (employee_id,)
+    ).fetchall()
+    return [row['order_id'] for row in rows]
+
+def depot_location(config, stops=()):
+    """Restaurant coordinates, falling back to the centroid of ``stops``."""
+    if config.get('RESTAURANT_LAT') is not None and config.get('RESTAURANT_LNG') is not None:
+        return config['RESTAURANT_LAT'], config['RESTAURANT_LNG']
+    located = [stop for stop in stops if stop['lat'] is not None]
+    if not located:
+        return None
+    return (sum(stop['lat'] for stop in located) / len(located),
+            sum(stop['lng'] for stop in located) / len(located))
+
+def _least_loaded(routes, drivers, capacity):
+    """The driver with the shortest route still under ``capacity`` (earliest check-in on ties), or None."""
+    open_drivers = [driver for driver in drivers if len(routes[driver]) < capacity]
+    return min(open_drivers, key=lambda driver: len(routes[driver])) if open_drivers else None
+
+def _save_routes(db, routes):
+    db.executemany(
+        """
+        INSERT INTO order_assignments (order_id, employee_id, sequence) VALUES (?, ?, ?)
+        ON CONFLICT(order_id) DO UPDATE SET
+            employee_id = excluded.employee_id, sequence = excluded.sequence,
+            assigned_at = CASE WHEN employee_id = excluded.employee_id THEN assigned_at ELSE CURRENT_TIMESTAMP END
+        """,
+        [(order_id, employee_id, sequence)
+         for employee_id, order_ids in routes.items()
+         for sequence, order_id in enumerate(order_ids, start=1)]
+    )
+
+def _begin(db):
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+
+def rebalance(db, capacity=None, time_budget=None, today=None):
+    """Re-plan every out-for-delivery order across the active drivers.
+
+    Returns ``{'routes': {employee_id: [order_id, ...]}, 'unassigned': [order_id, ...]}``.
+    """
+    config = current_app.config
+    capacity = capacity or config.get('DISPATCH_DRIVER_CAPACITY', 8)
+    time_budget = time_budget or config.get('DISPATCH_TIME_BUDGET_MS', 2000) / 1000
+
+    _begin(db)
+    try:
+        drivers = active_drivers(db, today)
+        stops = pending_stops(db)
+        located = [stop for stop in stops if stop['lat'] is not None]
+        depot = depot_location(config, located)
+
+        routes, unassigned = {driver: [] for driver in drivers}, []
+        if drivers and located:
+            coords = [(stop['lat'], stop['lng']) for stop in located]
+            planned, dropped = plan_routes(depot, coords, len(drivers), capacity, time_budget)
+            routes.update({driver: [located[i]['id'] for i in route] for driver, route in zip(drivers, planned)})
+            unassigned += [located[i]['id'] for i in dropped]
+        else:
+            unassigned += [stop['id'] for stop in located]
+        # Unlocated stops cannot be routed; they go last on the lightest route
+        for stop in stops:
+            if stop['lat'] is not None:
+                continue
+            driver = _least_loaded(routes, drivers, capacity)
+            if driver is None:
+                unassigned.append(stop['id'])
+            else:
+                routes[driver].append(stop['id'])
+
+        # Orders left over lose any stale assignment so assign_pending can place them later
+        db.execute(
+            """
+            DELETE FROM order_assignments
+            WHERE order_id IN (SELECT order_id FROM orders WHERE status = 'out_for_delivery')
+            """
+        )
+        _save_routes(db, routes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {'routes': routes, 'unassigned': unassigned}
+
+def assign_pending(db, capacity=None, today=None):
+    """Insert unassigned out-for-delivery orders into the active drivers' routes.
+
+    Returns ``{'assigned': {order_id: employee_id}, 'unassigned': [order_id, ...]}``.
+    """
+    config = current_app.config
+    capacity = capacity or config.get('DISPATCH_DRIVER_CAPACITY', 8)
+
+    # Cheap check first: most calls find nothing to do and take no write lock
+    drivers = active_drivers(db, today)
+    if not drivers or not _has_unassigned(db, drivers):
+        return {'assigned': {}, 'unassigned': []}
+
+    _begin(db)
+    try:
+        drivers = active_drivers(db, today)
+        stops = {stop['id']: stop for stop in pending_stops(db)}
+        depot = depot_location(config, stops.values())
+        existing = current_routes(db)
+        routes = {driver: [order_id for order_id in existing.get(driver, []) if order_id in stops]
+                  for driver in drivers}
+        routed = {order_id for route in routes.values() for order_id in route}
+
+        assigned, unassigned, changed = {}, [], set()
+        for order_id in sorted(set(stops) - routed):
+            stop = stops[order_id]
+            open_drivers = [driver for driver in drivers if len(routes[driver]) < capacity]
+            if not open_drivers:
+                unassigned.append(order_id)
+                continue
+            if stop['lat'] is None:
+                driver = _least_loaded(routes, drivers, capacity)
+                routes[driver].append(order_id)
+                assigned[order_id] = driver
+                changed.add(driver)
+                continue
+            best = None
+            for driver in open_drivers:
+                # Unlocated stops sit at the end of a route, so positions among the located ones carry over
+                position, cost = insertion_cost(
+                    depot, [(stops[o]['lat'], stops[o]['lng']) for o in routes[driver] if stops[o]['lat'] is not None],
+                    (stop['lat'], stop['lng'])
+                )
+                if best is None or cost < best[2]:
+                    best = (driver, position, cost)
+            driver, position, _ = best
+            routes[driver].insert(position, order_id)
+            assigned[order_id] = driver
+            changed.add(driver)
+
+        _save_routes(db, {driver: routes[driver] for driver in changed})
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {'assigned': assigned, 'unassigned': unassigned}
+
+def is_driver(db, employee_id):
+    row = db.execute("SELECT job_title FROM employees WHERE employee_id = ?", (employee_id,)).fetchone()
+    return row is not None and 'driver' in (row['job_title'] or '').lower()
+
+def waiting_orders(db, drivers):
+    """Out-for-delivery orders not on any on-shift driver's route, oldest first, with customer details."""
+    placeholders = ','.join(['?'] * len(drivers)) or 'NULL'
+    return db.execute(
+        f"""
+        SELECT o.*, u.name as customer_name, u.address as delivery_address, u.phone as customer_phone
+        FROM orders o
+        JOIN users u ON o.user_id = u.user_id
+        LEFT JOIN order_assignments a ON a.order_id = o.order_id
+        WHERE o.status = 'out_for_delivery'
+          AND (a.order_id IS NULL OR a.employee_id NOT IN ({placeholders}))
+        ORDER BY o.created_at, o.order_id
+        """,
+        drivers
+    ).fetchall()
+
+def _has_unassigned(db, drivers):
+    placeholders = ','.join(['?'] * len(drivers))
+    return db.execute(
+        f"""
+        SELECT 1 FROM orders o
+        LEFT JOIN order_assignments a ON a.order_id = o.order_id
+        WHERE o.status = 'out_for_delivery'
+          AND (a.order_id IS NULL OR a.employee_id NOT IN ({placeholders}))
+        LIMIT 1
+        """,
+        drivers
+    ).fetchone() is not None
+
+@click.command('dispatch')
+@click.option('--rebalance', 'full', is_flag=True, help='Re-plan every open order instead of only new ones.')
+@with_appcontext
+def dispatch_command(full):
+    """Assign out-for-delivery orders to the drivers on shift."""
+    db = get_db()
+    if full:
+        result = rebalance(db)
+        for driver, order_ids in result['routes'].items():
+            click.echo(f"{driver}: {', '.join(map(str, order_ids)) or '-'}")
+    else:
+        result = assign_pending(db)
+        for order_id, driver in result['assigned'].items():
+            click.echo(f"Order {order_id} -> {driver}")
+    if result['unassigned']:
+        click.echo(f"Unassigned: {', '.join(map(str, result['unassigned']))}")
+
+def init_app_dispatch(app):
+    app.cli.add_command(dispatch_command)
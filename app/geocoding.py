@@ -0,0 +1,285 @@
+"""Persistent geocode cache for customer addresses.
+
+``users.address`` is free text, so each address is normalized (case,
+punctuation, whitespace, common street suffixes) and hashed into
+``users.address_key``; ``geocode_cache`` holds one row per key. The pending
+deliveries payload LEFT JOINs the cache, so drivers get coordinates without
+geocoding on every optimization run.
+
+Lookups go through a pluggable geocoder selected by ``GEOCODER``:
+
+* ``none`` (the default) - no lookups; addresses stay without coordinates,
+* ``google`` - the Google Geocoding API (``GOOGLE_MAPS_API_KEY``),
+* ``offline`` - invented but deterministic coordinates scattered around the
+  restaurant; only for development and tests, never a real deployment.
+
+Each cache row records the provider that produced it. A row from a provider
+other than the configured one counts as a miss, and ``geocode-backfill``
+re-geocodes it, so switching from ``offline`` to ``google`` replaces the
+invented points.
+
+Signup and address changes enqueue a lookup on a small per-worker thread
+pool; ``flask geocode-backfill`` fills in every missing address with bounded
+concurrency.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.db import get_db, get_pool
+
+# Fallback centre for the offline geocoder when RESTAURANT_LAT/LNG are unset
+DEFAULT_CENTER = (30.4515, -91.1871)
+OFFLINE_SPREAD_DEG = 0.15
+
+SUFFIXES = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr',
+    'lane': 'ln', 'court': 'ct', 'place': 'pl', 'parkway': 'pkwy', 'highway': 'hwy',
+    'apartment': 'apt', 'suite': 'ste', 'north': 'n', 'south': 's', 'east': 'e', 'west': 'w'
+}
+
+class GeocodeError(Exception):
+    pass
+
+def normalize_address(address):
+    text = unicodedata.normalize('NFKC', address or '').lower()
+    text = re.sub(r"[^\w\s#]", ' ', text)
+    return ' '.join(SUFFIXES.get(word, word) for word in text.split())
+
+def address_key(address):
+    """Cache key for ``address``, or None for a blank address."""
+    normalized = normalize_address(address)
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+class OfflineGeocoder:
+    """Deterministic stand-in: the same address always maps to the same point."""
+    name = 'offline'
+
+    def __init__(self, config):
+        lat, lng = config.get('RESTAURANT_LAT'), config.get('RESTAURANT_LNG')
+        self.center = (lat, lng) if lat is not None and lng is not None else DEFAULT_CENTER
+
+    def geocode(self, address):
+        digest = hashlib.sha1(normalize_address(address).encode('utf-8')).digest()
+        # Two 32-bit fractions in [0, 1) from the digest
+        x = int.from_bytes(digest[:4], 'big') / 2 ** 32
+        y = int.from_bytes(digest[4:8], 'big') / 2 ** 32
+        return (self.center[0] + (x * 2 - 1) * OFFLINE_SPREAD_DEG,
+                self.center[1] + (y * 2 - 1) * OFFLINE_SPREAD_DEG)
+
+class GoogleGeocoder:
+    name = 'google'
+    URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+
+    def __init__(self, config):
+        self.api_key = config.get('GOOGLE_MAPS_API_KEY')
+        self.timeout = config.get('GEOCODE_TIMEOUT', 10)
+        if not self.api_key:
+            raise GeocodeError('GOOGLE_MAPS_API_KEY is not set')
+
+    def geocode(self, address):
+        query = urllib.parse.urlencode({'address': address, 'key': self.api_key})
+        try:
+            with urllib.request.urlopen(f'{self.URL}?{query}', timeout=self.timeout) as response:
+                data = json.load(response)
+        except (OSError, ValueError) as e:
+            raise GeocodeError(str(e)) from e
+        if data.get('status') == 'ZERO_RESULTS':
+            return None
+        if data.get('status') != 'OK':
+            raise GeocodeError(data.get('status', 'unknown error'))
+        location = data['results'][0]['geometry']['location']
+        return location['lat'], location['lng']
+
+GEOCODERS = {
+    'offline': OfflineGeocoder,
+    'google': GoogleGeocoder
+}
+
+DISABLED = ('', 'none')
+
+def make_geocoder(config):
+    """The configured geocoder, or None when ``GEOCODER`` is ``none``."""
+    name = (config.get('GEOCODER') or 'none').lower()
+    if name in DISABLED:
+        return None
+    if name not in GEOCODERS:
+        raise GeocodeError(f'Unknown geocoder {name!r}')
+    return GEOCODERS[name](config)
+
+def lookup(geocoder, address):
+    """``(lat, lng, status)`` for one address, status being ok/not_found/error; never raises."""
+    try:
+        coords = geocoder.geocode(address)
+    except GeocodeError:
+        return None, None, 'error'
+    if coords is None:
+        return None, None, 'not_found'
+    return coords[0], coords[1], 'ok'
+
+def store(db, key, address, lat, lng, status, provider):
+    db.execute(
+        """
+        INSERT INTO geocode_cache (address_key, address, lat, lng, status, provider)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(address_key) DO UPDATE SET
+            lat = excluded.lat, lng = excluded.lng, status = excluded.status,
+            provider = excluded.provider, updated_at = CURRENT_TIMESTAMP
+        """,
+        (key, normalize_address(address), lat, lng, status, provider)
+    )
+
+def cached(db, key, provider=None):
+    """The cache row for ``key``; with ``provider``, None unless that provider wrote it."""
+    row = db.execute("SELECT * FROM geocode_cache WHERE address_key = ?", (key,)).fetchone()
+    if row is not None and provider is not None and row['provider'] != provider:
+        return None
+    return row
+
+def geocode_address(db, address, geocoder=None, refresh=False):
+    """Resolve ``address`` through the cache, geocoding and storing on a miss.
+
+    Returns ``(lat, lng)`` or None when the address could not be located.
+    Rows written by another provider are looked up again.
+    """
+    key = address_key(address)
+    if key is None:
+        return None
+    geocoder = geocoder or make_geocoder(current_app.config)
+    if geocoder is None:
+        return None
+    row = None if refresh else cached(db, key, geocoder.name)
+    if row is None:
+        lat, lng, status = lookup(geocoder, address)
+        # Provider errors are transient; only cache definite answers
+        if status != 'error':
+            store(db, key, address, lat, lng, status, geocoder.name)
+            db.commit()
+        return (lat, lng) if status == 'ok' else None
+    return (row['lat'], row['lng']) if row['status'] == 'ok' else None
+
+# Background lookups for signup / address changes
+
+_executor_lock = threading.Lock()
+
+def _executor(app):
+    executor = app.extensions.get('geocode_executor')
+    if executor is not None and executor[0] == os.getpid():
+        return executor[1]
+    # Like the connection pool, threads do not survive a gunicorn fork
+    with _executor_lock:
+        executor = app.extensions.get('geocode_executor')
+        if executor is None or executor[0] != os.getpid():
+            executor = (os.getpid(), ThreadPoolExecutor(
+                max_workers=app.config.get('GEOCODE_WORKERS', 2), thread_name_prefix='geocode'))
+            app.extensions['geocode_executor'] = executor
+    return executor[1]
+
+def _geocode_job(app, address):
+    # The connection is borrowed only around the cache read and write, never
+    # across the provider call, so slow lookups cannot starve request threads
+    try:
+        geocoder = make_geocoder(app.config)
+        key = address_key(address)
+        if geocoder is None or key is None:
+            return
+        pool = get_pool(app)
+        conn = pool.acquire()
+        try:
+            row = cached(conn, key, geocoder.name)
+        finally:
+            pool.release(conn)
+        if row is not None:
+            return
+        lat, lng, status = lookup(geocoder, address)
+        # Provider errors are transient; only cache definite answers
+        if status == 'error':
+            return
+        conn = pool.acquire()
+        try:
+            store(conn, key, address, lat, lng, status, geocoder.name)
+            conn.commit()
+        finally:
+            pool.release(conn)
+    except Exception:
+        app.logger.exception('Geocoding %r failed', address)
+
+def geocode_later(address):
+    """Queue a cache fill for ``address`` unless it is already cached by the configured provider."""
+    app = current_app._get_current_object()
+    geocoder_name = (app.config.get('GEOCODER') or 'none').lower()
+    key = address_key(address)
+    if key is None or geocoder_name in DISABLED or cached(get_db(), key, geocoder_name) is not None:
+        return None
+    if app.config.get('GEOCODE_SYNC'):
+        _geocode_job(app, address)
+        return None
+    return _executor(app).submit(_geocode_job, app, address)
+
+def set_user_address(db, user_id, address):
+    """Update a user's address and key; the caller commits, then calls ``geocode_later``."""
+    db.execute(
+        "UPDATE users SET address = ?, address_key = ? WHERE user_id = ?",
+        (address, address_key(address), user_id)
+    )
+
+@click.command('geocode-backfill')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Parallel geocoder requests.')
+@click.option('--retry-failed', is_flag=True, help='Also retry addresses that previously failed.')
+@click.option('--limit', type=int, default=None, help='Geocode at most this many addresses.')
+@with_appcontext
+def geocode_backfill_command(concurrency, retry_failed, limit):
+    """Geocode every customer address missing from the cache or cached by another provider."""
+    db = get_db()
+    geocoder = make_geocoder(current_app.config)
+    if geocoder is None:
+        raise click.ClickException("GEOCODER is 'none'; set it to 'google' (or 'offline' for development).")
+
+    # Keys for users written before address_key existed or by other tools
+    missing_keys = db.execute("SELECT user_id, address FROM users WHERE address_key IS NULL AND address IS NOT NULL").fetchall()
+    db.executemany("UPDATE users SET address_key = ? WHERE user_id = ?",
+                   [(address_key(row['address']), row['user_id']) for row in missing_keys])
+    db.commit()
+
+    query = """
+        SELECT u.address_key, min(u.address) AS address
+        FROM users u
+        LEFT JOIN geocode_cache g ON g.address_key = u.address_key
+        WHERE u.address_key IS NOT NULL
+          AND (g.address_key IS NULL OR g.provider IS NOT ? {retry})
+        GROUP BY u.address_key
+    """.format(retry="OR g.status != 'ok'" if retry_failed else '')
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    todo = db.execute(query, (geocoder.name,)).fetchall()
+    if not todo:
+        click.echo('Geocode cache is complete.')
+        return
+
+    # Only the geocoder calls run in parallel; writes stay on this connection
+    counts = {'ok': 0, 'not_found': 0, 'error': 0}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = executor.map(lambda row: (row, lookup(geocoder, row['address'])), todo)
+        for n, (row, (lat, lng, status)) in enumerate(results, start=1):
+            if status != 'error':
+                store(db, row['address_key'], row['address'], lat, lng, status, geocoder.name)
+            counts[status] += 1
+            if n % 100 == 0:
+                db.commit()
+                click.echo(f'  {n}/{len(todo)}')
+    db.commit()
+    click.echo(f"Geocoded {len(todo)} addresses: {counts['ok']} ok, "
+               f"{counts['not_found']} not found, {counts['error']} errors.")
+
+def init_app_geocoding(app):
+    app.cli.add_command(geocode_backfill_command)
@@ -0,0 +1,179 @@
+"""Kitchen display feed.
+
+Each worker runs one ``KitchenBroker``: a background thread reads new
+``order_events`` rows (the cross-worker bridge, once per
+``KITCHEN_POLL_INTERVAL``), loads the affected orders with their items in two
+queries and fans the result out to every connected display through per-client
+queues. Writes made in this worker call ``notify_kitchen()`` so the thread
+wakes at once instead of waiting for the next poll; displays attached to
+other workers see them within one interval.
+
+However many tablets are open, each worker runs at most one small query per
+interval, and only while someone is listening. The database side of the fan-out
+is shared, but the HTTP side is not: every display holds its own connection for
+up to ``KITCHEN_STREAM_MAX_AGE``. That needs threaded gunicorn workers
+(``gunicorn.conf.py``, one thread per display). Under sync workers each
+display would occupy a whole worker.
+"""
+import os
+import queue
+import threading
+from flask import current_app
+from app.db import get_pool
+from app.orders import load_order_items
+
+# Orders the kitchen display shows
+KITCHEN_STATUSES = ('pending', 'preparing')
+MAX_OPEN_ORDERS = 200
+SUBSCRIBER_QUEUE_SIZE = 100
+
+OPEN_ORDERS_QUERY = f"""
+    SELECT o.order_id, o.status, o.created_at, u.name AS customer
+    FROM orders o
+    JOIN users u ON u.user_id = o.user_id
+    WHERE o.status IN ({','.join(repr(status) for status in KITCHEN_STATUSES)})
+"""
+
+def _cards(db, rows):
+    items = load_order_items(db, [row['order_id'] for row in rows])
+    return [{
+        'order_id': row['order_id'],
+        'status': row['status'],
+        'created_at': str(row['created_at']),
+        'customer': row['customer'],
+        'items': [{'name': item['name'], 'quantity': item['quantity'], 'allergies': item['allergies']}
+                  for item in items[row['order_id']]]
+    } for row in rows]
+
+def open_orders(db, order_ids=None):
+    """Kitchen cards (oldest first) for open orders, optionally only ``order_ids``."""
+    query, params = OPEN_ORDERS_QUERY, []
+    if order_ids is not None:
+        if not order_ids:
+            return []
+        query += f" AND o.order_id IN ({','.join(['?'] * len(order_ids))})"
+        params = list(order_ids)
+    query += " ORDER BY o.created_at, o.order_id LIMIT ?"
+    params.append(MAX_OPEN_ORDERS)
+    return _cards(db, db.execute(query, params).fetchall())
+
+def latest_event_id(db):
+    return db.execute("SELECT coalesce(max(event_id), 0) FROM order_events").fetchone()[0]
+
+def changes_since(db, event_id, limit=500):
+    """``{'seq', 'orders', 'removed'}`` for orders with events after ``event_id``."""
+    rows = db.execute(
+        "SELECT event_id, order_id FROM order_events WHERE event_id > ? ORDER BY event_id LIMIT ?",
+        (event_id, limit)
+    ).fetchall()
+    if not rows:
+        return {'seq': event_id, 'orders': [], 'removed': []}
+    order_ids = list(dict.fromkeys(row['order_id'] for row in rows))
+    cards = open_orders(db, order_ids)
+    still_open = {card['order_id'] for card in cards}
+    return {
+        'seq': rows[-1]['event_id'],
+        'orders': cards,
+        'removed': [order_id for order_id in order_ids if order_id not in still_open]
+    }
+
+def snapshot(db):
+    """Current open orders plus the seq to resume from."""
+    return {'seq': latest_event_id(db), 'orders': open_orders(db)}
+
+class KitchenBroker:
+    def __init__(self, pool, poll_interval=1.0, logger=None):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.pid = os.getpid()
+        self.seq = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _read(self, fn, *args):
+        conn = self.pool.acquire()
+        try:
+            return fn(conn, *args)
+        finally:
+            self.pool.release(conn)
+
+    def snapshot(self):
+        return self._read(snapshot)
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if not self._subscribers:
+                # Nothing was read while idle; new displays start from their snapshot
+                self.seq = self._read(latest_event_id)
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='kitchen-broker', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        self._wake.set()
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A display that stopped reading is dropped: its backlog is
+                # replaced by None, which ends the stream, and EventSource
+                # reconnects with a fresh snapshot
+                self.unsubscribe(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    continue
+                seq = self.seq
+            try:
+                changes = self._read(changes_since, seq)
+            except Exception:
+                if self.logger:
+                    self.logger.exception('Kitchen feed poll failed')
+                continue
+            if changes['seq'] != seq:
+                with self._lock:
+                    self.seq = changes['seq']
+                self.publish(changes)
+
+_broker_lock = threading.Lock()
+
+def get_broker(app=None):
+    app = app or current_app
+    broker = app.extensions.get('kitchen_broker')
+    if broker is not None and broker.pid == os.getpid():
+        return broker
+    # The poller thread does not survive a gunicorn fork
+    with _broker_lock:
+        broker = app.extensions.get('kitchen_broker')
+        if broker is None or broker.pid != os.getpid():
+            broker = KitchenBroker(get_pool(app), app.config.get('KITCHEN_POLL_INTERVAL', 1.0), app.logger)
+            app.extensions['kitchen_broker'] = broker
+    return broker
+
+def notify_kitchen(app=None):
+    """Wake this worker's broker after a kitchen-visible write (no-op if nobody subscribed)."""
+    app = app or current_app
+    broker = app.extensions.get('kitchen_broker')
+    if broker is not None and broker.pid == os.getpid():
+        broker.notify()
@@ -0,0 +1,221 @@
+"""Order lifecycle: legal status transitions and the ``order_events`` log.
+
+    pending -> preparing -> out_for_delivery -> completed
+    (any state before completed) -> cancelled
+
+``orders.status`` stays the current state; every change (and the initial
+``pending`` at checkout) appends a row to ``order_events``, which is never
+updated. ``transition`` moves an order with a conditional UPDATE inside
+``BEGIN IMMEDIATE``, so two people bumping the same order cannot both win,
+and keeps the status rollups, dispatch and the driver/kitchen feeds in step.
+``recall`` steps a bumped order back one state for the kitchen display.
+
+``order_events`` is indexed on ``(to_status, at)`` for "what entered this
+state recently", ``(order_id, to_status)`` for per-order latency lookups and
+``(order_id, event_id)`` for an order's history. Orders written in bulk
+(imports, data migrations) get one initial event in their current status
+from ``seed_initial_events``. The
+per-status queues themselves read ``orders`` through
+``idx_orders_status_created``.
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.db import get_db
+from app.rollups import record_status_change
+from app.deliveries import get_feed
+from app.dispatch import assign_pending
+from app.kitchen import KITCHEN_STATUSES, notify_kitchen
+
+STATUSES = ('pending', 'preparing', 'out_for_delivery', 'completed', 'cancelled')
+
+TRANSITIONS = {
+    'pending': ('preparing', 'cancelled'),
+    'preparing': ('out_for_delivery', 'cancelled'),
+    'out_for_delivery': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': ()
+}
+
+# Kitchen "recall": step a bumped order back one state, e.g. when the
+# expeditor sent it out too early. Logged like any other transition.
+RECALLS = {
+    'preparing': 'pending',
+    'out_for_delivery': 'preparing'
+}
+
+# (name, from event, to event) pairs for latency_percentiles
+LATENCIES = {
+    'queue': ('pending', 'preparing'),
+    'prep': ('preparing', 'out_for_delivery'),
+    'delivery': ('out_for_delivery', 'completed'),
+    'total': ('pending', 'completed')
+}
+
+class TransitionError(Exception):
+    pass
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+def record_event(db, order_id, from_status, to_status, actor=None):
+    """Append one event; runs inside the caller's transaction."""
+    db.execute(
+        "INSERT INTO order_events (order_id, from_status, to_status, actor) VALUES (?, ?, ?, ?)",
+        (order_id, from_status, to_status, actor)
+    )
+
+def seed_initial_events(db, order_ids=(), after_id=None, actor='import'):
+    """Give orders written outside ``transition`` an initial event; runs inside the caller's transaction.
+
+    Covers ``order_ids`` and every order above ``after_id`` (ids assigned by
+    the insert), skipping orders that already have events. The event records
+    the status the order arrived in, at its ``created_at``: the steps before
+    that are unknown, so no latency is invented for them.
+    """
+    conditions, params = [], [actor]
+    if order_ids:
+        conditions.append(f"o.order_id IN ({','.join(['?'] * len(order_ids))})")
+        params += list(order_ids)
+    if after_id is not None:
+        conditions.append("o.order_id > ?")
+        params.append(after_id)
+    if not conditions:
+        return
+    db.execute(
+        f"""
+        INSERT INTO order_events (order_id, from_status, to_status, at, actor)
+        SELECT o.order_id, NULL, o.status, coalesce(o.created_at, CURRENT_TIMESTAMP), ?
+        FROM orders o
+        WHERE ({' OR '.join(conditions)})
+          AND NOT EXISTS (SELECT 1 FROM order_events e WHERE e.order_id = o.order_id)
+        ORDER BY o.order_id
+        """,
+        params
+    )
+
+def transition(db, order_id, to_status, actor=None, expected=None):
+    """Move ``order_id`` to ``to_status``; returns the previous status.
+
+    ``expected`` guards against acting on a stale view (e.g. a kitchen screen
+    showing "preparing" after someone else already sent the order out).
+    Raises ``TransitionError`` for unknown orders and illegal moves.
+    """
+    if to_status not in STATUSES:
+        raise TransitionError(f'Unknown status {to_status!r}')
+    return _move(db, order_id, to_status, actor, expected)[0]
+
+def recall(db, order_id, actor=None, expected=None):
+    """Undo the last kitchen bump (see ``RECALLS``); returns the new status."""
+    return _move(db, order_id, None, actor, expected)[1]
+
+def _move(db, order_id, to_status, actor, expected):
+    """Apply a transition (or a recall when ``to_status`` is None); returns ``(from, to)``."""
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        if row is None:
+            raise TransitionError(f'Order #{order_id} not found')
+        from_status = row['status']
+        if expected is not None and from_status != expected:
+            raise TransitionError(f'Order #{order_id} is already {from_status.replace("_", " ")}')
+        if to_status is None:
+            to_status = RECALLS.get(from_status)
+            if to_status is None:
+                raise TransitionError(f'Order #{order_id} cannot be recalled from {from_status.replace("_", " ")}')
+        elif not can_transition(from_status, to_status):
+            raise TransitionError(
+                f'Order #{order_id} cannot go from {from_status.replace("_", " ")} to {to_status.replace("_", " ")}'
+            )
+
+        db.execute("UPDATE orders SET status = ? WHERE order_id = ? AND status = ?", (to_status, order_id, from_status))
+        record_event(db, order_id, from_status, to_status, actor)
+        record_status_change(db, from_status, to_status)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # The change is committed: a busy lock or pool timeout below must not turn
+    # it into an error. Dispatch is retried by ``flask dispatch``, and streams
+    # catch up at their next poll.
+    if to_status == 'out_for_delivery':
+        _after_commit(assign_pending, db)
+    if 'out_for_delivery' in (from_status, to_status):
+        # Wake this worker's driver streams now rather than at the next poll
+        _after_commit(_notify_drivers)
+    if from_status in KITCHEN_STATUSES or to_status in KITCHEN_STATUSES:
+        _after_commit(notify_kitchen)
+    return from_status, to_status
+
+def _notify_drivers():
+    get_feed().notify()
+
+def _after_commit(fn, *args):
+    try:
+        fn(*args)
+    except Exception:
+        current_app.logger.exception('%s failed after an order status change', fn.__name__)
+
+def queue(db, status, limit=50):
+    """Oldest-first orders currently in ``status`` (reads idx_orders_status_created)."""
+    return db.execute(
+        "SELECT * FROM orders WHERE status = ? ORDER BY created_at LIMIT ?",
+        (status, limit)
+    ).fetchall()
+
+def order_history(db, order_id):
+    return db.execute(
+        "SELECT * FROM order_events WHERE order_id = ? ORDER BY event_id", (order_id,)
+    ).fetchall()
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+def latency_percentiles(db, since=None, percentiles=(50, 90, 95, 99)):
+    """Seconds between lifecycle steps for orders that reached the later step after ``since``.
+
+    Returns ``{name: {'count': n, 'p50': s, ...}}`` for each entry of ``LATENCIES``.
+    """
+    since = since or '0000-01-01'
+    stats = {}
+    for name, (start, end) in LATENCIES.items():
+        rows = db.execute(
+            """
+            SELECT (julianday(e.at) - julianday(s.at)) * 86400 AS seconds
+            FROM order_events e
+            JOIN order_events s ON s.event_id = (
+                -- Latest start before this end, so recalled orders count once per attempt
+                SELECT max(event_id) FROM order_events
+                WHERE order_id = e.order_id AND to_status = ? AND event_id < e.event_id
+            )
+            WHERE e.to_status = ? AND e.at >= ?
+            ORDER BY seconds
+            """,
+            (start, end, since)
+        ).fetchall()
+        values = [row['seconds'] for row in rows]
+        stats[name] = {'count': len(values)}
+        for pct in percentiles:
+            value = _percentile(values, pct)
+            stats[name][f'p{pct}'] = round(value, 1) if value is not None else None
+    return stats
+
+@click.command('order-latency')
+@click.option('--since', default=None, help='Only orders that finished a step on/after this date (YYYY-MM-DD).')
+@with_appcontext
+def order_latency_command(since):
+    """Print queue/prep/delivery latency percentiles from order_events."""
+    stats = latency_percentiles(get_db(), since)
+    for name, values in stats.items():
+        parts = ', '.join(f'{key}={value}' for key, value in values.items())
+        click.echo(f'{name:>8}: {parts}')
+
+def init_app_lifecycle(app):
+    app.cli.add_command(order_latency_command)
@@ -0,0 +1,254 @@
+"""Menu item image uploads and their resized variants.
+
+An upload is validated (extension in ``ALLOWED_EXTENSIONS``, content that
+really is that kind of image, at most ``MENU_IMAGE_MAX_BYTES``) and stored
+under ``UPLOAD_FOLDER/menu/<sha256>/original.<ext>``. The directory is named
+by content hash, so uploading the same photo again, or for another item,
+reuses it. ``menu_items.image`` holds that path relative to
+``UPLOAD_FOLDER`` (``menu/3fa9.../original.jpg``), which templates that still
+use ``'images/' + item.image`` can keep showing.
+
+The ``MENU_IMAGE_SIZES`` variants (WebP plus JPEG, or PNG for transparent
+images) are made on a small per-worker thread pool after the request has
+committed, and ``variants.json`` is written into the directory last. Until
+it exists, ``menu_image_url`` serves the original, so a lost job (worker
+restart) only costs bandwidth; ``flask menu-images`` fills in anything
+missing. Resizing needs Pillow; without it uploads still work and pages use
+the original.
+"""
+import hashlib
+import json
+import os
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from app.assets import Image, ImageOps
+from app.db import get_db
+
+SET_PREFIX = 'menu'
+MANIFEST = 'variants.json'
+# Leading bytes of each allowed format; the browser-supplied content type is not trusted
+SIGNATURES = {
+    'jpg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'gif': (b'GIF87a', b'GIF89a'),
+}
+EXTENSION_ALIASES = {'jpeg': 'jpg'}
+PIL_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG', 'png': 'PNG'}
+
+class MenuImageError(Exception):
+    pass
+
+def upload_folder(app=None):
+    app = app or current_app
+    folder = app.config['UPLOAD_FOLDER']
+    # Config paths are relative to the project root, not the working directory
+    return folder if os.path.isabs(folder) else os.path.join(os.path.dirname(app.root_path), folder)
+
+def sniff(data):
+    """The image type ``data`` starts with (``'jpg'``, ``'png'``, ``'gif'``, ``'webp'``) or None."""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for kind, signatures in SIGNATURES.items():
+        if data.startswith(signatures):
+            return kind
+    return None
+
+def read_upload(file_storage, allowed_extensions, max_bytes):
+    """Validate an uploaded ``FileStorage``; returns ``(data, ext)``."""
+    filename = file_storage.filename or ''
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in allowed_extensions:
+        raise MenuImageError(f"Images must be one of: {', '.join(sorted(allowed_extensions))}")
+    # Read one byte past the limit rather than trusting Content-Length
+    data = file_storage.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise MenuImageError(f'Images must be at most {max_bytes // (1024 * 1024)} MB')
+    kind = sniff(data)
+    if kind is None or kind != EXTENSION_ALIASES.get(ext, ext):
+        raise MenuImageError(f'{filename} is not a valid {ext.upper()} image')
+    if Image is not None:
+        # Header only: catches truncated files and decompression bombs before a worker decodes them
+        try:
+            with Image.open(BytesIO(data)) as image:
+                image.verify()
+        except (OSError, Image.DecompressionBombError, SyntaxError) as e:
+            raise MenuImageError(f'{filename} could not be read as an image') from e
+    return data, kind
+
+def store_original(folder, data, ext):
+    """Write ``data`` under its hash unless already there; returns the ``menu_items.image`` value."""
+    digest = hashlib.sha256(data).hexdigest()
+    image = f'{SET_PREFIX}/{digest}/original.{ext}'
+    path = os.path.join(folder, *image.split('/'))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return image
+
+def save_upload(file_storage):
+    """Validate and store an upload from a request; returns the ``menu_items.image`` value."""
+    config = current_app.config
+    data, ext = read_upload(file_storage, config['ALLOWED_EXTENSIONS'], config.get('MENU_IMAGE_MAX_BYTES', 8 * 1024 * 1024))
+    return store_original(upload_folder(), data, ext)
+
+def is_variant_set(image):
+    return bool(image) and image.startswith(SET_PREFIX + '/') and image.count('/') == 2
+
+def generate_variants(folder, image, sizes, quality=82):
+    """Write the resized copies for ``image`` and then its ``variants.json``; returns the manifest."""
+    if Image is None:
+        raise MenuImageError('Pillow is required to resize menu images (pip install Pillow)')
+    set_dir = os.path.join(folder, *image.split('/')[:-1])
+    with Image.open(os.path.join(folder, *image.split('/'))) as original:
+        # Camera photos store rotation in EXIF, which is dropped on save
+        source = ImageOps.exif_transpose(original)
+        has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+    fallback_ext = 'png' if has_alpha else 'jpg'
+    variants = {}
+    for name, width in sorted(sizes.items(), key=lambda size: size[1]):
+        # Never upscale: small originals give every size the original width
+        width = min(width, source.width)
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS) if width != source.width else source
+        entry = {'width': width}
+        for key, ext, options in (
+            ('webp', 'webp', {'quality': quality, 'method': 4}),
+            ('fallback', fallback_ext, {'quality': quality, 'optimize': True, 'progressive': True}
+             if fallback_ext == 'jpg' else {'optimize': True}),
+        ):
+            filename = f'{name}.{ext}'
+            tmp = os.path.join(set_dir, f'{filename}.{os.getpid()}.{threading.get_ident()}.tmp')
+            resized.save(tmp, format=PIL_FORMATS[ext], **options)
+            os.replace(tmp, os.path.join(set_dir, filename))
+            entry[key] = filename
+        variants[name] = entry
+    manifest = {'original': image.rsplit('/', 1)[-1], 'variants': variants}
+    tmp = os.path.join(set_dir, f'{MANIFEST}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(set_dir, MANIFEST))
+    return manifest
+
+def load_variants(folder, image):
+    try:
+        with open(os.path.join(folder, *image.split('/')[:-1], MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# --- Background generation ---
+
+_executor_lock = threading.Lock()
+
+def _executor(app):
+    executor = app.extensions.get('menu_image_executor')
+    if executor is not None and executor[0] == os.getpid():
+        return executor[1]
+    # Like the connection pool, threads do not survive a gunicorn fork
+    with _executor_lock:
+        executor = app.extensions.get('menu_image_executor')
+        if executor is None or executor[0] != os.getpid():
+            executor = (os.getpid(), ThreadPoolExecutor(
+                max_workers=app.config.get('MENU_IMAGE_WORKERS', 2), thread_name_prefix='menu-image'))
+            app.extensions['menu_image_executor'] = executor
+    return executor[1]
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+def _variants_job(app, image):
+    try:
+        generate_variants(upload_folder(app), image, app.config.get('MENU_IMAGE_SIZES', {}),
+                          app.config.get('MENU_IMAGE_QUALITY', 82))
+    except Exception:
+        app.logger.exception('Resizing menu image %s failed', image)
+    finally:
+        with _pending_lock:
+            _pending.discard(image)
+
+def generate_later(image):
+    """Queue variants for a stored upload unless they exist or are already queued in this worker."""
+    if not is_variant_set(image) or Image is None:
+        return None
+    app = current_app._get_current_object()
+    if load_variants(upload_folder(app), image) is not None:
+        return None
+    with _pending_lock:
+        if image in _pending:
+            return None
+        _pending.add(image)
+    if app.config.get('MENU_IMAGE_SYNC'):
+        _variants_job(app, image)
+        return None
+    return _executor(app).submit(_variants_job, app, image)
+
+# --- Template helpers ---
+
+def _variant_cache(app):
+    # Sets never change once written, so a manifest found is kept for the worker's life
+    return app.extensions.setdefault('menu_image_variants', {})
+
+def _variants(image):
+    cache = _variant_cache(current_app)
+    manifest = cache.get(image)
+    if manifest is None:
+        manifest = load_variants(upload_folder(), image)
+        if manifest is not None:
+            cache[image] = manifest
+    return manifest
+
+def menu_image_url(image, size='card'):
+    """URL of ``size`` for a menu image, the original until variants exist, or a legacy filename as is."""
+    if not image:
+        return ''
+    manifest = _variants(image) if is_variant_set(image) else None
+    variant = manifest and manifest['variants'].get(size)
+    if variant:
+        return url_for('static', filename=f"images/{image.rsplit('/', 1)[0]}/{variant['fallback']}")
+    return url_for('static', filename='images/' + image)
+
+def menu_image_srcset(image, format='webp'):
+    """``srcset`` over every generated size, WebP or (any other ``format``) the JPEG/PNG fallback; '' when there are none."""
+    manifest = _variants(image) if is_variant_set(image) else None
+    if not manifest:
+        return ''
+    base = image.rsplit('/', 1)[0]
+    key = 'webp' if format == 'webp' else 'fallback'
+    widths = {}
+    for variant in manifest['variants'].values():
+        widths.setdefault(variant['width'], variant[key])
+    return ', '.join(f"{url_for('static', filename=f'images/{base}/{name}')} {width}w"
+                     for width, name in sorted(widths.items()))
+
+@click.command('menu-images')
+@click.option('--force', is_flag=True, help='Regenerate variants that already exist.')
+@with_appcontext
+def menu_images_command(force):
+    """Generate missing size variants for uploaded menu images."""
+    if Image is None:
+        raise click.ClickException('Pillow is required to resize menu images (pip install Pillow).')
+    folder = upload_folder()
+    images = [row[0] for row in get_db().execute(
+        "SELECT DISTINCT image FROM menu_items WHERE image LIKE ? ORDER BY image", (SET_PREFIX + '/%',))]
+    todo = [image for image in images
+            if is_variant_set(image) and (force or load_variants(folder, image) is None)]
+    for image in todo:
+        try:
+            generate_variants(folder, image, current_app.config.get('MENU_IMAGE_SIZES', {}),
+                              current_app.config.get('MENU_IMAGE_QUALITY', 82))
+            click.echo(f'  {image}')
+        except (OSError, MenuImageError) as e:
+            click.echo(f'  {image}: {e}', err=True)
+    click.echo(f'Resized {len(todo)} of {len(images)} menu images.')
+
+def init_app_menu_images(app):
+    app.cli.add_command(menu_images_command)
+    app.jinja_env.globals.update(menu_image_url=menu_image_url, menu_image_srcset=menu_image_srcset)
@@ -0,0 +1,226 @@
+"""Request and SQL timing, exposed in Prometheus text format.
+
+With ``METRICS_ENABLED`` set, ``init_app_metrics`` adds before/after request
+hooks that time every request per endpoint, and ``get_pool`` opens
+connections through ``timed_connection_class``, whose ``execute`` /
+``executemany`` time each statement under its normalized text (literals and
+``IN (...)`` lists folded to ``?``). Statements slower than
+``METRICS_SLOW_QUERY_MS`` are also logged to the ``tastycorner.slow_query``
+logger. With it unset nothing is hooked and connections are plain
+``sqlite3.Connection`` objects, so there is no per-request or per-query cost.
+
+Timings are kept per gunicorn worker (like the connection pool); each scrape
+of ``/admin/metrics`` reports the worker that served it, labelled with its
+pid. Query time is time to the first row: rows fetched later are not counted.
+"""
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from flask import current_app, g, has_request_context, request
+
+# Upper bounds in seconds, as in the Prometheus client defaults
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Generated SQL (e.g. IN lists) is normalized, but cap the label set anyway
+MAX_STATEMENTS = 500
+OTHER_STATEMENT = 'other'
+
+slow_query_log = logging.getLogger('tastycorner.slow_query')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\1)+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _SPACE.sub(' ', sql).strip()
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_LIST.sub(r'VALUES \1, ...', sql)
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+class Metrics:
+    def __init__(self, slow_query_seconds=0.1):
+        self.slow_query_seconds = slow_query_seconds
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.requests = {}   # (endpoint, method) -> Histogram
+        self.responses = {}  # (endpoint, method, status) -> count
+        self.queries = {}    # statement -> Histogram
+        self.slow_queries = {}  # statement -> count
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            histogram = self.requests.get((endpoint, method))
+            if histogram is None:
+                histogram = self.requests[(endpoint, method)] = Histogram()
+            histogram.observe(seconds)
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def observe_query(self, sql, seconds):
+        statement = normalize_sql(sql)
+        slow = seconds >= self.slow_query_seconds
+        with self._lock:
+            histogram = self.queries.get(statement)
+            if histogram is None:
+                if len(self.queries) >= MAX_STATEMENTS:
+                    statement = OTHER_STATEMENT
+                histogram = self.queries.setdefault(statement, Histogram())
+            histogram.observe(seconds)
+            if slow:
+                self.slow_queries[statement] = self.slow_queries.get(statement, 0) + 1
+        if slow:
+            endpoint = request.endpoint if has_request_context() else None
+            # Parameters are left out: they can hold customer details
+            slow_query_log.warning('Slow query (%.1f ms, %s): %s', seconds * 1000, endpoint or 'no request', statement)
+
+    def render(self):
+        """This worker's metrics in Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            requests = {key: _copy(histogram) for key, histogram in self.requests.items()}
+            responses = dict(self.responses)
+            queries = {key: _copy(histogram) for key, histogram in self.queries.items()}
+            slow_queries = dict(self.slow_queries)
+
+        worker = {'pid': str(self.pid)}
+        lines = [
+            '# HELP tastycorner_worker_start_time_seconds When this worker started collecting metrics.',
+            '# TYPE tastycorner_worker_start_time_seconds gauge',
+            f'tastycorner_worker_start_time_seconds{_labels(worker)} {self.started:.3f}',
+        ]
+        lines += _histogram_lines(
+            'tastycorner_request_duration_seconds', 'Request latency by endpoint.',
+            {_labels({**worker, 'endpoint': endpoint, 'method': method}): histogram
+             for (endpoint, method), histogram in sorted(requests.items())}
+        )
+        lines += [
+            '# HELP tastycorner_requests_total Responses by endpoint and status.',
+            '# TYPE tastycorner_requests_total counter',
+        ] + [
+            f'tastycorner_requests_total{_labels({**worker, "endpoint": endpoint, "method": method, "status": str(status)})} {count}'
+            for (endpoint, method, status), count in sorted(responses.items())
+        ]
+        lines += _histogram_lines(
+            'tastycorner_query_duration_seconds', 'SQL statement latency (to first row) by normalized statement.',
+            {_labels({**worker, 'statement': statement}): histogram for statement, histogram in sorted(queries.items())}
+        )
+        lines += [
+            '# HELP tastycorner_slow_queries_total Statements slower than METRICS_SLOW_QUERY_MS.',
+            '# TYPE tastycorner_slow_queries_total counter',
+        ] + [
+            f'tastycorner_slow_queries_total{_labels({**worker, "statement": statement})} {count}'
+            for statement, count in sorted(slow_queries.items())
+        ]
+        return '\n'.join(lines) + '\n'
+
+def _copy(histogram):
+    copy = Histogram()
+    copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+    return copy
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _histogram_lines(name, help_text, series):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, histogram in series.items():
+        prefix = labels[:-1] + ',' if labels != '{}' else '{'
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{prefix}le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{labels} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{labels} {histogram.count}')
+    return lines
+
+_metrics_lock = threading.Lock()
+
+def get_metrics(app=None):
+    """This worker's registry, or None when metrics are disabled."""
+    app = app or current_app
+    if not app.config.get('METRICS_ENABLED'):
+        return None
+    metrics = app.extensions.get('metrics')
+    if metrics is not None and metrics.pid == os.getpid():
+        return metrics
+    # Counts inherited across a gunicorn fork belong to the master, not this worker
+    with _metrics_lock:
+        metrics = app.extensions.get('metrics')
+        if metrics is None or metrics.pid != os.getpid():
+            metrics = Metrics(app.config.get('METRICS_SLOW_QUERY_MS', 100) / 1000)
+            app.extensions['metrics'] = metrics
+    return metrics
+
+def timed_connection_class(metrics):
+    """``sqlite3.connect`` factory whose ``execute``/``executemany`` report to ``metrics``."""
+    perf_counter = time.perf_counter
+    observe = metrics.observe_query
+
+    class TimedConnection(sqlite3.Connection):
+        def execute(self, sql, parameters=()):
+            started = perf_counter()
+            try:
+                return super().execute(sql, parameters)
+            finally:
+                observe(sql, perf_counter() - started)
+
+        def executemany(self, sql, seq_of_parameters):
+            started = perf_counter()
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            finally:
+                observe(sql, perf_counter() - started)
+
+    return TimedConnection
+
+def _start_timer():
+    g._request_started = time.perf_counter()
+
+def _record(status):
+    started = g.pop('_request_started', None)
+    if started is None:
+        return
+    metrics = get_metrics()
+    metrics.observe_request(request.endpoint or 'unmatched', request.method, status, time.perf_counter() - started)
+
+def _after_request(response):
+    # Streaming responses (SSE) are timed up to the first byte
+    _record(response.status_code)
+    return response
+
+def _teardown_request(exc=None):
+    # Only reached with the timer still set when the view raised
+    if exc is not None:
+        _record(500)
+
+def init_app_metrics(app):
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.before_request(_start_timer)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,539 @@
+"""Forward-only schema migrations keyed on ``PRAGMA user_version``.
+
+Each entry in ``MIGRATIONS`` is ``(version, description, step)`` where ``step``
+is either a SQL script or a callable taking the connection. Steps run in
+order inside their own ``BEGIN IMMEDIATE`` transaction together with the
+``user_version`` bump, so a failed step leaves the database at the previous
+version. Never edit a shipped migration; append a new one instead.
+"""
+import sqlite3
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(step):
+        MIGRATIONS.append((version, description, step))
+        return step
+    return register
+
+# 1. Initial schema. Databases created before versioning already have these
+# tables, hence IF NOT EXISTS.
+migration(1, 'initial schema')('''
+
+    -- Users Table
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        name TEXT NOT NULL,
+        phone TEXT,
+        address TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Employees Table (Merged from existing schema)
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT UNIQUE NOT NULL,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        gender TEXT,
+        dob TEXT,
+        mobile TEXT,
+        address TEXT,
+        job_title TEXT,
+        notes TEXT,
+        status TEXT DEFAULT 'active',
+        schedule TEXT, -- JSON string
+        hours_this_period REAL DEFAULT 0,
+        last_paid_date TEXT,
+        profile_picture TEXT,
+        hourly_rate REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Menu Items Table
+    CREATE TABLE IF NOT EXISTS menu_items (
+        item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        price REAL NOT NULL,
+        category TEXT NOT NULL,
+        image TEXT,
+        is_active BOOLEAN DEFAULT 1
+    );
+
+    -- Orders Table
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        subtotal REAL NOT NULL,
+        tax REAL NOT NULL,
+        delivery_fee REAL NOT NULL,
+        tip REAL DEFAULT 0,
+        total REAL NOT NULL,
+        status TEXT DEFAULT 'pending',
+        coupon_code TEXT,
+        discount REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+
+    -- Order Items Table (New for normalization)
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        item_id INTEGER,
+        name TEXT NOT NULL, -- Snapshot of name at time of order
+        price REAL NOT NULL, -- Snapshot of price
+        quantity INTEGER NOT NULL,
+        allergies TEXT,
+        FOREIGN KEY (order_id) REFERENCES orders (order_id),
+        FOREIGN KEY (item_id) REFERENCES menu_items (item_id)
+    );
+
+    -- Coupons Table
+    CREATE TABLE IF NOT EXISTS coupons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT UNIQUE NOT NULL,
+        discount_type TEXT NOT NULL, -- 'percentage' or 'fixed'
+        discount_value REAL NOT NULL,
+        min_order REAL DEFAULT 0,
+        max_discount REAL,
+        usage_limit INTEGER,
+        used_count INTEGER DEFAULT 0,
+        expiry_date TEXT,
+        is_active BOOLEAN DEFAULT 1
+    );
+    
+    -- Attendance Table
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        check_in_time TEXT,
+        check_out_time TEXT,
+        hours_worked REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (employee_id) REFERENCES employees (employee_id),
+        UNIQUE(employee_id, date)
+    );
+    
+    -- Wishlist (New Table)
+    CREATE TABLE IF NOT EXISTS wishlist (
+        user_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, item_id),
+        FOREIGN KEY (user_id) REFERENCES users (user_id),
+        FOREIGN KEY (item_id) REFERENCES menu_items (item_id)
+    );
+''')
+
+# 2. Indexes for the hot access paths (order history, delivery queue,
+# order lines, daily attendance, recent activity)
+migration(2, 'hot-path indexes')('''
+    CREATE INDEX IF NOT EXISTS idx_orders_user_created
+        ON orders (user_id, created_at DESC, order_id DESC);
+    CREATE INDEX IF NOT EXISTS idx_orders_status_created
+        ON orders (status, created_at, user_id);
+    CREATE INDEX IF NOT EXISTS idx_orders_created
+        ON orders (created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_order_items_order
+        ON order_items (order_id, item_id, quantity, price);
+    CREATE INDEX IF NOT EXISTS idx_attendance_date
+        ON attendance (date, employee_id);
+    CREATE INDEX IF NOT EXISTS idx_menu_items_active_category
+        ON menu_items (is_active, category);
+''')
+
+# 3. Refresh planner statistics so the new indexes get picked up
+migration(3, 'analyze')('''
+    ANALYZE;
+''')
+
+# 4. Generation counters used by in-process caches to detect writes made by
+# other workers or scripts. Triggers bump them on every menu change.
+migration(4, 'cache generations')('''
+    CREATE TABLE IF NOT EXISTS cache_generations (
+        name TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO cache_generations (name, generation) VALUES ('menu', 0);
+
+    CREATE TRIGGER IF NOT EXISTS menu_items_generation_insert AFTER INSERT ON menu_items
+    BEGIN
+        UPDATE cache_generations SET generation = generation + 1 WHERE name = 'menu';
+    END;
+    CREATE TRIGGER IF NOT EXISTS menu_items_generation_update AFTER UPDATE ON menu_items
+    BEGIN
+        UPDATE cache_generations SET generation = generation + 1 WHERE name = 'menu';
+    END;
+    CREATE TRIGGER IF NOT EXISTS menu_items_generation_delete AFTER DELETE ON menu_items
+    BEGIN
+        UPDATE cache_generations SET generation = generation + 1 WHERE name = 'menu';
+    END;
+''')
+
+# 5. Full-text index over the menu for /menu?search= (external content table
+# kept in sync by triggers; prefix indexes make search-as-you-type cheap)
+migration(5, 'menu full-text search')('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS menu_items_fts USING fts5(
+        name, description, category,
+        content='menu_items', content_rowid='item_id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS menu_items_fts_insert AFTER INSERT ON menu_items
+    BEGIN
+        INSERT INTO menu_items_fts (rowid, name, description, category)
+        VALUES (new.item_id, new.name, coalesce(new.description, ''), new.category);
+    END;
+    CREATE TRIGGER IF NOT EXISTS menu_items_fts_delete AFTER DELETE ON menu_items
+    BEGIN
+        INSERT INTO menu_items_fts (menu_items_fts, rowid, name, description, category)
+        VALUES ('delete', old.item_id, old.name, coalesce(old.description, ''), old.category);
+    END;
+    CREATE TRIGGER IF NOT EXISTS menu_items_fts_update AFTER UPDATE OF name, description, category ON menu_items
+    BEGIN
+        INSERT INTO menu_items_fts (menu_items_fts, rowid, name, description, category)
+        VALUES ('delete', old.item_id, old.name, coalesce(old.description, ''), old.category);
+        INSERT INTO menu_items_fts (rowid, name, description, category)
+        VALUES (new.item_id, new.name, coalesce(new.description, ''), new.category);
+    END;
+
+    INSERT INTO menu_items_fts (menu_items_fts) VALUES ('rebuild');
+''')
+
+# 6. Dashboard rollup tables, backfilled from the existing order history
+@migration(6, 'dashboard rollups')
+def _create_rollups(db):
+    from . import rollups
+    for statement in split_statements(rollups.SCHEMA):
+        db.execute(statement)
+    rollups.rebuild_tables(db)
+
+# 7. Server-side carts; identical lines merge on (item_id, allergies)
+migration(7, 'server-side carts')('''
+    CREATE TABLE IF NOT EXISTS carts (
+        cart_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS cart_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cart_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL CHECK (quantity > 0),
+        allergies TEXT NOT NULL DEFAULT '',
+        FOREIGN KEY (cart_id) REFERENCES carts (cart_id) ON DELETE CASCADE,
+        FOREIGN KEY (item_id) REFERENCES menu_items (item_id),
+        UNIQUE (cart_id, item_id, allergies)
+    );
+''')
+
+# 8. Idempotency keys so a re-submitted checkout form returns the order it
+# already created
+migration(8, 'order idempotency keys')('''
+    ALTER TABLE orders ADD COLUMN idempotency_key TEXT;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency
+        ON orders (idempotency_key) WHERE idempotency_key IS NOT NULL;
+''')
+
+# 9. Coupon definitions are cached in-process; bump a generation when one is
+# created or edited (redemptions only touch used_count and do not)
+migration(9, 'coupon cache generation')('''
+    INSERT OR IGNORE INTO cache_generations (name, generation) VALUES ('coupons', 0);
+
+    CREATE TRIGGER IF NOT EXISTS coupons_generation_insert AFTER INSERT ON coupons
+    BEGIN
+        UPDATE cache_generations SET generation = generation + 1 WHERE name = 'coupons';
+    END;
+    CREATE TRIGGER IF NOT EXISTS coupons_generation_update
+    AFTER UPDATE OF code, discount_type, discount_value, min_order, max_discount,
+                    usage_limit, expiry_date, is_active ON coupons
+    BEGIN
+        UPDATE cache_generations SET generation = generation + 1 WHERE name = 'coupons';
+    END;
+    CREATE TRIGGER IF NOT EXISTS coupons_generation_delete AFTER DELETE ON coupons
+    BEGIN
+        UPDATE cache_generations SET generation = generation + 1 WHERE name = 'coupons';
+    END;
+''')
+
+# 10. Change log for the driver delivery feed. Triggers append a row whenever
+# an order enters or leaves out_for_delivery, or a customer on an active
+# delivery changes their contact details; seq is the feed's ETag/cursor.
+migration(10, 'delivery change feed')('''
+    CREATE TABLE IF NOT EXISTS delivery_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TRIGGER IF NOT EXISTS orders_delivery_insert AFTER INSERT ON orders
+    WHEN new.status = 'out_for_delivery'
+    BEGIN
+        INSERT INTO delivery_changes (order_id) VALUES (new.order_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS orders_delivery_update AFTER UPDATE OF status ON orders
+    WHEN (old.status = 'out_for_delivery') != (new.status = 'out_for_delivery')
+    BEGIN
+        INSERT INTO delivery_changes (order_id) VALUES (new.order_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS orders_delivery_delete AFTER DELETE ON orders
+    WHEN old.status = 'out_for_delivery'
+    BEGIN
+        INSERT INTO delivery_changes (order_id) VALUES (old.order_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS users_delivery_update AFTER UPDATE OF name, address, phone ON users
+    BEGIN
+        INSERT INTO delivery_changes (order_id)
+        SELECT order_id FROM orders WHERE user_id = new.user_id AND status = 'out_for_delivery';
+    END;
+''')
+
+# 11. Geocode cache keyed on the normalized address hash stored on users.
+# Cache writes log a delivery change so drivers pick up new coordinates.
+@migration(11, 'geocode cache')
+def _create_geocode_cache(db):
+    from .geocoding import address_key
+    for statement in split_statements('''
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            address_key TEXT PRIMARY KEY,
+            address TEXT NOT NULL,
+            lat REAL,
+            lng REAL,
+            status TEXT NOT NULL,
+            provider TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ALTER TABLE users ADD COLUMN address_key TEXT;
+        CREATE INDEX IF NOT EXISTS idx_users_address_key ON users(address_key);
+        CREATE TRIGGER IF NOT EXISTS geocode_delivery_insert AFTER INSERT ON geocode_cache
+        BEGIN
+            INSERT INTO delivery_changes (order_id)
+            SELECT o.order_id FROM users u JOIN orders o ON o.user_id = u.user_id
+            WHERE u.address_key = new.address_key AND o.status = 'out_for_delivery';
+        END;
+        CREATE TRIGGER IF NOT EXISTS geocode_delivery_update AFTER UPDATE OF lat, lng ON geocode_cache
+        BEGIN
+            INSERT INTO delivery_changes (order_id)
+            SELECT o.order_id FROM users u JOIN orders o ON o.user_id = u.user_id
+            WHERE u.address_key = new.address_key AND o.status = 'out_for_delivery';
+        END;
+    '''):
+        db.execute(statement)
+    users = db.execute("SELECT user_id, address FROM users WHERE address IS NOT NULL").fetchall()
+    db.executemany("UPDATE users SET address_key = ? WHERE user_id = ?",
+                   [(address_key(row[1]), row[0]) for row in users])
+
+# 12. Driver assignments for multi-driver dispatch (see app.dispatch)
+migration(12, 'order assignments')('''
+    CREATE TABLE IF NOT EXISTS order_assignments (
+        order_id INTEGER PRIMARY KEY,
+        employee_id TEXT NOT NULL,
+        sequence INTEGER NOT NULL,
+        assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (order_id) REFERENCES orders (order_id),
+        FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_order_assignments_driver
+        ON order_assignments (employee_id, sequence);
+''')
+
+# 13. Append-only order status log; existing orders get their creation event
+migration(13, 'order events')('''
+    CREATE TABLE IF NOT EXISTS order_events (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        from_status TEXT,
+        to_status TEXT NOT NULL,
+        at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        actor TEXT,
+        FOREIGN KEY (order_id) REFERENCES orders (order_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_order_events_order
+        ON order_events (order_id, to_status, at);
+    CREATE INDEX IF NOT EXISTS idx_order_events_status_at
+        ON order_events (to_status, at, order_id);
+    INSERT INTO order_events (order_id, from_status, to_status, at, actor)
+    SELECT order_id, NULL, 'pending', created_at, 'migration' FROM orders;
+''')
+
+# 14. Closed pay periods; the covering attendance index serves the payroll
+# aggregate and supersedes idx_attendance_date
+migration(14, 'payroll periods')('''
+    CREATE TABLE IF NOT EXISTS payroll_periods (
+        period_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        closed_by TEXT,
+        UNIQUE (start_date, end_date)
+    );
+    CREATE TABLE IF NOT EXISTS payroll_entries (
+        period_id INTEGER NOT NULL,
+        employee_id TEXT NOT NULL,
+        shifts INTEGER NOT NULL,
+        open_shifts INTEGER NOT NULL DEFAULT 0,
+        hours REAL NOT NULL,
+        rate REAL NOT NULL,
+        gross_pay REAL NOT NULL,
+        PRIMARY KEY (period_id, employee_id),
+        FOREIGN KEY (period_id) REFERENCES payroll_periods (period_id),
+        FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_payroll_periods_end ON payroll_periods (end_date);
+    CREATE INDEX IF NOT EXISTS idx_attendance_payroll
+        ON attendance (date, employee_id, check_in_time, check_out_time);
+    DROP INDEX IF EXISTS idx_attendance_date;
+''')
+
+# 15. Schedules materialized from the employees.schedule JSON, one row per
+# weekday (overnight shifts split at midnight). Triggers keep it in sync with
+# every writer, including the scripts/ tools that update the JSON directly.
+SHIFTS_FROM_SCHEDULE = '''
+    INSERT INTO shifts (employee_id, weekday, start_minute, end_minute)
+    WITH days(key, weekday) AS (
+        VALUES ('monday', 0), ('tuesday', 1), ('wednesday', 2), ('thursday', 3),
+               ('friday', 4), ('saturday', 5), ('sunday', 6)
+    ),
+    enabled AS (
+        SELECT d.weekday,
+               CAST(substr(json_extract(j.value, '$.start'), 1, instr(json_extract(j.value, '$.start'), ':') - 1) AS INTEGER) * 60
+             + CAST(substr(json_extract(j.value, '$.start'), instr(json_extract(j.value, '$.start'), ':') + 1) AS INTEGER) AS start_minute,
+               CAST(substr(json_extract(j.value, '$.end'), 1, instr(json_extract(j.value, '$.end'), ':') - 1) AS INTEGER) * 60
+             + CAST(substr(json_extract(j.value, '$.end'), instr(json_extract(j.value, '$.end'), ':') + 1) AS INTEGER) AS end_minute
+        FROM json_each(CASE WHEN json_valid(new.schedule) THEN new.schedule ELSE '{}' END) j
+        JOIN days d ON d.key = j.key
+        WHERE json_extract(j.value, '$.enabled')
+          AND instr(json_extract(j.value, '$.start'), ':') AND instr(json_extract(j.value, '$.end'), ':')
+    )
+    SELECT new.employee_id, weekday, start_minute, CASE WHEN end_minute > start_minute THEN end_minute ELSE 1440 END
+    FROM enabled WHERE start_minute < 1440
+    UNION ALL
+    SELECT new.employee_id, (weekday + 1) % 7, 0, end_minute
+    FROM enabled WHERE end_minute <= start_minute AND end_minute > 0;
+'''
+
+migration(15, 'shifts')(f'''
+    CREATE TABLE IF NOT EXISTS shifts (
+        shift_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT NOT NULL,
+        weekday INTEGER NOT NULL, -- 0 = Monday
+        start_minute INTEGER NOT NULL, -- minutes after midnight, inclusive
+        end_minute INTEGER NOT NULL, -- exclusive, at most 1440
+        FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_shifts_interval
+        ON shifts (weekday, start_minute, end_minute, employee_id);
+    CREATE INDEX IF NOT EXISTS idx_shifts_employee ON shifts (employee_id);
+    CREATE TRIGGER IF NOT EXISTS employees_shifts_insert AFTER INSERT ON employees
+    BEGIN
+        {SHIFTS_FROM_SCHEDULE}
+    END;
+    CREATE TRIGGER IF NOT EXISTS employees_shifts_update AFTER UPDATE OF schedule, employee_id ON employees
+    BEGIN
+        DELETE FROM shifts WHERE employee_id = old.employee_id;
+        {SHIFTS_FROM_SCHEDULE}
+    END;
+    CREATE TRIGGER IF NOT EXISTS employees_shifts_delete AFTER DELETE ON employees
+    BEGIN
+        DELETE FROM shifts WHERE employee_id = old.employee_id;
+    END;
+    UPDATE employees SET schedule = schedule WHERE schedule IS NOT NULL;
+''')
+
+# 16. order_history reads one order's events in event_id order; the
+# (order_id, to_status, at) index left that to a temp B-tree. Orders loaded by
+# flask import / scripts/migrate_data.py before they seeded events get one now.
+migration(16, 'order events by order')('''
+    CREATE INDEX IF NOT EXISTS idx_order_events_order_event
+        ON order_events (order_id, event_id);
+    INSERT INTO order_events (order_id, from_status, to_status, at, actor)
+    SELECT o.order_id, NULL, o.status, coalesce(o.created_at, CURRENT_TIMESTAMP), 'import'
+    FROM orders o
+    WHERE NOT EXISTS (SELECT 1 FROM order_events e WHERE e.order_id = o.order_id)
+    ORDER BY o.order_id;
+''')
+
+# 17. Migration 13 seeded every existing order as 'pending' whatever its
+# status, so a legacy delivered order showed only "pending". Where that seed
+# is still the order's only event, it now records the status the order had,
+# as seed_initial_events and migration 16 do. Later events are left alone.
+migration(17, 'seed events use order status')('''
+    UPDATE order_events
+    SET to_status = (SELECT o.status FROM orders o WHERE o.order_id = order_events.order_id)
+    WHERE actor = 'migration' AND from_status IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM order_events later
+          WHERE later.order_id = order_events.order_id AND later.event_id > order_events.event_id
+      )
+      AND EXISTS (
+          SELECT 1 FROM orders o
+          WHERE o.order_id = order_events.order_id AND o.status IS NOT NULL AND o.status != order_events.to_status
+      );
+''')
+
+def latest_version():
+    return max(version for version, _, _ in MIGRATIONS)
+
+def current_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+def split_statements(script):
+    """Split a SQL script into complete statements (trigger bodies stay whole)."""
+    statements, buffer = [], ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip():
+                statements.append(buffer.strip())
+            buffer = ''
+    if buffer.strip() and not buffer.strip().startswith('--'):
+        statements.append(buffer.strip())
+    return statements
+
+def pending(db):
+    version = current_version(db)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m[0]) if m[0] > version]
+
+def upgrade(db, target=None, log=None):
+    """Apply every pending migration up to ``target``; returns versions applied."""
+    target = target or latest_version()
+    # Cheap fast path for startup: no DDL, no write lock when already current
+    if current_version(db) >= target:
+        return []
+
+    if db.in_transaction:
+        db.commit()
+
+    applied = []
+    for version, description, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version > target:
+            break
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have migrated while we waited for the lock
+            if current_version(db) >= version:
+                db.rollback()
+                continue
+            if callable(step):
+                step(db)
+            else:
+                for statement in split_statements(step):
+                    db.execute(statement)
+            db.execute(f"PRAGMA user_version = {int(version)}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(version)
+        if log:
+            log(f'Applied migration {version}: {description}')
+    return applied
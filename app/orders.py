@@ -0,0 +1,76 @@
+"""Order history loading shared by the order views.
+
+Orders are paged with a keyset on ``(created_at, order_id)`` (served by
+``idx_orders_user_created``) and their line items are fetched in one batched
+``IN (...)`` query instead of one query per order.
+"""
+import base64
+
+ORDER_PAGE_SIZE = 20
+MAX_ORDER_PAGE_SIZE = 100
+
+def encode_cursor(order):
+    raw = f"{order['created_at']}|{order['order_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return ``(created_at, order_id)`` or ``None`` for a missing/garbled cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, order_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return created_at, int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def load_order_items(db, order_ids):
+    """Map each order id to its list of line-item dicts using a single query."""
+    items_by_order = {order_id: [] for order_id in order_ids}
+    if not order_ids:
+        return items_by_order
+
+    placeholders = ','.join(['?'] * len(order_ids))
+    rows = db.execute(
+        f"SELECT * FROM order_items WHERE order_id IN ({placeholders}) ORDER BY order_id, id",
+        list(order_ids)
+    ).fetchall()
+    for row in rows:
+        items_by_order[row['order_id']].append(dict(row))
+    return items_by_order
+
+def attach_items(db, orders):
+    """Convert order rows to dicts with an ``items`` list attached."""
+    orders = [dict(o) for o in orders]
+    items_by_order = load_order_items(db, [o['order_id'] for o in orders])
+    for o in orders:
+        o['items'] = items_by_order[o['order_id']]
+    return orders
+
+def get_order(db, order_id, user_id):
+    """Load one of the user's orders with its items, or ``None``."""
+    order = db.execute(
+        "SELECT * FROM orders WHERE order_id = ? AND user_id = ?", (order_id, user_id)
+    ).fetchone()
+    if not order:
+        return None
+    return attach_items(db, [order])[0]
+
+def get_order_page(db, user_id, cursor=None, limit=ORDER_PAGE_SIZE):
+    """Return ``(orders, next_cursor)`` for the user's history, newest first."""
+    limit = max(1, min(int(limit), MAX_ORDER_PAGE_SIZE))
+    query = "SELECT * FROM orders WHERE user_id = ?"
+    params = [user_id]
+
+    position = decode_cursor(cursor)
+    if position:
+        query += " AND (created_at, order_id) < (?, ?)"
+        params.extend(position)
+
+    # Fetch one extra row to know whether an older page exists
+    query += " ORDER BY created_at DESC, order_id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = db.execute(query, params).fetchall()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return attach_items(db, rows[:limit]), next_cursor
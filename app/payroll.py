@@ -0,0 +1,225 @@
+"""Payroll: hours and gross pay per employee from ``attendance``.
+
+A pay period is a range of dates, both ends inclusive. ``period_hours`` gets
+every employee's total in one grouped query:
+
+* overnight shifts count toward the period they overlap, clipped to the
+  period bounds (a Friday-night shift split across a period boundary is
+  paid in both periods, each for its own part),
+* open check-ins run until now, capped at ``PAYROLL_MAX_OPEN_SHIFT_HOURS``
+  so a forgotten check-out does not bill for days; they are reported in
+  ``open_shifts``.
+
+The query only reads attendance rows whose ``date`` falls in the period
+(plus the day before, for overnight shifts). It is a range scan on
+``idx_attendance_payroll``, so it costs the same however many years of
+history the table holds.
+
+``close_period`` writes a ``payroll_periods`` row and its
+``payroll_entries`` in one ``BEGIN IMMEDIATE`` transaction. It also updates
+``employees.last_paid_date`` and recomputes ``hours_this_period`` (the
+unpaid hours since the close), which ``worker.checkout`` then increments.
+"""
+from datetime import date, datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.db import get_db
+
+class PayrollError(Exception):
+    pass
+
+HOURS_QUERY = """
+    WITH shifts AS (
+        SELECT a.employee_id,
+               max(a.check_in_time, :start_ts) AS starts,
+               min(coalesce(a.check_out_time, min(:now, datetime(a.check_in_time, :open_cap))), :end_ts) AS ends,
+               a.check_out_time IS NULL AS is_open
+        FROM attendance a
+        WHERE a.date BETWEEN date(:start, '-1 day') AND :end
+          AND a.check_in_time IS NOT NULL
+          AND (:include_open OR a.check_out_time IS NOT NULL)
+    )
+    SELECT e.employee_id, e.first_name, e.last_name, e.job_title,
+           coalesce(e.hourly_rate, :default_rate) AS rate,
+           count(*) AS shifts,
+           sum(is_open) AS open_shifts,
+           round(sum(max(0, julianday(ends) - julianday(starts))) * 24, 2) AS hours
+    FROM shifts s
+    JOIN employees e ON e.employee_id = s.employee_id
+    WHERE ends > starts
+    GROUP BY e.employee_id
+    ORDER BY e.last_name COLLATE NOCASE, e.first_name COLLATE NOCASE
+"""
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise PayrollError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+def _params(start, end, now=None, include_open=True):
+    config = current_app.config
+    return {
+        'include_open': int(include_open),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        # attendance times are local 'YYYY-MM-DD HH:MM:SS' strings (see worker.checkin)
+        'start_ts': f'{start.isoformat()} 00:00:00',
+        'end_ts': f'{(end + timedelta(days=1)).isoformat()} 00:00:00',
+        'now': (now or datetime.now()).strftime('%Y-%m-%d %H:%M:%S'),
+        'open_cap': f"+{int(config.get('PAYROLL_MAX_OPEN_SHIFT_HOURS', 16))} hours",
+        'default_rate': config.get('DEFAULT_HOURLY_RATE', 15.0)
+    }
+
+def period_hours(db, start, end, now=None, include_open=True):
+    """Per-employee hours, rate and gross pay for ``start``..``end`` (dates, inclusive)."""
+    if end < start:
+        raise PayrollError('Pay period ends before it starts')
+    rows = db.execute(HOURS_QUERY, _params(start, end, now, include_open)).fetchall()
+    return [dict(row, gross_pay=round(row['hours'] * row['rate'], 2)) for row in rows]
+
+def summarize(entries):
+    return {
+        'employees': len(entries),
+        'hours': round(sum(entry['hours'] for entry in entries), 2),
+        'gross_pay': round(sum(entry['gross_pay'] for entry in entries), 2),
+        'open_shifts': sum(entry['open_shifts'] for entry in entries)
+    }
+
+def last_closed_end(db):
+    row = db.execute("SELECT max(end_date) FROM payroll_periods").fetchone()
+    return parse_date(row[0]) if row[0] else None
+
+def default_period(db, today=None):
+    """From the day after the last closed period (or the first check-in) through yesterday."""
+    today = today or date.today()
+    last_end = last_closed_end(db)
+    if last_end:
+        start = last_end + timedelta(days=1)
+    else:
+        first = db.execute("SELECT min(date) FROM attendance").fetchone()[0]
+        start = parse_date(first) if first else today
+    return start, max(start, today - timedelta(days=1))
+
+def get_period(db, period_id):
+    period = db.execute("SELECT * FROM payroll_periods WHERE period_id = ?", (period_id,)).fetchone()
+    if period is None:
+        return None
+    entries = db.execute(
+        """
+        SELECT p.*, e.first_name, e.last_name, e.job_title
+        FROM payroll_entries p
+        JOIN employees e ON e.employee_id = p.employee_id
+        WHERE p.period_id = ?
+        ORDER BY e.last_name COLLATE NOCASE, e.first_name COLLATE NOCASE
+        """,
+        (period_id,)
+    ).fetchall()
+    return dict(period), [dict(entry) for entry in entries]
+
+def close_period(db, start, end, closed_by=None, allow_open=False, now=None):
+    """Freeze pay for ``start``..``end``; returns the new ``period_id``.
+
+    Refuses periods overlapping an already closed one, and periods with
+    open check-ins unless ``allow_open`` (they are then paid up to the cap).
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        overlap = db.execute(
+            "SELECT period_id FROM payroll_periods WHERE start_date <= ? AND end_date >= ?",
+            (end.isoformat(), start.isoformat())
+        ).fetchone()
+        if overlap:
+            raise PayrollError(f"Overlaps closed pay period #{overlap['period_id']}")
+
+        entries = period_hours(db, start, end, now)
+        still_open = [entry['employee_id'] for entry in entries if entry['open_shifts']]
+        if still_open and not allow_open:
+            raise PayrollError(f"Open check-ins for {', '.join(still_open)}; check them out or allow open shifts")
+
+        period_id = db.execute(
+            "INSERT INTO payroll_periods (start_date, end_date, closed_by) VALUES (?, ?, ?)",
+            (start.isoformat(), end.isoformat(), closed_by)
+        ).lastrowid
+        db.executemany(
+            """INSERT INTO payroll_entries (period_id, employee_id, shifts, open_shifts, hours, rate, gross_pay)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [(period_id, entry['employee_id'], entry['shifts'], entry['open_shifts'],
+              entry['hours'], entry['rate'], entry['gross_pay']) for entry in entries]
+        )
+        db.executemany(
+            "UPDATE employees SET last_paid_date = ? WHERE employee_id = ?",
+            [(end.isoformat(), entry['employee_id']) for entry in entries]
+        )
+        _reset_unpaid_hours(db, end + timedelta(days=1), now)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return period_id
+
+def _reset_unpaid_hours(db, since, now=None):
+    """Recompute ``hours_this_period`` from shifts checked out since ``since``.
+
+    Open shifts are left out: ``worker.checkout`` adds them when they end.
+    """
+    now = now or datetime.now()
+    entries = period_hours(db, since, max(since, now.date()), now, include_open=False)
+    unpaid = {entry['employee_id']: entry['hours'] for entry in entries}
+    db.execute("UPDATE employees SET hours_this_period = 0")
+    db.executemany("UPDATE employees SET hours_this_period = ? WHERE employee_id = ?",
+                   [(hours, employee_id) for employee_id, hours in unpaid.items()])
+
+def _dates(start, end):
+    db = get_db()
+    if start is None and end is None:
+        return default_period(db)
+    start = parse_date(start) if start else default_period(db)[0]
+    end = parse_date(end) if end else max(start, date.today() - timedelta(days=1))
+    return start, end
+
+@click.group('payroll')
+def payroll_cli():
+    """Pay period reports and closing."""
+
+@payroll_cli.command('report')
+@click.option('--start', help='First day of the period (YYYY-MM-DD).')
+@click.option('--end', help='Last day of the period (YYYY-MM-DD, inclusive).')
+@with_appcontext
+def payroll_report_command(start, end):
+    """Show hours and gross pay per employee without closing anything."""
+    try:
+        start, end = _dates(start, end)
+        entries = period_hours(get_db(), start, end)
+    except PayrollError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Pay period {start} to {end}')
+    for entry in entries:
+        flag = f"  ({entry['open_shifts']} open)" if entry['open_shifts'] else ''
+        click.echo(f"  {entry['employee_id']:<10} {entry['first_name']} {entry['last_name']:<20} "
+                   f"{entry['hours']:>7.2f}h x ${entry['rate']:.2f} = ${entry['gross_pay']:>9.2f}{flag}")
+    totals = summarize(entries)
+    click.echo(f"Total: {totals['employees']} employees, {totals['hours']:.2f}h, ${totals['gross_pay']:.2f}")
+
+@payroll_cli.command('close')
+@click.option('--start', help='First day of the period (YYYY-MM-DD).')
+@click.option('--end', help='Last day of the period (YYYY-MM-DD, inclusive).')
+@click.option('--allow-open', is_flag=True, help='Close even if some check-ins are still open.')
+@with_appcontext
+def payroll_close_command(start, end, allow_open):
+    """Close a pay period and record what each employee is owed."""
+    try:
+        start, end = _dates(start, end)
+        period_id = close_period(get_db(), start, end, closed_by='cli', allow_open=allow_open)
+    except PayrollError as e:
+        raise click.ClickException(str(e))
+    _, entries = get_period(get_db(), period_id)
+    totals = summarize(entries)
+    click.echo(f"Closed pay period #{period_id} ({start} to {end}): "
+               f"{totals['employees']} employees, ${totals['gross_pay']:.2f}")
+
+def init_app_payroll(app):
+    app.cli.add_command(payroll_cli)
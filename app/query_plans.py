@@ -0,0 +1,323 @@
+"""Query-plan auditing: catch statements that scan big tables or sort in temp B-trees.
+
+In debug mode (or with ``QUERY_PLAN_AUDIT=1``) ``get_db`` traces every
+statement a request runs; at teardown each statement not seen before
+(compared in ``metrics.normalize_sql`` form) gets an ``EXPLAIN QUERY PLAN``,
+and problems are logged once to ``tastycorner.query_plan``:
+
+* ``scan``: a full ``SCAN`` of a table in ``GROWING_TABLES`` or holding at
+  least ``QUERY_PLAN_MIN_ROWS`` rows (``SCAN ... USING INDEX`` walks, as used
+  for ``ORDER BY ... LIMIT``, are fine),
+* ``temp-btree``: ``USE TEMP B-TREE`` for ORDER BY / GROUP BY / DISTINCT,
+* ``automatic-index``: SQLite building a throwaway index, i.e. one is missing.
+
+``HOT_PATHS`` names the code paths that must stay indexed. ``flask
+query-plans`` runs them against the current database and prints each
+statement's plan, exiting non-zero on a finding; ``assert_indexed`` does the
+same for a single callable in a test, and ``assert_hot_paths_indexed`` for
+all of them; ``tests/test_query_plans.py`` runs it on a fresh database.
+"""
+import logging
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+import click
+from flask import current_app, g, has_request_context, request
+from flask.cli import with_appcontext
+from app.metrics import normalize_sql
+
+# Tables that grow with traffic; a scan of one is a finding even on a small dev database
+GROWING_TABLES = ('orders', 'order_items', 'order_events', 'users', 'attendance',
+                  'delivery_changes', 'cart_items', 'order_assignments', 'geocode_cache')
+TABLE_ROWS_TTL = 60  # seconds a table's row count is trusted
+
+AUDITED = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE|INSERT|REPLACE)\b', re.IGNORECASE)
+_SOURCE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_CTE = re.compile(r'(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s*(?:\([^()]*\))?\s+AS\s*(?:NOT\s+)?(?:MATERIALIZED\s*)?\(', re.IGNORECASE)
+_SCAN = re.compile(r'^SCAN (\w+)(.*)$')
+_KEYWORDS = {'where', 'on', 'using', 'join', 'left', 'right', 'inner', 'outer', 'cross', 'natural', 'group',
+             'order', 'limit', 'union', 'except', 'intersect', 'having', 'window', 'set', 'values', 'as'}
+
+query_plan_log = logging.getLogger('tastycorner.query_plan')
+
+def explain(db, sql, parameters=()):
+    """``EXPLAIN QUERY PLAN`` detail lines, indented by depth."""
+    rows = db.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        depth[row[0]] = depth.get(row[1], -1) + 1
+        lines.append('  ' * depth[row[0]] + row[3])
+    return lines
+
+def _sources(sql):
+    """``{name or alias: table}`` for the FROM/JOIN sources of ``sql``, minus CTEs."""
+    ctes = {name.lower() for name in _CTE.findall(sql)}
+    sources = {}
+    for table, alias in _SOURCE.findall(sql):
+        if table.lower() in ctes or table.lower() == 'select':
+            continue
+        sources[table.lower()] = table
+        if alias and alias.lower() not in _KEYWORDS:
+            sources[alias.lower()] = table
+    return sources
+
+class PlanAuditor:
+    def __init__(self, min_rows=1000, growing_tables=GROWING_TABLES):
+        self.min_rows = min_rows
+        self.growing_tables = set(growing_tables)
+        self.seen = {}  # normalized statement -> findings
+        self._rows = {}  # table -> (row count, checked at)
+
+    def table_rows(self, db, table):
+        cached = self._rows.get(table)
+        if cached and time.monotonic() - cached[1] < TABLE_ROWS_TTL:
+            return cached[0]
+        try:
+            count = db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        except sqlite3.Error:
+            count = 0
+        self._rows[table] = (count, time.monotonic())
+        return count
+
+    def check(self, db, sql, parameters=()):
+        """Findings for one statement: ``[{'kind', 'table', 'detail'}]`` (empty when fine)."""
+        if not AUDITED.match(sql):
+            return []
+        try:
+            plan = explain(db, sql, parameters)
+        except sqlite3.Error:
+            return []
+        sources = _sources(sql)
+        findings = []
+        for line in plan:
+            detail = line.strip()
+            scan = _SCAN.match(detail)
+            if scan and not scan.group(2).strip().startswith(('USING', 'VIRTUAL TABLE')):
+                table = sources.get(scan.group(1).lower())
+                if table and (table in self.growing_tables or self.table_rows(db, table) >= self.min_rows):
+                    findings.append({'kind': 'scan', 'table': table, 'detail': detail})
+            elif detail.startswith('USE TEMP B-TREE'):
+                findings.append({'kind': 'temp-btree', 'table': None, 'detail': detail})
+            elif 'AUTOMATIC' in detail and 'INDEX' in detail:
+                findings.append({'kind': 'automatic-index', 'table': None, 'detail': detail})
+        return findings
+
+    def audit(self, db, statements, where=None):
+        """Check statements not seen before and log the ones with findings."""
+        for sql in statements:
+            if sql.startswith('--'):
+                # Trigger bodies are reported by the trace as "-- TRIGGER name"
+                continue
+            statement = normalize_sql(sql)
+            if statement in self.seen:
+                continue
+            findings = self.seen[statement] = self.check(db, sql)
+            if findings:
+                query_plan_log.warning(
+                    'Unindexed query (%s) in %s: %s', '; '.join(finding['detail'] for finding in findings),
+                    where or 'no request', statement
+                )
+
+@contextmanager
+def traced(db):
+    """Collect the (parameter-expanded) SQL ``db`` runs inside the block."""
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        yield statements
+    finally:
+        db.set_trace_callback(None)
+
+def audit_call(db, fn, auditor=None):
+    """Run ``fn(db)`` and return ``[(statement, findings)]`` for every statement with findings."""
+    auditor = auditor or PlanAuditor()
+    with traced(db) as statements:
+        fn(db)
+    results = []
+    for sql in dict.fromkeys(statements):
+        if sql.startswith('--'):
+            continue
+        findings = auditor.check(db, sql)
+        if findings:
+            results.append((normalize_sql(sql), findings))
+    return results
+
+def assert_indexed(db, fn, allow=()):
+    """Test helper: fail if ``fn(db)`` runs a statement with a finding not in ``allow``.
+
+        assert_indexed(db, lambda db: lifecycle.queue(db, 'pending'))
+    """
+    problems = [(statement, [finding for finding in findings if finding['kind'] not in allow])
+                for statement, findings in audit_call(db, fn)]
+    problems = [(statement, findings) for statement, findings in problems if findings]
+    if problems:
+        raise AssertionError('Unindexed queries:\n' + '\n'.join(
+            f"  {statement}\n    " + '\n    '.join(finding['detail'] for finding in findings)
+            for statement, findings in problems
+        ))
+
+# --- Hot paths: request-path queries that must stay indexed ---
+
+HOT_PATHS = {}
+
+def hot_path(name, allow=()):
+    """Register ``fn(db)`` as a hot path; ``allow`` lists finding kinds it may have."""
+    def register(fn):
+        HOT_PATHS[name] = (fn, tuple(allow))
+        return fn
+    return register
+
+# bm25 rank is computed per match, so ranking always sorts (at most the matching items)
+@hot_path('menu.search', allow=('temp-btree',))
+def _menu_search(db):
+    from app.search import search_menu
+    search_menu(db, 'burger')
+
+@hot_path('orders.history')
+def _order_history(db):
+    from app.orders import get_order_page
+    get_order_page(db, 1)
+
+@hot_path('orders.status_queue')
+def _status_queue(db):
+    from app.lifecycle import queue
+    queue(db, 'pending')
+
+# One order's events: a handful of rows
+@hot_path('orders.events')
+def _order_events(db):
+    from app.lifecycle import order_history
+    order_history(db, 1)
+
+@hot_path('admin.recent_activity')
+def _recent_activity(db):
+    from app.routes.admin import _recent_activity
+    _recent_activity(db)
+    _recent_activity(db, status='pending')
+
+@hot_path('admin.dashboard_stats')
+def _dashboard_stats(db):
+    from app.rollups import dashboard_stats
+    dashboard_stats(db)
+
+@hot_path('driver.pending_stops')
+def _pending_stops(db):
+    from app.deliveries import pending_stops, current_seq
+    current_seq(db)
+    pending_stops(db)
+
+# Open orders are bounded (MAX_OPEN_ORDERS), so sorting the two status ranges is fine
+@hot_path('kitchen.open_orders', allow=('temp-btree',))
+def _kitchen_orders(db):
+    from app.kitchen import open_orders
+    open_orders(db)
+
+# Bounded by active drivers x DISPATCH_DRIVER_CAPACITY
+@hot_path('dispatch.current_routes', allow=('temp-btree',))
+def _current_routes(db):
+    from app.dispatch import current_routes
+    current_routes(db)
+
+# GROUP BY employee over one pay period's rows
+@hot_path('payroll.period_hours', allow=('temp-btree',))
+def _period_hours(db):
+    from datetime import date, timedelta
+    from app.payroll import period_hours
+    period_hours(db, date.today() - timedelta(days=14), date.today())
+
+# Sorts only the staff on shift at that minute
+@hot_path('shifts.on_shift', allow=('temp-btree',))
+def _on_shift(db):
+    from app.shifts import on_shift
+    on_shift(db, 0, 12 * 60)
+
+def audit_hot_paths(db, names=None, auditor=None):
+    """``{name: [(statement, plan, findings)]}`` for each hot path; findings exclude allowed kinds."""
+    auditor = auditor or PlanAuditor(current_app.config.get('QUERY_PLAN_MIN_ROWS', 1000))
+    report = {}
+    for name, (fn, allow) in HOT_PATHS.items():
+        if names and name not in names:
+            continue
+        if db.in_transaction:
+            db.commit()
+        # Hot paths should only read, but never let one leave changes behind
+        db.execute("BEGIN")
+        try:
+            with traced(db) as statements:
+                fn(db)
+        finally:
+            db.rollback()
+        entries = []
+        for sql in dict.fromkeys(statements):
+            if sql.startswith('--') or not AUDITED.match(sql):
+                continue
+            findings = [finding for finding in auditor.check(db, sql) if finding['kind'] not in allow]
+            entries.append((normalize_sql(sql), explain(db, sql), findings))
+        report[name] = entries
+    return report
+
+def assert_hot_paths_indexed(db, names=None):
+    """Test helper: fail listing every hot path whose plan regressed."""
+    report = audit_hot_paths(db, names)
+    problems = [f"  {name}: {statement}\n    " + '\n    '.join(finding['detail'] for finding in findings)
+                for name, entries in report.items() for statement, _, findings in entries if findings]
+    if problems:
+        raise AssertionError('Hot paths with unindexed queries:\n' + '\n'.join(problems))
+
+# --- Request hooks ---
+
+def get_auditor(app=None):
+    app = app or current_app
+    return app.extensions.get('query_plan_auditor')
+
+def trace_connection(db):
+    """Called by ``get_db`` for each new request connection while auditing is on."""
+    if has_request_context():
+        g._traced_sql = []
+        db.set_trace_callback(g._traced_sql.append)
+
+def _audit_request(exc=None):
+    statements = g.pop('_traced_sql', None)
+    db = g.get('db')
+    if statements is None or db is None:
+        return
+    db.set_trace_callback(None)
+    try:
+        get_auditor().audit(db, statements, request.endpoint)
+    except sqlite3.Error:
+        current_app.logger.exception('Query plan audit failed')
+
+@click.command('query-plans')
+@click.option('--path', 'names', multiple=True, help='Only these hot paths (repeatable).')
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not only the ones with findings.')
+@with_appcontext
+def query_plans_command(names, verbose):
+    """EXPLAIN the registered hot paths; exits 1 if any scans or sorts unindexed."""
+    from app.db import get_db
+    unknown = set(names) - set(HOT_PATHS)
+    if unknown:
+        raise click.BadParameter(f"unknown hot path(s) {', '.join(sorted(unknown))}; choose from {', '.join(HOT_PATHS)}")
+    report = audit_hot_paths(get_db(), names or None)
+    flagged = 0
+    for name, entries in report.items():
+        bad = [entry for entry in entries if entry[2]]
+        flagged += len(bad)
+        click.echo(f"{'FAIL' if bad else 'ok  '} {name} ({len(entries)} statements)")
+        for statement, plan, findings in entries:
+            if not findings and not verbose:
+                continue
+            click.echo(f"       {statement}")
+            for line in plan:
+                click.echo(f"         {line}")
+            for finding in findings:
+                click.echo(f"         ^ {finding['kind']}: {finding['detail']}")
+    if flagged:
+        raise click.ClickException(f'{flagged} statement(s) with unindexed plans')
+
+def init_app_query_plans(app):
+    app.cli.add_command(query_plans_command)
+    if app.debug or app.config.get('QUERY_PLAN_AUDIT'):
+        app.extensions['query_plan_auditor'] = PlanAuditor(app.config.get('QUERY_PLAN_MIN_ROWS', 1000))
+        app.teardown_request(_audit_request)
@@ -0,0 +1,249 @@
+"""Incrementally maintained sales rollups backing the admin dashboard.
+
+Every chart on the dashboard reads one of these small tables instead of
+aggregating over the full ``orders``/``order_items`` history:
+
+* ``sales_rollups``     orders/revenue/tips per day, ISO week and month
+* ``item_rollups``      quantity/revenue per item name
+* ``category_rollups``  quantity/revenue per menu category
+* ``status_rollups``    order count per status
+* ``customer_rollups``  orders/revenue per customer, plus ``customer_mix``
+                        (new vs returning customer counts)
+
+``record_order`` is called inside the checkout transaction and
+``record_status_change`` whenever an order changes status. ``rebuild``
+recomputes everything from scratch (``flask rollups-rebuild``).
+"""
+from datetime import date, datetime
+import click
+from flask.cli import with_appcontext
+from app.db import get_db
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sales_rollups (
+        period TEXT NOT NULL, -- 'day', 'week' or 'month'
+        bucket TEXT NOT NULL, -- 2024-05-01, 2024-W18, 2024-05
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        tips REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS item_rollups (
+        name TEXT PRIMARY KEY,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_item_rollups_quantity ON item_rollups (quantity DESC);
+
+    CREATE TABLE IF NOT EXISTS category_rollups (
+        category TEXT PRIMARY KEY,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS status_rollups (
+        status TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS customer_rollups (
+        user_id INTEGER PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS customer_mix (
+        segment TEXT PRIMARY KEY, -- 'new' (one order) or 'returning'
+        customers INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+'''
+
+ROLLUP_TABLES = ['sales_rollups', 'item_rollups', 'category_rollups',
+                 'status_rollups', 'customer_rollups', 'customer_mix']
+
+def _as_date(created_at):
+    if isinstance(created_at, datetime):
+        return created_at.date()
+    if isinstance(created_at, date):
+        return created_at
+    return datetime.strptime(str(created_at)[:10], '%Y-%m-%d').date()
+
+def sales_buckets(created_at):
+    """Return the ``(period, bucket)`` keys an order placed at ``created_at`` falls in."""
+    day = _as_date(created_at)
+    iso_year, iso_week, _ = day.isocalendar()
+    return [
+        ('day', day.isoformat()),
+        ('week', f'{iso_year}-W{iso_week:02d}'),
+        ('month', day.strftime('%Y-%m')),
+    ]
+
+def _add_sales(db, created_at, orders, revenue, tips):
+    db.executemany("""
+        INSERT INTO sales_rollups (period, bucket, orders, revenue, tips) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (period, bucket) DO UPDATE SET
+            orders = orders + excluded.orders,
+            revenue = revenue + excluded.revenue,
+            tips = tips + excluded.tips
+    """, [(period, bucket, orders, revenue, tips) for period, bucket in sales_buckets(created_at)])
+
+def _add_status(db, status, delta):
+    db.execute("""
+        INSERT INTO status_rollups (status, orders) VALUES (?, ?)
+        ON CONFLICT (status) DO UPDATE SET orders = orders + excluded.orders
+    """, (status or 'pending', delta))
+
+def record_order(db, order_id):
+    """Fold a freshly inserted order (and its lines) into every rollup.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    order = db.execute(
+        "SELECT user_id, total, tip, status, created_at FROM orders WHERE order_id = ?", (order_id,)
+    ).fetchone()
+    if order is None:
+        return
+
+    _add_sales(db, order['created_at'], 1, order['total'] or 0, order['tip'] or 0)
+    _add_status(db, order['status'], 1)
+
+    db.execute("""
+        INSERT INTO item_rollups (name, quantity, revenue)
+        SELECT name, SUM(quantity), SUM(price * quantity) FROM order_items WHERE order_id = ? GROUP BY name
+        ON CONFLICT (name) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue
+    """, (order_id,))
+    db.execute("""
+        INSERT INTO category_rollups (category, quantity, revenue)
+        SELECT coalesce(m.category, 'Other'), SUM(oi.quantity), SUM(oi.price * oi.quantity)
+        FROM order_items oi
+        LEFT JOIN menu_items m ON m.item_id = oi.item_id
+        WHERE oi.order_id = ?
+        GROUP BY 1
+        ON CONFLICT (category) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue
+    """, (order_id,))
+
+    if order['user_id'] is not None:
+        db.execute("""
+            INSERT INTO customer_rollups (user_id, orders, revenue) VALUES (?, 1, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                orders = orders + 1,
+                revenue = revenue + excluded.revenue
+        """, (order['user_id'], order['total'] or 0))
+        count = db.execute(
+            "SELECT orders FROM customer_rollups WHERE user_id = ?", (order['user_id'],)
+        ).fetchone()['orders']
+        # A first order adds a new customer; the second moves them to returning
+        if count == 1:
+            _add_mix(db, 'new', 1)
+        elif count == 2:
+            _add_mix(db, 'new', -1)
+            _add_mix(db, 'returning', 1)
+
+def _add_mix(db, segment, delta):
+    db.execute("""
+        INSERT INTO customer_mix (segment, customers) VALUES (?, ?)
+        ON CONFLICT (segment) DO UPDATE SET customers = customers + excluded.customers
+    """, (segment, delta))
+
+def record_status_change(db, old_status, new_status):
+    """Move one order between status buckets; runs inside the caller's transaction."""
+    if old_status == new_status:
+        return
+    _add_status(db, old_status, -1)
+    _add_status(db, new_status, 1)
+
+def rebuild(db):
+    """Recompute every rollup from the base tables in one transaction."""
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild_tables(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def rebuild_tables(db):
+    """Recompute every rollup inside the caller's transaction."""
+    for table in ROLLUP_TABLES:
+        db.execute(f"DELETE FROM {table}")
+
+    daily = db.execute("""
+        SELECT date(created_at) AS day, COUNT(*) AS orders,
+               coalesce(SUM(total), 0) AS revenue, coalesce(SUM(tip), 0) AS tips
+        FROM orders
+        WHERE created_at IS NOT NULL
+        GROUP BY day
+    """).fetchall()
+    for row in daily:
+        if row['day']:
+            _add_sales(db, row['day'], row['orders'], row['revenue'], row['tips'])
+
+    db.execute("""
+        INSERT INTO status_rollups (status, orders)
+        SELECT coalesce(status, 'pending'), COUNT(*) FROM orders GROUP BY 1
+    """)
+    db.execute("""
+        INSERT INTO item_rollups (name, quantity, revenue)
+        SELECT name, SUM(quantity), SUM(price * quantity) FROM order_items GROUP BY name
+    """)
+    db.execute("""
+        INSERT INTO category_rollups (category, quantity, revenue)
+        SELECT coalesce(m.category, 'Other'), SUM(oi.quantity), SUM(oi.price * oi.quantity)
+        FROM order_items oi
+        LEFT JOIN menu_items m ON m.item_id = oi.item_id
+        GROUP BY 1
+    """)
+    db.execute("""
+        INSERT INTO customer_rollups (user_id, orders, revenue)
+        SELECT user_id, COUNT(*), coalesce(SUM(total), 0) FROM orders WHERE user_id IS NOT NULL GROUP BY user_id
+    """)
+    db.execute("""
+        INSERT INTO customer_mix (segment, customers)
+        SELECT CASE WHEN orders = 1 THEN 'new' ELSE 'returning' END, COUNT(*)
+        FROM customer_rollups GROUP BY 1
+    """)
+
+def dashboard_stats(db):
+    """Overview numbers for the admin dashboard, read from the rollups."""
+    sales = db.execute("""
+        SELECT coalesce(SUM(orders), 0) AS orders, coalesce(SUM(revenue), 0) AS revenue,
+               coalesce(SUM(tips), 0) AS tips
+        FROM sales_rollups WHERE period = 'month'
+    """).fetchone()
+    statuses = {row['status']: row['orders'] for row in db.execute("SELECT status, orders FROM status_rollups")}
+    total_orders = sales['orders']
+    return {
+        'total_orders': total_orders,
+        'total_revenue': sales['revenue'],
+        'pending_orders': statuses.get('pending', 0),
+        'completed_orders': statuses.get('completed', 0),
+        'avg_order_value': sales['revenue'] / total_orders if total_orders else 0,
+        'avg_tip': sales['tips'] / total_orders if total_orders else 0,
+        'statuses': statuses,
+    }
+
+def sales_series(db, period, limit):
+    """Latest ``limit`` buckets for ``period`` as ``{'labels': [...], 'values': [...]}``, oldest first."""
+    rows = db.execute(
+        "SELECT bucket, revenue FROM sales_rollups WHERE period = ? ORDER BY bucket DESC LIMIT ?",
+        (period, limit)
+    ).fetchall()
+    rows.reverse()
+    return {'labels': [row['bucket'] for row in rows], 'values': [row['revenue'] for row in rows]}
+
+@click.command('rollups-rebuild')
+@with_appcontext
+def rollups_rebuild_command():
+    """Recompute the dashboard rollup tables from orders and order_items."""
+    rebuild(get_db())
+    click.echo('Rebuilt dashboard rollups.')
+
+def init_app_rollups(app):
+    app.cli.add_command(rollups_rebuild_command)
@@ -1,16 +1,51 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, Response
 from app.db import get_db
+from app.catalog import get_catalog, invalidate_catalog
+from app.rollups import dashboard_stats, sales_series
+from app.dispatch import rebalance, assign_pending, current_routes, active_drivers
+from app.lifecycle import STATUSES, TransitionError, transition, latency_percentiles
+from app import payroll
+from app import shifts
+from app.metrics import get_metrics
+from app import menu_images
+import hmac
 import json
 from datetime import datetime
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+SALES_CHART_DAYS = 90
+SALES_CHART_WEEKS = 26
+SALES_CHART_MONTHS = 12
+
+SECTION_PAGE_SIZE = 25
+MAX_SECTION_PAGE_SIZE = 100
+RECENT_ACTIVITY_LIMIT = 12
+
+EMPLOYEE_SORTS = {
+    'created_at': 'created_at',
+    'name': 'last_name COLLATE NOCASE, first_name COLLATE NOCASE',
+    'first_name': 'first_name COLLATE NOCASE',
+    'last_name': 'last_name COLLATE NOCASE',
+    'email': 'email',
+    'employee_id': 'employee_id',
+    'job_title': 'job_title COLLATE NOCASE',
+    'status': 'status',
+}
+MENU_SORTS = ('item_id', 'name', 'price', 'category')
+ACTIVITY_STATUSES = STATUSES
+
 def is_admin():
     return session.get('is_admin') is True
 
+def is_metrics_scraper():
+    token = current_app.config.get('METRICS_TOKEN')
+    return bool(token) and request.endpoint == 'admin.metrics' and \
+        hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
 @bp.before_request
 def restrict_access():
-    if request.endpoint != 'admin.login' and not is_admin():
+    if request.endpoint != 'admin.login' and not is_admin() and not is_metrics_scraper():
         return redirect(url_for('admin.login'))
 
 @bp.route('/', methods=['GET', 'POST'])
@@ -21,87 +56,189 @@ def index():
         
     db = get_db()
     
-    # --- Dashboard Stats (Optimized SQL) ---
+    initial_section = request.args.get('section', 'overview')
+    overview = _overview(db)
     
-    # 1. Overview Stats
-    stats = db.execute("""
-        SELECT 
-            COUNT(*) as total_orders,
-            SUM(total) as total_revenue,
-            SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending_orders,
-            SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_orders,
-            AVG(total) as avg_order_value,
-            AVG(tip) as avg_tip
-        FROM orders
-    """).fetchone()
+    # Sections other than the one being opened are fetched on demand from
+    # the /admin/api/* endpoints, so first paint does not grow with staff
+    # or menu size
+    recent_activity = _recent_activity(db, limit=RECENT_ACTIVITY_LIMIT)[:RECENT_ACTIVITY_LIMIT] if initial_section == 'activity' else []
+    employees = _employee_page(db, {}, SECTION_PAGE_SIZE)[:SECTION_PAGE_SIZE] if initial_section in ('employees', 'attendance') else []
     
-    total_orders = stats['total_orders'] or 0
-    total_revenue = stats['total_revenue'] or 0
-    pending_orders = stats['pending_orders'] or 0
-    completed_orders = stats['completed_orders'] or 0
-    avg_order_value = stats['avg_order_value'] or 0
-    avg_tip = stats['avg_tip'] or 0
-    
-    # 2. Sales Chart (Daily)
-    sales_data = db.execute("""
-        SELECT date(created_at) as day, SUM(total) as daily_total 
-        FROM orders 
-        GROUP BY day 
-        ORDER BY day ASC
-    """).fetchall()
-    sales_labels = [row['day'] for row in sales_data]
-    sales_values = [row['daily_total'] for row in sales_data]
+    # Menu Items
+    catalog = get_catalog(db)
+    menu_items = catalog.items if initial_section == 'menu' else []
+    all_categories = catalog.all_categories
+
+    return render_template('admin/dashboard.html',
+        total_orders=overview['total_orders'],
+        total_revenue=overview['total_revenue'],
+        pending_orders=overview['pending_orders'],
+        completed_orders=overview['completed_orders'],
+        average_order_value=overview['average_order_value'],
+        average_tip=overview['average_tip'],
+        sales_chart=json.dumps(overview['sales_chart']),
+        top_items_chart=json.dumps(overview['top_items_chart']),
+        recent_activity=recent_activity,
+        employees=employees,
+        menu_items=menu_items,
+        all_categories=all_categories,
+        admin_email=session.get('admin_email'),
+        weekly_chart=json.dumps(overview['weekly_chart']),
+        monthly_chart=json.dumps(overview['monthly_chart']),
+        customer_chart=json.dumps(overview['customer_chart']),
+        status_chart=json.dumps(overview['status_chart']),
+        category_chart=json.dumps(overview['category_chart']),
+        initial_section=initial_section
+    )
+
+def _overview(db):
+    # --- Dashboard Stats (served from the incrementally maintained rollups) ---
+    stats = dashboard_stats(db)
     
-    # 3. Top Items
     top_items = db.execute("""
-        SELECT name, SUM(quantity) as total_qty 
-        FROM order_items 
-        GROUP BY name 
-        ORDER BY total_qty DESC 
+        SELECT name, quantity AS total_qty
+        FROM item_rollups
+        ORDER BY quantity DESC
         LIMIT 7
     """).fetchall()
-    most_labels = [row['name'] for row in top_items]
-    most_values = [row['total_qty'] for row in top_items]
+    category_rows = db.execute("SELECT category, revenue FROM category_rollups ORDER BY revenue DESC").fetchall()
+    customer_rows = db.execute("SELECT segment, customers FROM customer_mix WHERE customers > 0 ORDER BY segment").fetchall()
+    status_counts = {status: count for status, count in stats['statuses'].items() if count}
+    
+    return {
+        'total_orders': stats['total_orders'],
+        'total_revenue': stats['total_revenue'],
+        'pending_orders': stats['pending_orders'],
+        'completed_orders': stats['completed_orders'],
+        'average_order_value': stats['avg_order_value'],
+        'average_tip': stats['avg_tip'],
+        'sales_chart': sales_series(db, 'day', SALES_CHART_DAYS),
+        'weekly_chart': sales_series(db, 'week', SALES_CHART_WEEKS),
+        'monthly_chart': sales_series(db, 'month', SALES_CHART_MONTHS),
+        'top_items_chart': {
+            'labels': [row['name'] for row in top_items],
+            'values': [row['total_qty'] for row in top_items]
+        },
+        'customer_chart': {
+            'labels': [row['segment'].title() for row in customer_rows],
+            'values': [row['customers'] for row in customer_rows]
+        },
+        'status_chart': {'labels': list(status_counts), 'values': list(status_counts.values())},
+        'category_chart': {
+            'labels': [row['category'] for row in category_rows],
+            'values': [row['revenue'] for row in category_rows]
+        },
+    }
+
+def _page_args():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', SECTION_PAGE_SIZE, type=int)
+    per_page = max(1, min(per_page, MAX_SECTION_PAGE_SIZE))
+    descending = request.args.get('order', 'desc').lower() != 'asc'
+    return page, per_page, descending
+
+def _section_response(rows, page, per_page, **extra):
+    # Rows are fetched with one extra to learn whether another page exists
+    for row in rows:
+        if row.get('created_at') is not None:
+            row['created_at'] = str(row['created_at'])
+    return jsonify({
+        'items': rows[:per_page],
+        'page': page,
+        'per_page': per_page,
+        'has_more': len(rows) > per_page,
+        **extra
+    })
+
+def _employee_page(db, filters, per_page, page=1, sort='created_at', descending=True):
+    query = "SELECT * FROM employees WHERE 1 = 1"
+    params = []
+    if filters.get('status'):
+        query += " AND status = ?"
+        params.append(filters['status'])
+    if filters.get('job_title'):
+        query += " AND job_title LIKE ?"
+        params.append(f"%{filters['job_title']}%")
+    if filters.get('q'):
+        query += " AND (first_name LIKE ? OR last_name LIKE ? OR email LIKE ? OR employee_id LIKE ?)"
+        params.extend([f"%{filters['q']}%"] * 4)
     
-    # 4. Recent Activity
-    recent_activity = db.execute("""
+    direction = 'DESC' if descending else 'ASC'
+    columns = ', '.join(f'{col.strip()} {direction}' for col in EMPLOYEE_SORTS.get(sort, 'created_at').split(','))
+    query += f" ORDER BY {columns}, id {direction} LIMIT ? OFFSET ?"
+    params.extend([per_page + 1, (page - 1) * per_page])
+    return [dict(row) for row in db.execute(query, params).fetchall()]
+
+def _recent_activity(db, status=None, limit=RECENT_ACTIVITY_LIMIT, offset=0):
+    query = """
         SELECT o.order_id, o.created_at, o.total, o.status, u.name as customer
         FROM orders o
         LEFT JOIN users u ON o.user_id = u.user_id
-        ORDER BY o.created_at DESC
-        LIMIT 12
-    """).fetchall()
+    """
+    params = []
+    if status:
+        query += " WHERE o.status = ?"
+        params.append(status)
+    query += " ORDER BY o.created_at DESC LIMIT ? OFFSET ?"
+    params.extend([limit + 1, offset])
+    return [dict(row) for row in db.execute(query, params).fetchall()]
+
+# --- Lazy dashboard sections (JSON) ---
+@bp.route('/api/overview')
+def api_overview():
+    return jsonify(_overview(get_db()))
+
+@bp.route('/api/employees')
+def api_employees():
+    page, per_page, descending = _page_args()
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'status': request.args.get('status', '').strip(),
+        'job_title': request.args.get('job_title', '').strip(),
+    }
+    sort = request.args.get('sort', 'created_at')
+    if sort not in EMPLOYEE_SORTS:
+        sort = 'created_at'
+    rows = _employee_page(get_db(), filters, per_page, page=page, sort=sort, descending=descending)
+    return _section_response(rows, page, per_page, sort=sort)
+
+@bp.route('/api/menu')
+def api_menu():
+    page, per_page, descending = _page_args()
+    catalog = get_catalog(get_db())
+    items = catalog.items
     
-    # 5. Employees
-    employees = db.execute("SELECT * FROM employees ORDER BY created_at DESC").fetchall()
+    # Filtering and sorting run over the cached catalog, not SQL
+    category = request.args.get('category', '').strip()
+    if category:
+        items = [item for item in items if item['category'] == category]
+    active = request.args.get('active', '').strip()
+    if active in ('0', '1'):
+        items = [item for item in items if bool(item['is_active']) == (active == '1')]
+    search = request.args.get('q', '').strip().lower()
+    if search:
+        items = [item for item in items
+                 if search in item['name'].lower() or search in (item['description'] or '').lower()]
     
-    # 6. Menu Items
-    menu_items = db.execute("SELECT * FROM menu_items").fetchall()
-    categories = db.execute("SELECT DISTINCT category FROM menu_items").fetchall()
-    all_categories = [c['category'] for c in categories]
+    sort = request.args.get('sort', 'item_id')
+    if sort not in MENU_SORTS:
+        sort = 'item_id'
+    key = (lambda item: item[sort].lower()) if sort in ('name', 'category') else (lambda item: item[sort])
+    items = sorted(items, key=key, reverse=descending)
+    
+    start = (page - 1) * per_page
+    return _section_response([dict(item) for item in items[start:start + per_page + 1]], page, per_page,
+                             sort=sort, total=len(items), categories=catalog.all_categories)
 
-    return render_template('admin/dashboard.html',
-        total_orders=total_orders,
-        total_revenue=total_revenue,
-        pending_orders=pending_orders,
-        completed_orders=completed_orders,
-        average_order_value=avg_order_value,
-        average_tip=avg_tip,
-        sales_chart=json.dumps({'labels': sales_labels, 'values': sales_values}),
-        top_items_chart=json.dumps({'labels': most_labels, 'values': most_values}),
-        recent_activity=recent_activity,
-        employees=employees,
-        menu_items=menu_items,
-        all_categories=all_categories,
-        admin_email=session.get('admin_email'),
-        # Pass other required variables for template compatibility
-        weekly_chart=json.dumps({'labels': [], 'values': []}), # Placeholder
-        monthly_chart=json.dumps({'labels': [], 'values': []}), # Placeholder
-        customer_chart=json.dumps({'labels': [], 'values': []}), # Placeholder
-        status_chart=json.dumps({'labels': [], 'values': []}), # Placeholder
-        category_chart=json.dumps({'labels': [], 'values': []}), # Placeholder
-        initial_section=request.args.get('section', 'overview')
-    )
+@bp.route('/api/activity')
+def api_activity():
+    page, per_page, _ = _page_args()
+    status = request.args.get('status', '').strip()
+    if status not in ACTIVITY_STATUSES:
+        status = None
+    rows = _recent_activity(get_db(), status=status, limit=per_page, offset=(page - 1) * per_page)
+    return _section_response(rows, page, per_page)
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -148,22 +285,207 @@ def add_employee():
     return redirect(url_for('admin.index', section='employees'))
 
 # --- Menu Management Routes ---
+def _menu_category():
+    # The dashboard form offers an existing category or a new one
+    return (request.form.get('new_category', '').strip() or request.form.get('category_select')
+            or request.form.get('category'))
+
+def _menu_fields(required):
+    """``(name, description, price, category)`` from the form, missing ones as None.
+
+    Raises ``ValueError`` when a ``required`` field is missing or the price is
+    not a number, before anything (an upload) is written.
+    """
+    name = (request.form.get('name') or '').strip() or None
+    price = (request.form.get('price') or '').strip() or None
+    category = _menu_category()
+    if required:
+        missing = [field for field, value in (('name', name), ('price', price), ('category', category)) if value is None]
+        if missing:
+            raise ValueError(f"Menu items need a {', '.join(missing)}")
+    if price is not None:
+        try:
+            price = float(price)
+        except ValueError:
+            raise ValueError(f'Price must be a number, not {price!r}') from None
+        if price < 0:
+            raise ValueError('Price cannot be negative')
+    return name, request.form.get('description'), price, category
+
+def _menu_upload():
+    """Store the form's image, if any; returns the ``menu_items.image`` value or None."""
+    upload = request.files.get('image_file') or request.files.get('image')
+    if not upload or not upload.filename:
+        return None
+    return menu_images.save_upload(upload)
+
 @bp.route('/menu/add', methods=['POST'])
 def add_menu_item():
     db = get_db()
     try:
+        # Validate first: a stored upload with no row pointing at it is never cleaned up
+        name, description, price, category = _menu_fields(required=True)
+        image = _menu_upload()
         db.execute("""
             INSERT INTO menu_items (name, description, price, category, image)
             VALUES (?, ?, ?, ?, ?)
-        """, (
-            request.form.get('name'),
-            request.form.get('description'),
-            request.form.get('price'),
-            request.form.get('category'),
-            '' # Image handling to be added
-        ))
+        """, (name, description, price, category, image or ''))
         db.commit()
+        invalidate_catalog()
+        # Resized copies are made after the response; pages use the original until then
+        menu_images.generate_later(image)
         flash('Menu item added', 'success')
+    except (ValueError, menu_images.MenuImageError) as e:
+        flash(str(e), 'error')
+    except Exception as e:
+        flash(f'Error: {e}', 'error')
+    return redirect(url_for('admin.index', section='menu'))
+
+@bp.route('/menu/<int:item_id>/update', methods=['POST'])
+def update_menu_item(item_id):
+    db = get_db()
+    try:
+        # Fields left out of the form keep their current value
+        name, description, price, category = _menu_fields(required=False)
+        if db.execute("SELECT 1 FROM menu_items WHERE item_id = ?", (item_id,)).fetchone() is None:
+            flash('Menu item not found', 'error')
+            return redirect(url_for('admin.index', section='menu'))
+        image = _menu_upload()
+        cursor = db.execute("""
+            UPDATE menu_items
+            SET name = COALESCE(?, name), description = COALESCE(?, description), price = COALESCE(?, price),
+                category = COALESCE(?, category), image = COALESCE(?, image)
+            WHERE item_id = ?
+        """, (name, description, price, category, image, item_id))
+        db.commit()
+        if cursor.rowcount:
+            invalidate_catalog()
+            menu_images.generate_later(image)
+            flash('Menu item updated', 'success')
+        else:
+            flash('Menu item not found', 'error')
+    except (ValueError, menu_images.MenuImageError) as e:
+        flash(str(e), 'error')
     except Exception as e:
         flash(f'Error: {e}', 'error')
     return redirect(url_for('admin.index', section='menu'))
+
+@bp.route('/api/dispatch', methods=['GET', 'POST'])
+def api_dispatch():
+    """Current driver routes; POST re-plans them (``{"rebalance": true}``) or places new orders."""
+    db = get_db()
+    if request.method == 'POST':
+        if (request.get_json(silent=True) or {}).get('rebalance'):
+            rebalance(db)
+        else:
+            assign_pending(db)
+    routes = current_routes(db)
+    drivers = active_drivers(db)
+    routed = {order_id for driver in drivers for order_id in routes.get(driver, [])}
+    pending = db.execute("SELECT order_id FROM orders WHERE status = 'out_for_delivery' ORDER BY order_id").fetchall()
+    return jsonify({
+        'drivers': drivers,
+        'routes': {driver: routes.get(driver, []) for driver in drivers},
+        'unassigned': [row['order_id'] for row in pending if row['order_id'] not in routed]
+    })
+
+@bp.route('/orders/<int:order_id>/status', methods=['POST'])
+def update_order_status(order_id):
+    try:
+        transition(get_db(), order_id, request.form.get('status', ''), actor='admin',
+                   expected=request.form.get('expected') or None)
+        flash(f'Order #{order_id} updated', 'success')
+    except TransitionError as e:
+        flash(str(e), 'error')
+    return redirect(request.referrer or url_for('admin.index', section='orders'))
+
+@bp.route('/api/orders/latency')
+def api_order_latency():
+    """Queue/prep/delivery latency percentiles in seconds (``?since=YYYY-MM-DD``)."""
+    return jsonify(latency_percentiles(get_db(), request.args.get('since') or None))
+
+@bp.route('/api/payroll')
+def api_payroll():
+    """Payroll preview for ``?start=&end=`` (default: since the last close), or a closed ``?period_id=``."""
+    db = get_db()
+    period_id = request.args.get('period_id', type=int)
+    if period_id:
+        closed = payroll.get_period(db, period_id)
+        if closed is None:
+            return jsonify({'error': 'Pay period not found'}), 404
+        period, entries = closed
+        period['closed_at'] = str(period['closed_at'])
+        return jsonify({'period': period, 'entries': entries, 'totals': payroll.summarize(entries), 'closed': True})
+    
+    try:
+        start, end = payroll.default_period(db)
+        if request.args.get('start'):
+            start = payroll.parse_date(request.args['start'])
+        if request.args.get('end'):
+            end = payroll.parse_date(request.args['end'])
+        entries = payroll.period_hours(db, start, end)
+    except payroll.PayrollError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'period': {'start_date': start.isoformat(), 'end_date': end.isoformat()},
+        'entries': entries,
+        'totals': payroll.summarize(entries),
+        'closed': False
+    })
+
+@bp.route('/api/payroll/periods')
+def api_payroll_periods():
+    rows = get_db().execute(
+        """
+        SELECT p.period_id, p.start_date, p.end_date, p.closed_at, p.closed_by,
+               count(e.employee_id) AS employees, coalesce(sum(e.gross_pay), 0) AS gross_pay
+        FROM payroll_periods p
+        LEFT JOIN payroll_entries e ON e.period_id = p.period_id
+        GROUP BY p.period_id
+        ORDER BY p.end_date DESC
+        LIMIT ?
+        """,
+        (max(1, min(request.args.get('limit', SECTION_PAGE_SIZE, type=int), MAX_SECTION_PAGE_SIZE)),)
+    ).fetchall()
+    return jsonify({'periods': [dict(row, closed_at=str(row['closed_at'])) for row in rows]})
+
+@bp.route('/payroll/close', methods=['POST'])
+def close_payroll():
+    try:
+        start = payroll.parse_date(request.form.get('start'))
+        end = payroll.parse_date(request.form.get('end'))
+        period_id = payroll.close_period(get_db(), start, end, closed_by='admin',
+                                         allow_open=bool(request.form.get('allow_open')))
+        flash(f'Closed pay period #{period_id} ({start} to {end})', 'success')
+    except payroll.PayrollError as e:
+        flash(str(e), 'error')
+    return redirect(url_for('admin.index', section='payroll'))
+
+@bp.route('/api/on-shift')
+def api_on_shift():
+    """Who is scheduled at ``?day=fri&time=18:30`` (default: now), optionally ``&role=driver``."""
+    weekday = shifts.parse_weekday(request.args.get('day'))
+    minute = shifts.parse_minute(request.args.get('time')) if request.args.get('time') else None
+    if (request.args.get('day') and weekday is None) or (request.args.get('time') and minute is None):
+        return jsonify({'error': 'day must be a weekday name or 0-6 and time HH:MM'}), 400
+    staff = shifts.on_shift(get_db(), weekday, minute, request.args.get('role', '').strip() or None)
+    for member in staff:
+        member['start'] = shifts.format_minute(member.pop('start_minute'))
+        member['end'] = shifts.format_minute(member.pop('end_minute'))
+    return jsonify({'staff': staff})
+
+@bp.route('/api/coverage')
+def api_coverage():
+    """Weekly scheduled headcount heatmap (``?slot=30&role=driver``)."""
+    slot = request.args.get('slot', 30, type=int)
+    if slot not in (15, 30, 60, 120):
+        slot = 30
+    return jsonify(shifts.coverage(get_db(), slot, request.args.get('role', '').strip() or None))
+
+@bp.route('/metrics')
+def metrics():
+    """This worker's request and SQL timings in Prometheus text format."""
+    registry = get_metrics()
+    if registry is None:
+        return Response('Metrics are disabled; set METRICS_ENABLED=1.\n', status=404, mimetype='text/plain')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.db import get_db
+from app.geocoding import address_key, geocode_later
 
 bp = Blueprint('auth', __name__)
 
@@ -20,10 +21,12 @@ def signup():
         db = get_db()
         try:
             db.execute(
-                "INSERT INTO users (email, password_hash, name, phone, address) VALUES (?, ?, ?, ?, ?)",
-                (email, generate_password_hash(password), name, phone, address)
+                "INSERT INTO users (email, password_hash, name, phone, address, address_key) VALUES (?, ?, ?, ?, ?, ?)",
+                (email, generate_password_hash(password), name, phone, address, address_key(address))
             )
             db.commit()
+            # Coordinates are ready before the first delivery goes out
+            geocode_later(address)
             flash('Account created successfully! Please sign in.', 'success')
             return redirect(url_for('auth.signin'))
         except db.IntegrityError:
@@ -51,6 +54,11 @@ def signin():
             session['user_id'] = user['user_id']
             session['user_name'] = user['name']
             session['user_email'] = user['email']
+            # Cart reference is per user; get_cart_id re-resolves it. A legacy
+            # cookie cart belongs to whoever used this browser before, so it
+            # is dropped rather than merged into this user's cart.
+            for key in ('cart_id', 'cart_count', 'cart'):
+                session.pop(key, None)
             flash(f'Welcome back, {user["name"]}!', 'success')
             return redirect(url_for('main.menu'))
         else:
@@ -61,6 +69,7 @@ def signin():
 
 @bp.route('/signout')
 def signout():
+    # Also drops any legacy cookie cart along with the cart reference
     session.clear()
     flash('You have been signed out', 'info')
     return redirect(url_for('main.index'))
@@ -1,5 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, Response, current_app
 from app.db import get_db
+from app.deliveries import pending_stops, current_seq, etag_for, get_feed
+from app.routing import optimize_route
+from app.dispatch import active_drivers, driver_order_ids, waiting_orders
+from app.lifecycle import TransitionError, transition
+import json
+import time
 import os
 
 bp = Blueprint('driver', __name__, url_prefix='/driver')
@@ -26,15 +32,23 @@ def dashboard():
         return redirect(url_for('driver.login'))
         
     db = get_db()
-    # Get pending deliveries
+    # Dispatch runs on order/shift changes (see app.dispatch), not on page views
     pending_orders = db.execute("""
         SELECT o.*, u.name as customer_name, u.address as delivery_address, u.phone as customer_phone
-        FROM orders o
+        FROM order_assignments a
+        JOIN orders o ON o.order_id = a.order_id
         JOIN users u ON o.user_id = u.user_id
-        WHERE o.status = 'out_for_delivery'
-    """).fetchall()
+        WHERE a.employee_id = ? AND o.status = 'out_for_delivery'
+        ORDER BY a.sequence
+    """, (session['driver_id'],)).fetchall()
     
-    return render_template('driver/dashboard.html', pending_orders=pending_orders)
+    # Orders dispatch could not place (nobody on shift, everyone at capacity)
+    # are listed too, so no delivery is ever invisible to every driver
+    drivers = active_drivers(db)
+    waiting = waiting_orders(db, drivers)
+    
+    return render_template('driver/dashboard.html', pending_orders=pending_orders, waiting_orders=waiting,
+                           on_shift=session['driver_id'] in drivers or bool(pending_orders))
 
 @bp.route('/route-optimizer')
 def route_optimizer():
@@ -50,21 +64,159 @@ def api_pending_deliveries():
         return jsonify({'error': 'Unauthorized'}), 401
         
     db = get_db()
-    pending_orders = db.execute("""
-        SELECT o.order_id, u.name, u.address, u.phone, o.total
-        FROM orders o
-        JOIN users u ON o.user_id = u.user_id
-        WHERE o.status = 'out_for_delivery'
-    """).fetchall()
+    # The change sequence doubles as the ETag: drivers re-polling an
+    # unchanged list get a 304 without the orders/users join running
+    seq = current_seq(db)
+    etag = etag_for(seq)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({'stops': pending_stops(db), 'seq': seq})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/api/deliveries/<int:order_id>/complete', methods=['POST'])
+def api_complete_delivery(order_id):
+    if 'driver_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        transition(get_db(), order_id, 'completed', actor=f"driver:{session['driver_id']}",
+                   expected='out_for_delivery')
+    except TransitionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True, 'order_id': order_id, 'status': 'completed'})
+
+@bp.route('/api/deliveries/changes')
+def api_delivery_changes():
+    """Long-poll: waits up to ``wait`` seconds for changes after ``since``."""
+    if 'driver_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    since = request.args.get('since', '0')
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+    wait = max(0, min(request.args.get('wait', 25, type=int), 55))
+    feed = get_feed()
+    if wait:
+        feed.wait_for_change(since, wait)
+    return jsonify(feed.read_changes(since))
+
+@bp.route('/api/deliveries/stream')
+def api_delivery_stream():
+    """Server-Sent Events stream of added/removed stops."""
+    if 'driver_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    # Parsed before streaming: once the generator runs the status line is already sent
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({'error': 'Last-Event-ID/since must be an integer'}), 400
+        if last_event_id < 0:
+            return jsonify({'error': 'Last-Event-ID/since must not be negative'}), 400
+    feed = get_feed()
+    heartbeat = current_app.config.get('DELIVERY_STREAM_HEARTBEAT', 15)
+    max_age = current_app.config.get('DELIVERY_STREAM_MAX_AGE', 300)
     
-    stops = []
-    for order in pending_orders:
-        stops.append({
-            'id': order['order_id'],
-            'name': order['name'],
-            'address': order['address'],
-            'phone': order['phone'],
-            'total': order['total']
-        })
+    def events():
+        if last_event_id is None:
+            # Fresh connection: send the whole list once, then deltas only
+            snapshot = feed.read_snapshot()
+            seq = snapshot['seq']
+            yield f"id: {seq}\nevent: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+        else:
+            seq = last_event_id
+        yield f"retry: 3000\n\n"
         
-    return jsonify({'stops': stops})
+        # Close periodically so workers are recycled; EventSource reconnects
+        # with Last-Event-ID and resumes from the same seq
+        ends_at = time.monotonic() + max_age
+        while time.monotonic() < ends_at:
+            latest = feed.wait_for_change(seq, heartbeat)
+            if latest <= seq:
+                yield ": keepalive\n\n"
+                continue
+            changes = feed.read_changes(seq)
+            seq = changes['seq']
+            yield f"id: {seq}\nevent: changes\ndata: {json.dumps(changes)}\n\n"
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _coords(value):
+    """``(lat, lng)`` floats from a ``{lat, lng}`` dict, or None if missing/invalid."""
+    if not isinstance(value, dict):
+        return None
+    try:
+        lat, lng = float(value['lat']), float(value['lng'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+@bp.route('/api/optimize', methods=['POST'])
+def api_optimize_route():
+    """Order the driver's out-for-delivery stops into a short route.
+
+    Body: ``{"origin": {"lat", "lng"}, "stops": [{"id", "lat", "lng"}], "time_budget_ms"}``.
+    Stops are matched against the current pending deliveries; ones without
+    coordinates are returned under ``unrouted``.
+    """
+    if 'driver_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    origin = _coords(data.get('origin'))
+    if origin is None and current_app.config.get('RESTAURANT_LAT') is not None:
+        origin = (current_app.config['RESTAURANT_LAT'], current_app.config['RESTAURANT_LNG'])
+    if origin is None:
+        return jsonify({'error': 'origin with lat and lng is required'}), 400
+    
+    budget_ms = data.get('time_budget_ms', current_app.config.get('ROUTE_TIME_BUDGET_MS', 1000))
+    try:
+        budget_ms = max(10, min(int(budget_ms), current_app.config.get('ROUTE_MAX_TIME_BUDGET_MS', 5000)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'time_budget_ms must be an integer'}), 400
+    
+    coords_by_id = {}
+    for stop in data.get('stops') or []:
+        if isinstance(stop, dict) and str(stop.get('id', '')).isdigit():
+            coords_by_id[int(stop['id'])] = _coords(stop)
+    
+    db = get_db()
+    if coords_by_id:
+        order_ids = list(coords_by_id)
+    else:
+        # Default to the stops dispatch assigned to this driver, if any
+        order_ids = driver_order_ids(db, session['driver_id']) or None
+    stops = pending_stops(db, order_ids)
+    routable, unrouted = [], []
+    for stop in stops:
+        coords = coords_by_id.get(stop['id'])
+        if coords is None and stop.get('lat') is not None:
+            coords = (stop['lat'], stop['lng'])
+        if coords is None:
+            unrouted.append(stop)
+        else:
+            routable.append({**stop, 'lat': coords[0], 'lng': coords[1]})
+    
+    result = optimize_route({'lat': origin[0], 'lng': origin[1]}, routable, time_budget=budget_ms / 1000)
+    stats = result['stats']
+    return jsonify({
+        'origin': {'lat': origin[0], 'lng': origin[1]},
+        'route': result['route'],
+        'unrouted': unrouted,
+        'total_km': result['total_km'],
+        'seed_km': round(stats['seed_length'], 3),
+        'solve_ms': round(stats['solve_ms'], 1),
+        'timed_out': stats['timed_out']
+    })
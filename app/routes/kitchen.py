@@ -0,0 +1,99 @@
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, Response, current_app
+from app.db import get_db
+from app.kitchen import get_broker, open_orders, snapshot
+from app.lifecycle import TransitionError, transition, recall
+import json
+import queue
+import time
+
+bp = Blueprint('kitchen', __name__, url_prefix='/kitchen')
+
+# Bump moves an order one step along the kitchen line
+BUMPS = {
+    'pending': 'preparing',
+    'preparing': 'out_for_delivery'
+}
+
+def _staff():
+    """Actor label for the signed-in worker/admin, or None."""
+    if 'worker_id' in session:
+        return f"worker:{session['worker_id']}"
+    if session.get('is_admin') is True:
+        return 'admin'
+    return None
+
+@bp.before_request
+def restrict_access():
+    if _staff() is None:
+        if request.path.startswith('/kitchen/api') or request.method == 'POST':
+            return jsonify({'error': 'Unauthorized'}), 401
+        return redirect(url_for('worker.login'))
+
+@bp.route('/')
+def display():
+    return render_template('kitchen/display.html', **snapshot(get_db()))
+
+@bp.route('/api/orders')
+def api_orders():
+    return jsonify(snapshot(get_db()))
+
+@bp.route('/orders/<int:order_id>/bump', methods=['POST'])
+def bump(order_id):
+    expected = (request.get_json(silent=True) or {}).get('status') or request.form.get('status')
+    if expected not in BUMPS:
+        return jsonify({'success': False, 'error': 'status must be pending or preparing'}), 400
+    try:
+        transition(get_db(), order_id, BUMPS[expected], actor=_staff(), expected=expected)
+    except TransitionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True, 'order_id': order_id, 'status': BUMPS[expected]})
+
+@bp.route('/orders/<int:order_id>/recall', methods=['POST'])
+def recall_order(order_id):
+    expected = (request.get_json(silent=True) or {}).get('status') or request.form.get('status') or None
+    try:
+        status = recall(get_db(), order_id, actor=_staff(), expected=expected)
+    except TransitionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    cards = open_orders(get_db(), [order_id])
+    return jsonify({'success': True, 'order_id': order_id, 'status': status, 'order': cards[0] if cards else None})
+
+@bp.route('/stream')
+def stream():
+    """Server-Sent Events: a snapshot of open orders, then changed/removed orders.
+
+    Holds a gunicorn thread (see gunicorn.conf.py) for up to KITCHEN_STREAM_MAX_AGE.
+    """
+    broker = get_broker()
+    heartbeat = current_app.config.get('KITCHEN_STREAM_HEARTBEAT', 15)
+    max_age = current_app.config.get('KITCHEN_STREAM_MAX_AGE', 300)
+    
+    # Subscribe before the snapshot so nothing committed in between is missed
+    subscriber = broker.subscribe()
+    
+    def events():
+        try:
+            current = broker.snapshot()
+            seq = current['seq']
+            yield f"id: {seq}\nevent: snapshot\ndata: {json.dumps(current)}\n\nretry: 2000\n\n"
+            
+            ends_at = time.monotonic() + max_age
+            while time.monotonic() < ends_at:
+                try:
+                    message = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                if message['seq'] <= seq:
+                    continue
+                seq = message['seq']
+                yield f"id: {seq}\nevent: changes\ndata: {json.dumps(message)}\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
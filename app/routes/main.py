@@ -1,5 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify
 from app.db import get_db
+from app.orders import get_order, get_order_page, ORDER_PAGE_SIZE
+from app.catalog import get_catalog
+from app.search import search_menu
+from app import cart as carts
+from app.checkout import place_order, quote, cart_subtotal, new_checkout_token
+from app.coupons import CouponError, validate as validate_coupon
+from app.geocoding import set_user_address, geocode_later
+from app.menu_images import menu_image_url
 import json
 from datetime import datetime
 
@@ -7,52 +15,35 @@ bp = Blueprint('main', __name__)
 
 @bp.route('/')
 def index():
-    db = get_db()
+    catalog = get_catalog(get_db())
     # Get featured items (simulated by specific names or random)
     featured_names = ['Classic Burger', 'Margherita Pizza', 'Chicken Wings', 'Chocolate Cake']
-    placeholders = ','.join(['?'] * len(featured_names))
-    featured_items = db.execute(
-        f"SELECT * FROM menu_items WHERE name IN ({placeholders})",
-        featured_names
-    ).fetchall()
-    
-    # Sort to maintain order
-    featured_items.sort(key=lambda x: featured_names.index(x['name']) if x['name'] in featured_names else 999)
+    featured_items = [catalog.by_name[name] for name in featured_names if name in catalog.by_name]
     
     return render_template('index.html', featured_items=featured_items)
 
 @bp.route('/menu')
 def menu():
     db = get_db()
-    search_query = request.args.get('search', '').lower()
+    search_query = request.args.get('search', '').strip()
     category_filter = request.args.get('category', '')
     
-    query = "SELECT * FROM menu_items WHERE is_active = 1"
-    params = []
+    catalog = get_catalog(db)
     
     if search_query:
-        query += " AND (lower(name) LIKE ? OR lower(description) LIKE ?)"
-        params.extend([f'%{search_query}%', f'%{search_query}%'])
-    
-    if category_filter:
-        query += " AND category = ?"
-        params.append(category_filter)
+        items = search_menu(db, search_query, category=category_filter or None)
         
-    items = db.execute(query, params).fetchall()
-    
-    # Group by category
-    categories = {}
-    all_categories = set()
-    for item in items:
-        category = item['category']
-        all_categories.add(category)
-        if category not in categories:
-            categories[category] = []
-        categories[category].append(item)
+        # Group by category, keeping the best-ranked categories first
+        categories = {}
+        for item in items:
+            categories.setdefault(item['category'], []).append(item)
+    elif category_filter:
+        categories = {category_filter: catalog.by_category[category_filter]} if category_filter in catalog.by_category else {}
+    else:
+        categories = catalog.by_category
         
     # Get all categories for filter
-    all_cats_query = db.execute("SELECT DISTINCT category FROM menu_items WHERE is_active = 1 ORDER BY category").fetchall()
-    all_categories_list = [row['category'] for row in all_cats_query]
+    all_categories_list = catalog.categories
     
     # Wishlist
     wishlist_ids = []
@@ -70,38 +61,49 @@ def menu():
                          wishlist_ids=wishlist_ids, 
                          user_name=session.get('user_name'))
 
+@bp.route('/api/menu/search')
+def api_menu_search():
+    results = search_menu(
+        get_db(),
+        request.args.get('q', ''),
+        category=request.args.get('category') or None,
+        limit=request.args.get('limit', 20, type=int)
+    )
+    return jsonify({'results': [{
+        'item_id': item['item_id'],
+        'name': item['name'],
+        'description': item['description'],
+        'category': item['category'],
+        'price': item['price'],
+        'image': item['image'],
+        'image_url': menu_image_url(item['image'], 'thumb') if item['image'] else None,
+        'name_html': str(item['name_html']),
+        'snippet_html': str(item['snippet_html'])
+    } for item in results]})
+
 @bp.route('/cart', methods=['GET', 'POST'])
 def cart():
     if 'user_id' not in session:
         flash('Please sign in to view your cart', 'error')
         return redirect(url_for('auth.signin'))
     
+    db = get_db()
+    cart_id = carts.get_cart_id(db, session['user_id'])
+    
     if request.method == 'POST':
         item_id = request.form.get('item_id')
         quantity = int(request.form.get('quantity', 1))
         allergies = request.form.get('allergies', '')
-        
-        if 'cart' not in session:
-            session['cart'] = []
             
-        db = get_db()
-        item = db.execute("SELECT * FROM menu_items WHERE item_id = ?", (item_id,)).fetchone()
+        item = get_catalog(db).get_item(item_id)
         
         if item:
-            cart_item = {
-                'item_id': item['item_id'],
-                'name': item['name'],
-                'price': float(item['price']),
-                'quantity': quantity,
-                'allergies': allergies
-            }
-            session['cart'].append(cart_item)
-            session.modified = True
+            carts.add_item(db, cart_id, item['item_id'], quantity, allergies)
             flash(f'{item["name"]} added to cart!', 'success')
             
         return redirect(url_for('main.menu'))
 
-    cart = session.get('cart', [])
+    cart = carts.get_lines(db, cart_id)
     subtotal = sum(item['price'] * item['quantity'] for item in cart)
     return render_template('cart.html', cart=cart, subtotal=subtotal, user_name=session.get('user_name'))
 
@@ -110,23 +112,19 @@ def update_cart_quantity():
     if 'user_id' not in session:
         return redirect(url_for('auth.signin'))
         
-    index = int(request.form.get('index', -1))
+    line_id = int(request.form.get('line_id', -1))
     quantity = int(request.form.get('quantity', 1))
     
-    if 'cart' in session and 0 <= index < len(session['cart']):
-        if quantity <= 0:
-            session['cart'].pop(index)
-        else:
-            session['cart'][index]['quantity'] = quantity
-        session.modified = True
+    db = get_db()
+    carts.set_quantity(db, carts.get_cart_id(db, session['user_id']), line_id, quantity)
         
     return redirect(url_for('main.cart'))
 
-@bp.route('/remove_from_cart/<int:index>')
-def remove_from_cart(index):
-    if 'cart' in session and 0 <= index < len(session['cart']):
-        session['cart'].pop(index)
-        session.modified = True
+@bp.route('/remove_from_cart/<int:line_id>')
+def remove_from_cart(line_id):
+    if 'user_id' in session:
+        db = get_db()
+        carts.remove_line(db, carts.get_cart_id(db, session['user_id']), line_id)
     return redirect(url_for('main.cart'))
 
 @bp.route('/checkout', methods=['GET', 'POST'])
@@ -134,92 +132,136 @@ def checkout():
     if 'user_id' not in session:
         return redirect(url_for('auth.signin'))
         
-    cart = session.get('cart', [])
-    if not cart:
-        flash('Your cart is empty', 'error')
-        return redirect(url_for('main.menu'))
+    db = get_db()
+    cart_id = carts.get_cart_id(db, session['user_id'])
         
     if request.method == 'POST':
         # ... (Payment logic would go here)
         
-        # Calculate totals
-        subtotal = sum(item['price'] * item['quantity'] for item in cart)
-        tax = subtotal * current_app.config['TAX_RATE']
-        delivery_fee = current_app.config['DELIVERY_FEE']
-        tip = 0 # Simplified for now
-        total = subtotal + tax + delivery_fee + tip
-        
-        db = get_db()
-        cursor = db.execute(
-            "INSERT INTO orders (user_id, subtotal, tax, delivery_fee, tip, total, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (session['user_id'], subtotal, tax, delivery_fee, tip, total, 'pending')
-        )
-        order_id = cursor.lastrowid
-        
-        # Insert items
-        for item in cart:
-            db.execute(
-                "INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies) VALUES (?, ?, ?, ?, ?, ?)",
-                (order_id, item['item_id'], item['name'], item['price'], item['quantity'], item['allergies'])
+        # A repeated token returns the order its first submit created, even
+        # though the cart has been emptied since
+        try:
+            order_id, created = place_order(
+                db, session['user_id'], cart_id,
+                idempotency_key=request.form.get('checkout_token'),
+                tax_rate=current_app.config['TAX_RATE'],
+                delivery_fee=current_app.config['DELIVERY_FEE'],
+                tip=0, # Simplified for now
+                coupon_code=session.get('coupon_code')
             )
-            
-        db.commit()
-        session['cart'] = []
-        session.modified = True
-        flash(f'Order #{order_id} placed successfully!', 'success')
+        except CouponError as e:
+            session.pop('coupon_code', None)
+            flash(f'{e}. Your order was not placed; please review the new total.', 'error')
+            return redirect(url_for('main.checkout'))
+        if order_id is None:
+            flash('Your cart is empty', 'error')
+            return redirect(url_for('main.menu'))
+        
+        if created:
+            session.pop('coupon_code', None)
+            flash(f'Order #{order_id} placed successfully!', 'success')
         return redirect(url_for('main.order_confirmation', order_id=order_id))
         
-    subtotal = sum(item['price'] * item['quantity'] for item in cart)
-    tax = subtotal * current_app.config['TAX_RATE']
-    delivery_fee = current_app.config['DELIVERY_FEE']
+    cart = carts.get_lines(db, cart_id)
+    if not cart:
+        flash('Your cart is empty', 'error')
+        return redirect(url_for('main.menu'))
+    
+    discount = 0
+    if session.get('coupon_code'):
+        try:
+            _, discount = validate_coupon(db, session['coupon_code'], cart_subtotal(cart))
+        except CouponError as e:
+            session.pop('coupon_code', None)
+            flash(str(e), 'error')
+    
+    totals = quote(cart, current_app.config['TAX_RATE'], current_app.config['DELIVERY_FEE'], discount=discount)
     
     return render_template('checkout.html', 
                          cart=cart, 
-                         subtotal=subtotal, 
-                         tax=tax, 
-                         delivery_fee=delivery_fee, 
-                         total=subtotal+tax+delivery_fee,
+                         subtotal=totals['subtotal'], 
+                         discount=totals['discount'],
+                         applied_coupon=session.get('coupon_code', ''),
+                         tax=totals['tax'], 
+                         tax_rate=current_app.config['TAX_RATE'] * 100,
+                         delivery_fee=totals['delivery_fee'], 
+                         total=totals['total'],
+                         checkout_token=new_checkout_token(),
                          user_name=session.get('user_name'))
 
+@bp.route('/checkout/coupon', methods=['POST'])
+def apply_coupon_checkout():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.signin'))
+    
+    if request.form.get('remove'):
+        session.pop('coupon_code', None)
+        flash('Coupon removed', 'info')
+        return redirect(url_for('main.checkout'))
+    
+    db = get_db()
+    cart = carts.get_lines(db, carts.get_cart_id(db, session['user_id']))
+    try:
+        coupon, discount = validate_coupon(db, request.form.get('coupon_code'), cart_subtotal(cart))
+    except CouponError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.checkout'))
+    
+    session['coupon_code'] = coupon['code']
+    flash(f"Coupon {coupon['code']} applied! You save ${discount:.2f}", 'success')
+    return redirect(url_for('main.checkout'))
+
 @bp.route('/order_confirmation/<int:order_id>')
 def order_confirmation(order_id):
     if 'user_id' not in session:
         return redirect(url_for('auth.signin'))
         
-    db = get_db()
-    order = db.execute("SELECT * FROM orders WHERE order_id = ? AND user_id = ?", (order_id, session['user_id'])).fetchone()
+    order = get_order(get_db(), order_id, session['user_id'])
     if not order:
         flash('Order not found', 'error')
         return redirect(url_for('main.menu'))
-        
-    items = db.execute("SELECT * FROM order_items WHERE order_id = ?", (order_id,)).fetchall()
     
-    # Convert row objects to dicts and attach items
-    order_dict = dict(order)
-    order_dict['items'] = [dict(item) for item in items]
-    
-    return render_template('order_confirmation.html', order=order_dict, user_name=session.get('user_name'))
+    return render_template('order_confirmation.html', order=order, user_name=session.get('user_name'))
 
 @bp.route('/orders')
 def orders():
     if 'user_id' not in session:
         return redirect(url_for('auth.signin'))
         
-    db = get_db()
-    # Pagination could be added here
-    orders = db.execute(
-        "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC", 
-        (session['user_id'],)
-    ).fetchall()
-    
-    orders_display = []
-    for o in orders:
-        o_dict = dict(o)
-        items = db.execute("SELECT * FROM order_items WHERE order_id = ?", (o['order_id'],)).fetchall()
-        o_dict['items'] = [dict(item) for item in items]
-        orders_display.append(o_dict)
+    # First page only; older orders stream in through main.orders_page
+    orders_display, next_cursor = get_order_page(get_db(), session['user_id'])
         
-    return render_template('orders.html', orders=orders_display, user_name=session.get('user_name'))
+    return render_template('orders.html', orders=orders_display, next_cursor=next_cursor, user_name=session.get('user_name'))
+
+@bp.route('/orders/page')
+def orders_page():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    limit = request.args.get('limit', ORDER_PAGE_SIZE, type=int)
+    orders_display, next_cursor = get_order_page(
+        get_db(), session['user_id'], cursor=request.args.get('cursor'), limit=limit
+    )
+    for o in orders_display:
+        o['created_at'] = str(o['created_at'])
+    return jsonify({'orders': orders_display, 'next_cursor': next_cursor})
+
+@bp.route('/account/address', methods=['POST'])
+def update_address():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.signin'))
+    
+    address = (request.form.get('address') or '').strip()
+    if not address:
+        flash('Please enter a delivery address', 'error')
+        return redirect(request.referrer or url_for('main.checkout'))
+    
+    db = get_db()
+    set_user_address(db, session['user_id'], address)
+    db.commit()
+    geocode_later(address)
+    flash('Delivery address updated', 'success')
+    return redirect(request.referrer or url_for('main.checkout'))
 
 @bp.route('/wishlist', methods=['GET', 'POST'])
 def wishlist():
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from app.db import get_db
+from app.dispatch import assign_pending, is_driver
 from datetime import datetime
 
 bp = Blueprint('worker', __name__, url_prefix='/worker')
@@ -52,6 +53,9 @@ def checkin():
         )
         db.commit()
         flash('Checked in!', 'success')
+        if is_driver(db, session['worker_id']):
+            # Orders waiting for a driver can go to this one now
+            assign_pending(db)
     except db.IntegrityError:
         flash('Already checked in', 'info')
         
@@ -66,9 +70,11 @@ def checkout():
     today = datetime.now().strftime('%Y-%m-%d')
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    # Calculate hours
+    # Latest open check-in, which may be yesterday's for an overnight shift
     attendance = db.execute(
-        "SELECT check_in_time FROM attendance WHERE employee_id = ? AND date = ?",
+        """SELECT id, check_in_time FROM attendance
+           WHERE employee_id = ? AND date >= date(?, '-1 day') AND check_out_time IS NULL
+           ORDER BY date DESC LIMIT 1""",
         (session['worker_id'], today)
     ).fetchone()
     
@@ -78,11 +84,19 @@ def checkout():
         hours = (check_out - check_in).total_seconds() / 3600
         
         db.execute(
-            "UPDATE attendance SET check_out_time = ?, hours_worked = ? WHERE employee_id = ? AND date = ?",
-            (now, hours, session['worker_id'], today)
+            "UPDATE attendance SET check_out_time = ?, hours_worked = ? WHERE id = ?",
+            (now, hours, attendance['id'])
+        )
+        # Unpaid hours since the last payroll close (see app.payroll)
+        db.execute(
+            "UPDATE employees SET hours_this_period = coalesce(hours_this_period, 0) + ? WHERE employee_id = ?",
+            (hours, session['worker_id'])
         )
         db.commit()
         flash(f'Checked out. Hours: {hours:.2f}', 'success')
+        if is_driver(db, session['worker_id']):
+            # Hand this driver's undelivered stops to whoever is still on shift
+            assign_pending(db)
     else:
         flash('Not checked in', 'error')
         
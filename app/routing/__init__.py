@@ -0,0 +1,34 @@
+"""Native route optimization for driver deliveries.
+
+``optimize_route`` orders a list of stops with coordinates into a short open
+path from an origin, replacing the round trip to the Node optimizer service.
+"""
+from .distance import haversine_matrix
+from .solver import solve, path_length
+from .vrp import sweep_clusters, plan_routes, insertion_cost
+
+def optimize_route(origin, stops, time_budget=1.0):
+    """Order ``stops`` (dicts with ``lat``/``lng``) starting from ``origin``.
+
+    Returns a dict with the ordered stops (each annotated with ``sequence``,
+    ``leg_km`` and ``cumulative_km``), ``total_km`` and solver stats.
+    """
+    if not stops:
+        return {'route': [], 'total_km': 0.0, 'stats': {'seed_length': 0.0, 'length': 0.0,
+                                                         'passes': 0, 'solve_ms': 0.0, 'timed_out': False}}
+
+    coords = [(origin['lat'], origin['lng'])] + [(stop['lat'], stop['lng']) for stop in stops]
+    matrix = haversine_matrix(coords)
+    order, stats = solve(matrix, time_budget=time_budget)
+
+    route = []
+    cumulative = 0.0
+    for sequence, (prev, node) in enumerate(zip(order, order[1:]), start=1):
+        leg = float(matrix[prev, node])
+        cumulative += leg
+        route.append({**stops[node - 1], 'sequence': sequence,
+                      'leg_km': round(leg, 3), 'cumulative_km': round(cumulative, 3)})
+    return {'route': route, 'total_km': round(stats['length'], 3), 'stats': stats}
+
+__all__ = ['optimize_route', 'haversine_matrix', 'solve', 'path_length',
+           'sweep_clusters', 'plan_routes', 'insertion_cost']
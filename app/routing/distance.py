@@ -0,0 +1,14 @@
+"""Vectorized great-circle distances."""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_matrix(coords):
+    """Pairwise haversine distances in km for an ``(n, 2)`` array of (lat, lng) degrees."""
+    coords = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+    lat = coords[:, 0][:, None]
+    lng = coords[:, 1][:, None]
+    dlat = lat.T - lat
+    dlng = lng.T - lng
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,122 @@
+"""Open-path TSP heuristics over a distance matrix.
+
+Node 0 is the start (the restaurant or the driver's position) and the path
+does not return to it, matching how drivers run their deliveries. A nearest
+neighbour tour seeds the search; 2-opt and Or-opt then improve it until
+neither finds a gain or the time budget runs out. Each move scan is
+vectorized with NumPy across all candidate positions.
+"""
+import time
+import numpy as np
+
+EPSILON = 1e-9
+
+def path_length(route, matrix):
+    route = np.asarray(route)
+    if len(route) < 2:
+        return 0.0
+    return float(matrix[route[:-1], route[1:]].sum())
+
+def nearest_neighbor(matrix, start=0):
+    n = len(matrix)
+    visited = np.zeros(n, dtype=bool)
+    route = [start]
+    visited[start] = True
+    current = start
+    for _ in range(n - 1):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = int(np.argmin(distances))
+        visited[current] = True
+        route.append(current)
+    return route
+
+def two_opt_pass(route, matrix, deadline):
+    """One sweep of best-improvement 2-opt per start position; returns True if improved."""
+    route_arr = np.asarray(route)
+    n = len(route_arr)
+    improved = False
+    for i in range(1, n - 1):
+        if time.perf_counter() > deadline:
+            break
+        prev, first = route_arr[i - 1], route_arr[i]
+        js = np.arange(i + 1, n)
+        # Reversing route[i..j] swaps edges (prev, first) + (r[j], r[j+1])
+        # for (prev, r[j]) + (first, r[j+1]); the last j has no next edge
+        delta = matrix[prev, route_arr[js]] - matrix[prev, first]
+        inner = js[:-1]
+        delta[:-1] += matrix[first, route_arr[inner + 1]] - matrix[route_arr[inner], route_arr[inner + 1]]
+        best = int(np.argmin(delta))
+        if delta[best] < -EPSILON:
+            j = int(js[best])
+            route_arr[i:j + 1] = route_arr[i:j + 1][::-1]
+            improved = True
+    route[:] = route_arr.tolist()
+    return improved
+
+def or_opt_pass(route, matrix, deadline, max_segment=3):
+    """Relocate segments of 1..max_segment stops (either orientation); returns True if improved."""
+    improved = False
+    for length in range(1, max_segment + 1):
+        i = 1
+        while i + length <= len(route):
+            if time.perf_counter() > deadline:
+                return improved
+            segment = route[i:i + length]
+            prev = route[i - 1]
+            nxt = route[i + length] if i + length < len(route) else None
+            removal_gain = matrix[prev, segment[0]]
+            if nxt is not None:
+                removal_gain += matrix[segment[-1], nxt] - matrix[prev, nxt]
+
+            rest = np.asarray(route[:i] + route[i + length:])
+            # Insert after rest[k]; the slot after the last stop has no next edge
+            left = rest
+            right = np.append(rest[1:], -1)
+            has_right = right >= 0
+            right_idx = np.where(has_right, right, 0)
+            base = np.where(has_right, matrix[left, right_idx], 0.0)
+
+            forward = matrix[left, segment[0]] + np.where(has_right, matrix[segment[-1], right_idx], 0.0) - base
+            backward = matrix[left, segment[-1]] + np.where(has_right, matrix[segment[0], right_idx], 0.0) - base
+            # Re-inserting where it came from is not a move
+            forward[i - 1] = backward[i - 1] = np.inf
+
+            k_fwd, k_bwd = int(np.argmin(forward)), int(np.argmin(backward))
+            if forward[k_fwd] <= backward[k_bwd]:
+                k, cost, insert = k_fwd, forward[k_fwd], segment
+            else:
+                k, cost, insert = k_bwd, backward[k_bwd], segment[::-1]
+
+            if cost - removal_gain < -EPSILON:
+                rest_list = rest.tolist()
+                route[:] = rest_list[:k + 1] + insert + rest_list[k + 1:]
+                improved = True
+            else:
+                i += 1
+    return improved
+
+def solve(matrix, time_budget=1.0, start=0):
+    """Return ``(route, stats)`` for an open path over every node starting at ``start``."""
+    began = time.perf_counter()
+    deadline = began + time_budget
+    matrix = np.asarray(matrix, dtype=float)
+
+    route = nearest_neighbor(matrix, start)
+    seed_length = path_length(route, matrix)
+
+    passes = 0
+    if len(route) > 3:
+        while time.perf_counter() < deadline:
+            passes += 1
+            improved = two_opt_pass(route, matrix, deadline)
+            improved = or_opt_pass(route, matrix, deadline) or improved
+            if not improved:
+                break
+
+    return route, {
+        'seed_length': seed_length,
+        'length': path_length(route, matrix),
+        'passes': passes,
+        'solve_ms': (time.perf_counter() - began) * 1000,
+        'timed_out': time.perf_counter() >= deadline,
+    }
@@ -0,0 +1,87 @@
+"""Multi-driver assignment: sweep clustering and cheapest insertion.
+
+Cluster-first, route-second: stops are sorted by their bearing from the
+depot and cut into contiguous, balanced sectors (one per driver, at most
+``capacity`` stops each); each sector is then routed on its own with
+``solve``. New stops are added to existing routes by cheapest insertion so
+drivers already on the road keep their order.
+"""
+import math
+import numpy as np
+from .distance import haversine_matrix, EARTH_RADIUS_KM
+from .solver import solve
+
+def _distances_from(point, coords):
+    """Haversine km from ``point`` to every row of ``coords``."""
+    coords = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+    lat0, lng0 = math.radians(point[0]), math.radians(point[1])
+    a = (np.sin((coords[:, 0] - lat0) / 2) ** 2
+         + math.cos(lat0) * np.cos(coords[:, 0]) * np.sin((coords[:, 1] - lng0) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def sweep_clusters(depot, coords, vehicles, capacity):
+    """Split stop indices into ``vehicles`` angular sectors around ``depot``.
+
+    Returns ``(clusters, unassigned)``; when there are more stops than total
+    capacity the ones farthest from the depot are left unassigned.
+    """
+    n = len(coords)
+    if n == 0 or vehicles <= 0:
+        return [[] for _ in range(max(vehicles, 0))], list(range(n))
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+
+    keep = np.arange(n)
+    unassigned = []
+    if n > vehicles * capacity:
+        order = np.argsort(_distances_from(depot, coords), kind='stable')
+        keep = np.sort(order[:vehicles * capacity])
+        unassigned = sorted(order[vehicles * capacity:].tolist())
+
+    dlat = coords[keep, 0] - depot[0]
+    dlng = (coords[keep, 1] - depot[1]) * math.cos(math.radians(depot[0]))
+    angles = np.arctan2(dlat, dlng)
+    by_angle = keep[np.argsort(angles, kind='stable')]
+    sorted_angles = np.sort(angles)
+
+    # Start the sweep just after the widest empty wedge so no sector straddles it
+    if len(by_angle) > 1:
+        gaps = np.diff(np.append(sorted_angles, sorted_angles[0] + 2 * math.pi))
+        start = (int(np.argmax(gaps)) + 1) % len(by_angle)
+        by_angle = np.roll(by_angle, -start)
+
+    sizes = [len(by_angle) // vehicles + (1 if i < len(by_angle) % vehicles else 0) for i in range(vehicles)]
+    clusters, offset = [], 0
+    for size in sizes:
+        clusters.append(by_angle[offset:offset + size].tolist())
+        offset += size
+    return clusters, unassigned
+
+def plan_routes(depot, coords, vehicles, capacity, time_budget=1.0):
+    """Sweep into sectors and route each; returns ``(routes, unassigned)`` as stop indices."""
+    clusters, unassigned = sweep_clusters(depot, coords, vehicles, capacity)
+    busy = sum(1 for cluster in clusters if cluster) or 1
+    routes = []
+    for cluster in clusters:
+        if len(cluster) < 2:
+            routes.append(list(cluster))
+            continue
+        matrix = haversine_matrix([depot] + [coords[i] for i in cluster])
+        order, _ = solve(matrix, time_budget=time_budget / busy)
+        routes.append([cluster[node - 1] for node in order[1:]])
+    return routes, unassigned
+
+def insertion_cost(depot, route_coords, point):
+    """Cheapest open-path insertion of ``point`` into a route starting at ``depot``.
+
+    Returns ``(position, added_km)``; ``position`` indexes ``route_coords``.
+    """
+    path = np.asarray([depot] + list(route_coords), dtype=float).reshape(-1, 2)
+    to_point = _distances_from(point, path)
+    if len(path) == 1:
+        return 0, float(to_point[0])
+    legs = haversine_matrix(path)
+    existing = legs[np.arange(len(path) - 1), np.arange(1, len(path))]
+    # Between path[j] and path[j + 1], or appended after the last stop
+    costs = np.append(to_point[:-1] + to_point[1:] - existing, to_point[-1])
+    best = int(np.argmin(costs))
+    return best, float(costs[best])
@@ -0,0 +1,59 @@
+"""Menu search backed by the ``menu_items_fts`` FTS5 index.
+
+User input is reduced to bare word tokens and every token becomes a quoted
+prefix term, so ``"chick wi"`` matches "Chicken Wings" and FTS5 query syntax
+in the search box can never raise. Results are ranked with bm25, weighting
+name over category over description.
+"""
+import re
+from markupsafe import Markup, escape
+
+MAX_SEARCH_RESULTS = 50
+
+# Private-use markers passed to highlight()/snippet(); swapped for <mark>
+# only after the text has been HTML-escaped.
+_OPEN, _CLOSE = '\x02', '\x03'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def build_match_query(text):
+    tokens = _TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def render_marked(text):
+    """HTML-escape ``text`` and turn the highlight markers into <mark> tags."""
+    escaped = str(escape(text or ''))
+    return Markup(escaped.replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+def search_menu(db, text, category=None, limit=MAX_SEARCH_RESULTS):
+    """Return active menu items matching ``text`` as dicts, best match first.
+
+    Each result carries ``name_html`` and ``snippet_html`` with the matched
+    terms wrapped in <mark>.
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    query = f"""
+        SELECT m.*,
+               highlight(menu_items_fts, 0, '{_OPEN}', '{_CLOSE}') AS name_marked,
+               snippet(menu_items_fts, 1, '{_OPEN}', '{_CLOSE}', '…', 12) AS snippet_marked,
+               bm25(menu_items_fts, 10.0, 1.0, 4.0) AS rank
+        FROM menu_items_fts
+        JOIN menu_items m ON m.item_id = menu_items_fts.rowid
+        WHERE menu_items_fts MATCH ? AND m.is_active = 1
+    """
+    params = [match]
+    if category:
+        query += " AND m.category = ?"
+        params.append(category)
+    query += " ORDER BY rank LIMIT ?"
+    params.append(max(1, min(int(limit), MAX_SEARCH_RESULTS)))
+
+    results = []
+    for row in db.execute(query, params).fetchall():
+        item = dict(row)
+        item['name_html'] = render_marked(item.pop('name_marked'))
+        item['snippet_html'] = render_marked(item.pop('snippet_marked'))
+        results.append(item)
+    return results
@@ -0,0 +1,86 @@
+"""Scheduled shifts: "who is on" and weekly coverage.
+
+``shifts`` is materialized from ``employees.schedule`` by triggers
+(migration 15): one row per employee and weekday, times as minutes after
+midnight, with overnight shifts split at midnight. Both queries below are
+range scans on ``idx_shifts_interval (weekday, start_minute, end_minute)``
+instead of ``json.loads`` over every employee.
+"""
+from datetime import datetime
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MINUTES_PER_DAY = 1440
+
+def parse_weekday(value):
+    """0-6 from a day name/prefix ("fri") or number, or None."""
+    if value is None or value == '':
+        return None
+    value = str(value).strip().lower()
+    if value.isdigit():
+        return int(value) if int(value) < 7 else None
+    for index, name in enumerate(WEEKDAYS):
+        if len(value) >= 2 and name.startswith(value):
+            return index
+    return None
+
+def parse_minute(value):
+    """Minutes after midnight from ``HH:MM``, or None."""
+    try:
+        hours, minutes = str(value).split(':')
+        minute = int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
+    return minute if 0 <= minute < MINUTES_PER_DAY else None
+
+def format_minute(minute):
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+def _role_filter(role, params):
+    if not role:
+        return ''
+    params.append(f'%{role.lower()}%')
+    return " AND lower(e.job_title) LIKE ?"
+
+def on_shift(db, weekday=None, minute=None, role=None):
+    """Active employees scheduled at ``weekday``/``minute`` (default: now)."""
+    if weekday is None or minute is None:
+        now = datetime.now()
+        weekday = now.weekday() if weekday is None else weekday
+        minute = now.hour * 60 + now.minute if minute is None else minute
+    params = [weekday, minute, minute]
+    query = """
+        SELECT e.employee_id, e.first_name, e.last_name, e.job_title, s.start_minute, s.end_minute
+        FROM shifts s
+        JOIN employees e ON e.employee_id = s.employee_id
+        WHERE s.weekday = ? AND s.start_minute <= ? AND s.end_minute > ?
+          AND coalesce(e.status, 'active') = 'active'
+    """ + _role_filter(role, params) + " ORDER BY s.end_minute, e.last_name COLLATE NOCASE"
+    return [dict(row) for row in db.execute(query, params).fetchall()]
+
+def coverage(db, slot_minutes=30, role=None):
+    """Scheduled headcount per weekday and time slot.
+
+    Returns ``{'slot_minutes', 'slots': ['00:00', ...], 'days': {weekday_name: [count, ...]}}``.
+    """
+    query = """
+        WITH RECURSIVE slots(minute) AS (
+            SELECT 0 UNION ALL SELECT minute + ? FROM slots WHERE minute + ? < ?
+        ),
+        days(weekday) AS (VALUES (0), (1), (2), (3), (4), (5), (6)),
+        grid AS (SELECT days.weekday, slots.minute FROM days, slots)
+        SELECT g.weekday, g.minute, count(e.employee_id) AS staff
+        FROM grid g
+        LEFT JOIN shifts s ON s.weekday = g.weekday AND s.start_minute <= g.minute AND s.end_minute > g.minute
+        LEFT JOIN employees e ON e.employee_id = s.employee_id AND coalesce(e.status, 'active') = 'active'
+    """
+    params = [slot_minutes, slot_minutes, MINUTES_PER_DAY]
+    if role:
+        query += " AND lower(e.job_title) LIKE ?"
+        params.append(f'%{role.lower()}%')
+    query += " GROUP BY g.weekday, g.minute ORDER BY g.weekday, g.minute"
+
+    days = {name: [] for name in WEEKDAYS}
+    for row in db.execute(query, params).fetchall():
+        days[WEEKDAYS[row['weekday']]].append(row['staff'])
+    slots = [format_minute(minute) for minute in range(0, MINUTES_PER_DAY, slot_minutes)]
+    return {'slot_minutes': slot_minutes, 'slots': slots, 'days': days}
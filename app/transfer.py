@@ -0,0 +1,266 @@
+"""Streaming bulk export/import (``flask export`` / ``flask import``).
+
+Rows are read with ``fetchmany`` and written as they arrive, so memory use
+stays flat however large the table is. Orders carry their line items: a
+JSON ``items`` column in CSV (the same shape as the legacy ``orders.csv``)
+or a nested list in JSONL, loaded one batched query per chunk.
+
+Imports read the file as a stream as well. Each chunk goes in with
+``executemany`` inside its own ``BEGIN IMMEDIATE`` transaction, which
+bounds both lock hold time and how much a failure has to redo. A ``.gz``,
+``.bz2`` or ``.xz`` suffix (or ``--compress``) selects compression.
+"""
+import bz2
+import contextlib
+import csv
+import gzip
+import json
+import lzma
+import sys
+import click
+from flask.cli import with_appcontext
+from app.db import get_db
+from app.orders import load_order_items
+from app.lifecycle import seed_initial_events
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# key: unique column used for ordering and upserts; date: column filtered by --since/--until
+TABLES = {
+    'orders': {'key': 'order_id', 'date': 'created_at'},
+    'employees': {'key': 'employee_id', 'date': 'created_at'},
+    'attendance': {'key': 'id', 'date': 'date'},
+    'users': {'key': 'user_id', 'date': 'created_at'},
+    'menu_items': {'key': 'item_id', 'date': None},
+    'coupons': {'key': 'code', 'date': None},
+}
+ITEM_COLUMNS = ('item_id', 'name', 'price', 'quantity', 'allergies')
+
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+class TransferError(Exception):
+    pass
+
+def table_columns(db, table):
+    return [row['name'] for row in db.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path.lower()
+    for suffix in COMPRESSORS:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    raise TransferError(f'Cannot tell the format of {path}; pass --format csv|jsonl')
+
+def open_stream(path, mode, compress=None):
+    """Text stream for ``path`` ('-' is stdin/stdout), compressed by suffix or ``compress``."""
+    if path == '-':
+        # Leave the process streams open when the ``with`` block exits
+        return contextlib.nullcontext(sys.stdout if 'w' in mode else sys.stdin)
+    opener = COMPRESSORS.get(f'.{compress}') if compress else None
+    if opener is None:
+        opener = next((fn for suffix, fn in COMPRESSORS.items() if path.lower().endswith(suffix)), None)
+    if opener is None:
+        return open(path, mode, encoding='utf-8', newline='')
+    return opener(path, mode + 't', encoding='utf-8', newline='')
+
+def _json_default(value):
+    # PARSE_DECLTYPES hands back datetimes for TIMESTAMP columns
+    return str(value)
+
+def export_rows(db, table, out, fmt, since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream ``table`` to the text stream ``out``; returns the number of rows written."""
+    if table not in TABLES:
+        raise TransferError(f"Unknown table {table}; choose from {', '.join(TABLES)}")
+    spec = TABLES[table]
+    columns = table_columns(db, table)
+    query, params = f"SELECT {', '.join(columns)} FROM {table}", []
+    conditions = []
+    if (since or until) and not spec['date']:
+        raise TransferError(f'{table} has no date column to filter on')
+    if since:
+        conditions.append(f"{spec['date']} >= ?")
+        params.append(since)
+    if until:
+        conditions.append(f"{spec['date']} < date(?, '+1 day')")
+        params.append(until)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {spec['key']}"
+
+    nested = table == 'orders'
+    header = columns + ['items'] if nested else columns
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(header)
+
+    count = 0
+    cursor = db.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        items = load_order_items(db, [row['order_id'] for row in rows]) if nested else None
+        for row in rows:
+            record = dict(row)
+            if nested:
+                record['items'] = [{column: item[column] for column in ITEM_COLUMNS} for item in items[row['order_id']]]
+            if writer:
+                writer.writerow([
+                    json.dumps(record[column], default=_json_default) if column == 'items'
+                    else ('' if record[column] is None else record[column])
+                    for column in header
+                ])
+            else:
+                out.write(json.dumps(record, default=_json_default) + '\n')
+        count += len(rows)
+    return count
+
+def read_records(stream, fmt):
+    """Yield dicts from a CSV/JSONL stream; CSV blanks become NULL."""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            record = {key: (value if value != '' else None) for key, value in row.items()}
+            if record.get('items'):
+                record['items'] = json.loads(record['items'])
+            yield record
+    else:
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise TransferError(f'Line {number}: {e}')
+
+def _insert_sql(table, columns, key, mode):
+    placeholders = ', '.join(['?'] * len(columns))
+    verb = 'INSERT OR IGNORE' if mode == 'ignore' else 'INSERT'
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    if mode == 'upsert':
+        # Surrogate ``id`` columns keep their existing value
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column not in (key, 'id'))
+        sql += f" ON CONFLICT({key}) DO UPDATE SET {updates}"
+    return sql
+
+def _write_chunk(db, table, key, columns, records, mode):
+    values = [tuple(record.get(column) for column in columns) for record in records]
+    nested = table == 'orders'
+    if nested:
+        if any(record.get(key) is None and record.get('items') for record in records):
+            raise TransferError('Orders with items need an order_id to attach them to')
+        ids = [record[key] for record in records if record.get(key) is not None]
+        placeholders = ','.join(['?'] * len(ids))
+        existing = {row[0] for row in db.execute(
+            f"SELECT order_id FROM orders WHERE order_id IN ({placeholders})", ids
+        ).fetchall()} if ids else set()
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        if nested:
+            # Orders without an order_id in the file get ids above the current max
+            max_before = db.execute("SELECT coalesce(max(order_id), 0) FROM orders").fetchone()[0]
+        db.executemany(_insert_sql(table, columns, key, mode), values)
+        if nested:
+            seed_initial_events(db, [i for i in ids if i not in existing], after_id=max_before, actor='import')
+            # Items follow their order: replaced on upsert, skipped when the order was ignored
+            if mode == 'upsert' and existing:
+                db.execute(f"DELETE FROM order_items WHERE order_id IN ({','.join(['?'] * len(existing))})",
+                           list(existing))
+            db.executemany(
+                "INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies) VALUES (?, ?, ?, ?, ?, ?)",
+                [(record[key], item.get('item_id'), item.get('name'), item.get('price'),
+                  item.get('quantity', 1), item.get('allergies') or '')
+                 for record in records
+                 if record.get(key) is not None and (mode == 'upsert' or record[key] not in existing)
+                 for item in record.get('items') or []]
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def import_rows(db, table, stream, fmt, mode='insert', chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Load records from ``stream`` into ``table`` chunk by chunk; returns rows processed.
+
+    ``mode`` is ``insert`` (fail on duplicates), ``ignore`` (skip existing
+    keys) or ``upsert`` (update existing rows; order items are replaced).
+    Chunks committed before an error stay committed.
+    """
+    if table not in TABLES:
+        raise TransferError(f"Unknown table {table}; choose from {', '.join(TABLES)}")
+    key = TABLES[table]['key']
+    table_cols = table_columns(db, table)
+    if db.in_transaction:
+        db.commit()
+
+    columns, chunk, count = None, [], 0
+    for record in read_records(stream, fmt):
+        if columns is None:
+            columns = [column for column in table_cols if column in record]
+            if mode == 'upsert' and key not in columns:
+                raise TransferError(f'Upserting {table} needs the {key} column')
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            _write_chunk(db, table, key, columns, chunk, mode)
+            count += len(chunk)
+            chunk = []
+            if progress:
+                progress(count)
+    if chunk:
+        _write_chunk(db, table, key, columns, chunk, mode)
+        count += len(chunk)
+    return count
+
+@click.command('export')
+@click.argument('table', type=click.Choice(list(TABLES)))
+@click.option('-o', '--output', default='-', show_default=True, help='File to write (".gz"/".bz2"/".xz" compress).')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the output file extension.')
+@click.option('--since', help='Only rows on/after this date (YYYY-MM-DD).')
+@click.option('--until', help='Only rows on/before this date (YYYY-MM-DD).')
+@click.option('--compress', type=click.Choice(['gz', 'bz2', 'xz']), help='Compress regardless of extension.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def export_command(table, output, fmt, since, until, compress, chunk_size):
+    """Stream a table to CSV or JSONL."""
+    try:
+        fmt = fmt or ('jsonl' if output == '-' else detect_format(output))
+        with open_stream(output, 'w', compress) as out:
+            count = export_rows(get_db(), table, out, fmt, since, until, chunk_size)
+    except TransferError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Exported {count} {table} rows.', err=True)
+
+@click.command('import')
+@click.argument('table', type=click.Choice(list(TABLES)))
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--mode', type=click.Choice(['insert', 'ignore', 'upsert']), default='insert', show_default=True)
+@click.option('--compress', type=click.Choice(['gz', 'bz2', 'xz']), help='Decompress regardless of extension.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def import_command(table, path, fmt, mode, compress, chunk_size):
+    """Load a CSV or JSONL export back into a table."""
+    db = get_db()
+    try:
+        fmt = fmt or ('jsonl' if path == '-' else detect_format(path))
+        with open_stream(path, 'r', compress) as stream:
+            count = import_rows(db, table, stream, fmt, mode, chunk_size,
+                                progress=lambda n: click.echo(f'  {n} rows...', err=True))
+    except (TransferError, ValueError, KeyError) as e:
+        raise click.ClickException(str(e))
+    except db.IntegrityError as e:
+        raise click.ClickException(f'{e} (earlier chunks were committed; re-run with --mode ignore to skip them)')
+    if table == 'orders':
+        # Imported orders bypass checkout, so recompute the dashboard rollups
+        from app.rollups import rebuild
+        rebuild(db)
+    click.echo(f'Imported {count} {table} rows.', err=True)
+
+def init_app_transfer(app):
+    app.cli.add_command(export_command)
+    app.cli.add_command(import_command)
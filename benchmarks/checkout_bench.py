@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: orders/sec for checkout, before and after the
+single-transaction rewrite.
+
+"before" replays the previous main.checkout: one INSERT per cart line under
+Python's implicit transaction, priced from the session snapshot.
+"after" calls app.checkout.place_order (BEGIN IMMEDIATE, catalog re-pricing,
+executemany, rollups, idempotency key).
+
+Usage: python benchmarks/checkout_bench.py [--orders 2000] [--lines 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.db import init_db, get_db
+from app import cart as carts
+from app.checkout import place_order
+from config import Config
+
+def make_app(path):
+    class BenchConfig(Config):
+        DATABASE_URI = f"sqlite:///{path}"
+        TESTING = True
+    return create_app(BenchConfig)
+
+def seed(db, lines):
+    db.execute(
+        "INSERT INTO users (email, password_hash, name, phone, address) VALUES (?, ?, ?, ?, ?)",
+        ('bench@tastycorner.com', 'x', 'Bench', '555-0100', '1 Bench St')
+    )
+    db.executemany(
+        "INSERT INTO menu_items (name, description, price, category) VALUES (?, ?, ?, ?)",
+        [(f'Item {i}', 'Benchmark item', 5.0 + i, 'Bench') for i in range(lines)]
+    )
+    db.commit()
+    return [dict(row) for row in db.execute("SELECT * FROM menu_items ORDER BY item_id")]
+
+def bench_before(db, items, orders, tax_rate, delivery_fee):
+    cart = [{'item_id': item['item_id'], 'name': item['name'], 'price': item['price'],
+             'quantity': 2, 'allergies': ''} for item in items]
+    start = time.perf_counter()
+    for _ in range(orders):
+        subtotal = sum(item['price'] * item['quantity'] for item in cart)
+        tax = subtotal * tax_rate
+        total = subtotal + tax + delivery_fee
+        cursor = db.execute(
+            "INSERT INTO orders (user_id, subtotal, tax, delivery_fee, tip, total, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (1, subtotal, tax, delivery_fee, 0, total, 'pending')
+        )
+        order_id = cursor.lastrowid
+        for item in cart:
+            db.execute(
+                "INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies) VALUES (?, ?, ?, ?, ?, ?)",
+                (order_id, item['item_id'], item['name'], item['price'], item['quantity'], item['allergies'])
+            )
+        db.commit()
+    return time.perf_counter() - start
+
+def bench_after(db, items, orders, tax_rate, delivery_fee):
+    cart_id = carts.get_cart_id(db, 1)
+    elapsed = 0.0
+    for n in range(orders):
+        # Filling the cart happens on earlier requests; only checkout is timed
+        for item in items:
+            carts.add_item(db, cart_id, item['item_id'], 2, commit=False)
+        db.commit()
+
+        start = time.perf_counter()
+        order_id, created = place_order(db, 1, cart_id, f'bench-{n}', tax_rate, delivery_fee)
+        elapsed += time.perf_counter() - start
+        assert created and order_id
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=4)
+    args = parser.parse_args()
+
+    for label, runner in (('before', bench_before), ('after', bench_after)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'bench.db'))
+            with app.test_request_context():
+                init_db()
+                db = get_db()
+                items = seed(db, args.lines)
+                elapsed = runner(db, items, args.orders, app.config['TAX_RATE'], app.config['DELIVERY_FEE'])
+                app.extensions['db_pool'].close_all()
+        print(f"{label:>6}: {args.orders} orders x {args.lines} lines in {elapsed:.3f}s "
+              f"-> {args.orders / elapsed:,.0f} orders/sec")
+
+if __name__ == '__main__':
+    main()
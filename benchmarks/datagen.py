@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data for load benchmarks.
+
+Scale factor 1 is 1,000 users, 10,000 orders (~2.5 lines each), 30
+employees and 90 days of attendance; everything but the menu grows
+linearly, so --scale 100 gives 100k users and a million orders. The same
+--scale/--seed/--anchor always produce the same rows, and all timestamps
+count back from --anchor rather than the wall clock, so databases built on
+different days or machines are interchangeable.
+
+Rows are generated lazily and written in executemany chunks, one
+transaction each, so memory use does not grow with the scale factor.
+
+Usage: python benchmarks/datagen.py --db /tmp/bench.db [--scale 1] [--seed 42]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.db import init_db, get_db
+from app.rollups import rebuild
+from app.lifecycle import seed_initial_events
+from config import Config
+
+USERS_PER_SCALE = 1000
+ORDERS_PER_SCALE = 10000
+EMPLOYEES_PER_SCALE = 30
+ATTENDANCE_DAYS = 90
+ORDER_HISTORY_DAYS = 365
+CHUNK_SIZE = 5000
+DEFAULT_ANCHOR = '2026-01-01 12:00:00'
+
+CATEGORIES = {
+    'Burgers': ('Classic', 'Bacon', 'Mushroom Swiss', 'Veggie', 'Double', 'BBQ', 'Spicy', 'Breakfast'),
+    'Pizza': ('Margherita', 'Pepperoni', 'Hawaiian', 'Meat Lovers', 'Four Cheese', 'Veggie', 'BBQ Chicken'),
+    'Sides': ('Fries', 'Onion Rings', 'Wings', 'Mozzarella Sticks', 'Coleslaw', 'Salad'),
+    'Drinks': ('Cola', 'Lemonade', 'Iced Tea', 'Milkshake', 'Water', 'Coffee'),
+    'Desserts': ('Brownie', 'Cheesecake', 'Ice Cream', 'Apple Pie'),
+}
+JOB_TITLES = ('Cook', 'Cook', 'Cashier', 'Driver', 'Driver', 'Manager')
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+ALLERGIES = ('', '', '', '', 'nuts', 'gluten', 'dairy')
+# Most history is settled; the last day still has orders in flight
+RECENT_STATUSES = ('pending', 'preparing', 'out_for_delivery', 'completed')
+
+def sizes(scale):
+    return {
+        'users': int(USERS_PER_SCALE * scale),
+        'orders': int(ORDERS_PER_SCALE * scale),
+        'employees': max(5, int(EMPLOYEES_PER_SCALE * scale)),
+    }
+
+def chunked(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def write(db, sql, rows):
+    count = 0
+    for chunk in chunked(rows):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(sql, chunk)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        count += len(chunk)
+    return count
+
+def menu_rows(rng):
+    for category, names in CATEGORIES.items():
+        for name in names:
+            yield (f'{name} {category.rstrip("s")}', f'House {name.lower()} {category.lower()}',
+                   round(rng.uniform(2.5, 18.0), 2), category)
+
+def user_rows(rng, count, anchor):
+    for n in range(1, count + 1):
+        created = anchor - timedelta(days=ORDER_HISTORY_DAYS + rng.randrange(365))
+        yield (f'user{n}@bench.tastycorner.com', 'x', f'Bench User {n}', f'555-{n % 10000:04d}',
+               f'{rng.randrange(1, 9999)} {rng.choice(("Oak", "Elm", "Main", "Pine", "Cedar"))} St',
+               created.strftime('%Y-%m-%d %H:%M:%S'))
+
+def order_rows(rng, count, users, menu, anchor, tax_rate, delivery_fee):
+    """Yield ``(order, lines)``; order ids are assigned densely from 1 so lines can name them."""
+    span = ORDER_HISTORY_DAYS * 86400
+    # Sorted offsets keep created_at increasing with order_id, as in production
+    for order_id in range(1, count + 1):
+        age = span * (1 - order_id / count)
+        created = anchor - timedelta(seconds=age)
+        if age < 86400:
+            status = rng.choice(RECENT_STATUSES)
+        else:
+            status = 'cancelled' if rng.random() < 0.05 else 'completed'
+        lines = []
+        for item in rng.sample(menu, rng.choice((1, 2, 2, 3, 3, 4))):
+            lines.append((order_id, item['item_id'], item['name'], item['price'], rng.choice((1, 1, 1, 2, 3)), rng.choice(ALLERGIES)))
+        subtotal = round(sum(line[3] * line[4] for line in lines), 2)
+        tax = round(subtotal * tax_rate, 2)
+        tip = rng.choice((0, 0, 2, 3, 5))
+        yield (order_id, rng.randrange(1, users + 1), subtotal, tax, delivery_fee, tip,
+               round(subtotal + tax + delivery_fee + tip, 2), status, created.strftime('%Y-%m-%d %H:%M:%S')), lines
+
+def employee_rows(rng, count, anchor):
+    for n in range(1, count + 1):
+        start_hour = rng.choice((6, 9, 11, 16))
+        days = set(rng.sample(WEEKDAYS, 5))
+        schedule = {day: {'enabled': day in days, 'start': f'{start_hour:02d}:00', 'end': f'{(start_hour + 8) % 24:02d}:00'}
+                    for day in WEEKDAYS}
+        yield (f'B{n:05d}', f'Bench{n}', f'Employee{n}', f'staff{n}@bench.tastycorner.com', JOB_TITLES[n % len(JOB_TITLES)],
+               json.dumps(schedule), round(rng.uniform(14, 28), 2),
+               (anchor - timedelta(days=ATTENDANCE_DAYS + n % 30)).strftime('%Y-%m-%d %H:%M:%S'))
+
+def attendance_rows(rng, count, anchor):
+    for n in range(1, count + 1):
+        for day in range(ATTENDANCE_DAYS, 0, -1):
+            if rng.random() < 0.3:
+                continue
+            date = (anchor - timedelta(days=day)).date()
+            check_in = datetime.combine(date, datetime.min.time()) + timedelta(hours=rng.choice((6, 9, 11, 16)), minutes=rng.randrange(30))
+            check_out = check_in + timedelta(hours=rng.uniform(4, 9))
+            yield (f'B{n:05d}', date.isoformat(), check_in.strftime('%Y-%m-%d %H:%M:%S'),
+                   check_out.strftime('%Y-%m-%d %H:%M:%S'), round((check_out - check_in).total_seconds() / 3600, 2),
+                   check_in.strftime('%Y-%m-%d %H:%M:%S'))
+
+def generate(db, scale=1.0, seed=42, anchor=DEFAULT_ANCHOR, tax_rate=0.08, delivery_fee=5.0, log=print):
+    """Fill an empty, migrated database; returns the row counts written."""
+    rng = random.Random(seed)
+    anchor = datetime.strptime(anchor, '%Y-%m-%d %H:%M:%S')
+    size = sizes(scale)
+    counts = {}
+    if db.in_transaction:
+        db.commit()
+
+    def step(name, fn):
+        started = time.perf_counter()
+        counts[name] = fn()
+        log(f"  {name}: {counts[name]:,} rows in {time.perf_counter() - started:.1f}s")
+
+    def rollups():
+        started = time.perf_counter()
+        rebuild(db)
+        log(f"  rollups rebuilt in {time.perf_counter() - started:.1f}s")
+
+    step('menu_items', lambda: write(db, "INSERT INTO menu_items (name, description, price, category) VALUES (?, ?, ?, ?)",
+                                     menu_rows(rng)))
+    menu = [dict(row) for row in db.execute("SELECT item_id, name, price FROM menu_items ORDER BY item_id")]
+    step('users', lambda: write(db, "INSERT INTO users (email, password_hash, name, phone, address, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                user_rows(rng, size['users'], anchor)))
+
+    def orders():
+        count = 0
+        for chunk in chunked(order_rows(rng, size['orders'], size['users'], menu, anchor, tax_rate, delivery_fee)):
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    """INSERT INTO orders (order_id, user_id, subtotal, tax, delivery_fee, tip, total, status, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [order for order, _ in chunk]
+                )
+                db.executemany(
+                    "INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies) VALUES (?, ?, ?, ?, ?, ?)",
+                    [line for _, lines in chunk for line in lines]
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            count += len(chunk)
+        return count
+    step('orders', orders)
+    # One initial event per order, as imports get; order history reads them
+    seed_initial_events(db, after_id=0, actor='datagen')
+    db.commit()
+    counts['order_items'] = db.execute("SELECT count(*) FROM order_items").fetchone()[0]
+
+    step('employees', lambda: write(db, """INSERT INTO employees (employee_id, first_name, last_name, email, job_title, schedule, hourly_rate, created_at)
+                                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                                    employee_rows(rng, size['employees'], anchor)))
+    step('attendance', lambda: write(db, """INSERT INTO attendance (employee_id, date, check_in_time, check_out_time, hours_worked, created_at)
+                                            VALUES (?, ?, ?, ?, ?, ?)""",
+                                     attendance_rows(rng, size['employees'], anchor)))
+    rollups()
+    db.execute("ANALYZE")
+    db.commit()
+    return counts
+
+def build(path, scale=1.0, seed=42, anchor=DEFAULT_ANCHOR, log=print):
+    """Create ``path`` (which must not exist yet) and fill it."""
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+
+    class BenchConfig(Config):
+        DATABASE_URI = f"sqlite:///{path}"
+        TESTING = True
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        init_db()
+        db = get_db()
+        log(f"Generating scale {scale} (seed {seed}) into {path}")
+        counts = generate(db, scale, seed, anchor, app.config['TAX_RATE'], app.config['DELIVERY_FEE'], log)
+        db.execute("CREATE TABLE bench_meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT INTO bench_meta VALUES (?, ?)",
+                       [('scale', str(scale)), ('seed', str(seed)), ('anchor', anchor)])
+        db.commit()
+    app.extensions['db_pool'].close_all()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', required=True, help='Database file to create.')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor', default=DEFAULT_ANCHOR, help='"Now" for generated timestamps.')
+    args = parser.parse_args()
+    build(args.db, args.scale, args.seed, args.anchor)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: drive the blueprints through the Flask test client.
+
+Builds (or reuses) a datagen database, then for each scenario fires
+--requests requests from --threads threads, each thread with its own test
+client and a logged-in session for the role the endpoint needs. Reports
+throughput and p50/p95/p99 latency per endpoint, and with --json writes
+them together with the git revision and data parameters so two commits can
+be compared on the same data.
+
+Writes (checkout) change the database, so pass --fresh, or a --db that is
+rebuilt, when comparing runs that include them.
+
+Several templates still name pre-blueprint endpoints (url_for('menu')) and
+fail to render, so by default the route modules' render_template is swapped
+for one that returns the template name: the view's queries and logic are
+timed, Jinja is not. --render times the real templates.
+
+Usage: python benchmarks/load_bench.py [--db /tmp/bench-s1.db] [--scale 1] [--threads 8]
+                                       [--requests 500] [--only menu orders] [--json out.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app import cart as carts
+from app.db import get_db
+from app.routes import admin, auth, driver, kitchen, main as main_routes, worker
+from config import Config
+import datagen
+
+def scenario(name, path, role, method='GET', expect=200, prepare=None, data=None, headers=None):
+    return {'name': name, 'path': path, 'role': role, 'method': method, 'expect': expect,
+            'prepare': prepare, 'data': data, 'headers': headers}
+
+def fill_cart(app, state):
+    """Untimed: put two menu lines in this thread's cart before a checkout."""
+    # get_cart_id caches the id in the session, so it needs a request context
+    with app.test_request_context():
+        db = get_db()
+        cart_id = carts.get_cart_id(db, state['user_id'])
+        for item_id in state['rng'].sample(state['menu'], 2):
+            carts.add_item(db, cart_id, item_id, 1)
+    return {'checkout_token': f"bench-{state['user_id']}-{state['rng'].random()}"}
+
+SCENARIOS = [
+    scenario('menu', '/menu', 'user'),
+    scenario('menu_search', '/api/menu/search?q=pizza', 'user'),
+    scenario('orders', '/orders', 'user'),
+    scenario('orders_page', '/orders/page?limit=20', 'user'),
+    scenario('checkout', '/checkout', 'user', method='POST', expect=302, prepare=fill_cart),
+    scenario('admin', '/admin/', 'admin'),
+    scenario('admin_activity', '/admin/api/activity', 'admin'),
+    scenario('driver_pending', '/driver/api/deliveries/pending', 'driver'),
+    scenario('driver_pending_304', '/driver/api/deliveries/pending', 'driver', expect=304, headers='etag'),
+]
+
+def skip_templates():
+    for module in (admin, auth, driver, kitchen, main_routes, worker):
+        module.render_template = lambda name, **context: name
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+def make_client(app, role, rng, population):
+    client = app.test_client()
+    state = {'rng': rng, 'menu': population['menu']}
+    with client.session_transaction() as session:
+        if role == 'user':
+            state['user_id'] = rng.randrange(1, population['users'] + 1)
+            session['user_id'] = state['user_id']
+            session['user_name'] = 'Bench'
+        elif role == 'admin':
+            session['is_admin'] = True
+            session['admin_email'] = 'bench@tastycorner.com'
+        elif role == 'driver':
+            session['driver_id'] = rng.choice(population['drivers'])
+            session['driver_name'] = 'Bench Driver'
+    return client, state
+
+def run_scenario(app, spec, population, threads, requests, warmup, seed):
+    per_thread = [requests // threads + (1 if n < requests % threads else 0) for n in range(threads)]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(threads)
+
+    def worker(n):
+        rng = random.Random(f'{seed}-{spec["name"]}-{n}')
+        client, state = make_client(app, spec['role'], rng, population)
+        headers = {}
+        if spec['headers'] == 'etag':
+            headers['If-None-Match'] = client.get(spec['path']).headers.get('ETag', '')
+        for _ in range(warmup):
+            client.open(spec['path'], method='GET' if spec['method'] == 'POST' else spec['method'], headers=headers)
+        start_gate.wait()
+        mine, failed = [], 0
+        for _ in range(per_thread[n]):
+            data = spec['prepare'](app, state) if spec['prepare'] else spec['data']
+            started = time.perf_counter()
+            response = client.open(spec['path'], method=spec['method'], data=data, headers=headers)
+            mine.append(time.perf_counter() - started)
+            failed += response.status_code != spec['expect']
+            response.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    # Includes untimed setup (cart fills), so throughput is a lower bound for checkout
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, sum(errors), elapsed)
+
+def compare(results, path):
+    with open(path) as f:
+        baseline = json.load(f)
+    print(f"Against {path} ({baseline.get('revision')}):")
+    for name, stats in results.items():
+        before = baseline['endpoints'].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'throughput_rps'):
+            if before.get(key) and stats.get(key) is not None:
+                changes.append(f"{key} {(stats[key] - before[key]) / before[key]:+.0%}")
+        print(f"{name:>20}: {', '.join(changes)}")
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', help='Datagen database to use; built here if missing (default: a temp file).')
+    parser.add_argument('--fresh', action='store_true', help='Rebuild --db even if it exists.')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='Timed requests per endpoint.')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per thread first.')
+    parser.add_argument('--only', nargs='+', choices=[spec['name'] for spec in SCENARIOS])
+    parser.add_argument('--render', action='store_true', help='Render the real templates.')
+    parser.add_argument('--json', help='Write results to this file.')
+    parser.add_argument('--compare', help='Earlier --json output to show p50/p95 changes against.')
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.db
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, 'bench.db')
+    elif args.fresh and os.path.exists(path):
+        os.remove(path)
+    if not os.path.exists(path):
+        datagen.build(path, args.scale, args.seed)
+
+    class BenchConfig(Config):
+        DATABASE_URI = f"sqlite:///{path}"
+        DB_POOL_SIZE = args.threads
+        # Failures are counted as errors rather than raised into the threads
+        PROPAGATE_EXCEPTIONS = False
+
+    if not args.render:
+        skip_templates()
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db = get_db()
+        meta = dict(db.execute("SELECT key, value FROM bench_meta").fetchall())
+        population = {
+            'users': db.execute("SELECT count(*) FROM users").fetchone()[0],
+            'menu': [row[0] for row in db.execute("SELECT item_id FROM menu_items WHERE is_active = 1")],
+            'drivers': [row[0] for row in db.execute("SELECT employee_id FROM employees WHERE job_title LIKE '%driver%'")],
+        }
+
+    results = {}
+    for spec in SCENARIOS:
+        if args.only and spec['name'] not in args.only:
+            continue
+        results[spec['name']] = stats = run_scenario(app, spec, population, args.threads, args.requests, args.warmup, args.seed)
+        print(f"{spec['name']:>20}: {stats['throughput_rps']:>8} req/s  p50 {stats['p50_ms']:>8} ms  "
+              f"p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}")
+
+    app.extensions['db_pool'].close_all()
+    if tmp:
+        tmp.cleanup()
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.json:
+        report = {
+            'revision': git_revision(),
+            'data': {**meta, 'users': population['users']},
+            'threads': args.threads,
+            'templates_rendered': args.render,
+            'requests': args.requests,
+            'python': platform.python_version(),
+            'endpoints': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tour length and solve time for app.routing on synthetic instances.
+
+Stops are drawn around a depot either uniformly over a ~30 km square or in a
+handful of neighbourhood clusters, with a fixed seed so runs are comparable.
+For each size the nearest-neighbour seed, the improved tour and the solve
+time are reported.
+
+Usage: python benchmarks/routing_bench.py [--sizes 10 25 50 100 250 500]
+                                          [--budget-ms 2000] [--repeat 3] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routing import haversine_matrix, solve
+
+DEPOT = (30.4515, -91.1871)
+SPREAD_DEG = 0.15
+
+def uniform_instance(rng, n):
+    offsets = rng.uniform(-SPREAD_DEG, SPREAD_DEG, size=(n, 2))
+    return np.vstack([DEPOT, np.asarray(DEPOT) + offsets])
+
+def clustered_instance(rng, n, clusters=6):
+    centres = np.asarray(DEPOT) + rng.uniform(-SPREAD_DEG, SPREAD_DEG, size=(clusters, 2))
+    picks = rng.integers(0, clusters, size=n)
+    offsets = rng.normal(0, SPREAD_DEG / 15, size=(n, 2))
+    return np.vstack([DEPOT, centres[picks] + offsets])
+
+INSTANCES = {'uniform': uniform_instance, 'clustered': clustered_instance}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 25, 50, 100, 250, 500])
+    parser.add_argument('--budget-ms', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'kind':>9} {'stops':>5} {'seed km':>9} {'final km':>9} {'gain':>6} {'solve ms':>9} {'timeouts':>8}")
+    for kind, make in INSTANCES.items():
+        for size in args.sizes:
+            rng = np.random.default_rng(args.seed + size)
+            runs = []
+            for _ in range(args.repeat):
+                matrix = haversine_matrix(make(rng, size))
+                route, stats = solve(matrix, time_budget=args.budget_ms / 1000)
+                assert sorted(route) == list(range(size + 1)) and route[0] == 0
+                runs.append(stats)
+            row = {
+                'kind': kind,
+                'stops': size,
+                'seed_km': float(np.mean([r['seed_length'] for r in runs])),
+                'final_km': float(np.mean([r['length'] for r in runs])),
+                'solve_ms': float(np.mean([r['solve_ms'] for r in runs])),
+                'max_solve_ms': float(np.max([r['solve_ms'] for r in runs])),
+                'timeouts': sum(r['timed_out'] for r in runs),
+            }
+            row['improvement'] = 1 - row['final_km'] / row['seed_km'] if row['seed_km'] else 0.0
+            results.append(row)
+            print(f"{kind:>9} {size:>5} {row['seed_km']:>9.2f} {row['final_km']:>9.2f} "
+                  f"{row['improvement']:>6.1%} {row['solve_ms']:>9.1f} {row['timeouts']:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'repeat': args.repeat, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -8,14 +8,65 @@ class Config:
     # Database
     DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
     DATABASE_URI = os.environ.get('DATABASE_URI') or f"sqlite:///{os.path.join(DATA_DIR, 'tastycorner.db')}"
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_POOL_TIMEOUT = 5.0  # seconds to wait for a free connection
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_CACHE_SIZE_KB = 8000
+    DB_MMAP_SIZE = 128 * 1024 * 1024
+    DB_STATEMENT_CACHE_SIZE = 256
+    DB_AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', '1') == '1'  # apply pending migrations at startup
     
+    # Caching
+    CATALOG_CHECK_INTERVAL = 1.0  # seconds between cross-worker menu generation checks
+
+    # Driver delivery feed
+    DELIVERY_POLL_INTERVAL = 2.0  # seconds between change-log checks per worker
+    DELIVERY_STREAM_HEARTBEAT = 15
+    DELIVERY_STREAM_MAX_AGE = 300  # SSE connections are recycled after this many seconds
+
+    # Route optimization
+    RESTAURANT_LAT = float(os.environ['RESTAURANT_LAT']) if os.environ.get('RESTAURANT_LAT') else None
+    RESTAURANT_LNG = float(os.environ['RESTAURANT_LNG']) if os.environ.get('RESTAURANT_LNG') else None
+    ROUTE_TIME_BUDGET_MS = 1000  # default solver budget per /driver/api/optimize call
+    ROUTE_MAX_TIME_BUDGET_MS = 5000
+    GEOCODER = os.environ.get('GEOCODER', 'none')  # 'none', 'google', or 'offline' (invented points; dev/tests only)
+    GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
+    GEOCODE_WORKERS = 2  # background geocoding threads per worker
+    GEOCODE_SYNC = False  # geocode inline instead of in the background (tests)
+    DISPATCH_DRIVER_CAPACITY = 8  # max open orders per driver
+    DISPATCH_TIME_BUDGET_MS = 2000  # solver budget for a full rebalance, split across drivers
+
+    # Kitchen display
+    KITCHEN_POLL_INTERVAL = 1.0  # seconds between order_events checks per worker
+    KITCHEN_STREAM_HEARTBEAT = 15
+    KITCHEN_STREAM_MAX_AGE = 300
+
+    # Instrumentation
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'  # time requests and SQL for /admin/metrics
+    METRICS_SLOW_QUERY_MS = float(os.environ.get('METRICS_SLOW_QUERY_MS', 100))  # log statements slower than this
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # lets a scraper read /admin/metrics without an admin session
+    QUERY_PLAN_AUDIT = os.environ.get('QUERY_PLAN_AUDIT', '0') == '1'  # EXPLAIN each new statement (always on in debug)
+    QUERY_PLAN_MIN_ROWS = 1000  # scans of smaller tables are not reported, except GROWING_TABLES
+
+    # Static assets (flask assets build)
+    ASSET_IMAGE_WIDTHS = (320, 640, 1024, 1600)  # resized derivatives; only widths below the original are made
+    ASSET_IMAGE_QUALITY = 80  # WebP/JPEG quality for the derivatives
+    ASSET_EXCLUDE = ('images/menu',)  # uploads, resized by app.menu_images instead
+
     # Uploads
     UPLOAD_FOLDER = os.path.join('app', 'static', 'images')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    MENU_IMAGE_MAX_BYTES = 8 * 1024 * 1024
+    MENU_IMAGE_SIZES = {'thumb': 160, 'card': 480, 'hero': 1200}  # name -> width in px
+    MENU_IMAGE_QUALITY = 82
+    MENU_IMAGE_WORKERS = 2  # resize threads per gunicorn worker
+    MENU_IMAGE_SYNC = False  # resize inline instead of in the background (tests)
     
     # Business Logic
     TAX_RATE = 0.0945
     DELIVERY_FEE = 5.99
+    DEFAULT_HOURLY_RATE = 15.00  # for employees without their own hourly_rate
+    PAYROLL_MAX_OPEN_SHIFT_HOURS = 16  # open check-ins are paid at most this long
     
     # Stripe
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
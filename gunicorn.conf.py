@@ -0,0 +1,21 @@
+"""Gunicorn settings; ``gunicorn run:app`` picks this file up from the working directory.
+
+The driver delivery stream and long-poll and the kitchen display stream hold
+a request open for up to a few minutes. A sync worker serves one request at
+a time, so a single open stream would block every other page on it. gthread
+workers give each connection a thread instead: an idle stream costs a
+sleeping thread, not a worker. Streams only touch the database briefly
+(through the shared per-worker feeds), so DB_POOL_SIZE can stay well below
+GUNICORN_THREADS.
+"""
+import os
+
+# Render and Heroku set WEB_CONCURRENCY; bind defaults to $PORT when it is set
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+# Each open SSE stream or long-poll takes one thread for its lifetime
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# gthread workers heartbeat from their main loop, so this does not cut streams short
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
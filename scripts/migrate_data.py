@@ -1,180 +1,315 @@
+"""
+Migrate the legacy CSV files and employees.db into the application database.
+
+CSV sources are streamed and written in chunks with executemany. Each chunk
+is committed together with its row in migration_checkpoints, so an
+interrupted run picks up after the last committed chunk when started again
+(--restart forgets the checkpoints). When everything is loaded, the counts
+and totals read from each source are compared with what the database holds.
+"""
 import os
 import csv
 import json
 import sqlite3
 import sys
+import time
+import argparse
+from itertools import islice
 
 # Add parent directory to path to import app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
 from app.db import init_db, get_db
+from app.rollups import rebuild
+from app.lifecycle import seed_initial_events
+
+CHUNK_SIZE = 1000
+PROGRESS_INTERVAL = 2.0  # seconds between progress lines
+
+CHECKPOINT_TABLE = """
+    CREATE TABLE IF NOT EXISTS migration_checkpoints (
+        source TEXT PRIMARY KEY,
+        rows_done INTEGER NOT NULL,
+        completed BOOLEAN NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+def get_checkpoint(db, source):
+    row = db.execute("SELECT rows_done, completed FROM migration_checkpoints WHERE source = ?", (source,)).fetchone()
+    return (row['rows_done'], bool(row['completed'])) if row else (0, False)
+
+def save_checkpoint(db, source, rows_done, completed=False):
+    """Runs inside the chunk's transaction, so data and checkpoint commit together."""
+    db.execute(
+        """INSERT INTO migration_checkpoints (source, rows_done, completed) VALUES (?, ?, ?)
+           ON CONFLICT(source) DO UPDATE SET rows_done = excluded.rows_done,
+               completed = excluded.completed, updated_at = CURRENT_TIMESTAMP""",
+        (source, rows_done, int(completed))
+    )
+
+def blank(value):
+    return value if value not in ('', None) else None
+
+class Progress:
+    def __init__(self, source, resumed_at):
+        self.source = source
+        self.resumed_at = resumed_at
+        self.rows = 0
+        self.started = self.last_report = time.monotonic()
+
+    def add(self, count):
+        self.rows += count
+        now = time.monotonic()
+        if now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            print(f"  {self.source}: {self.resumed_at + self.rows} rows ({self.rate():.0f} rows/s)")
+
+    def rate(self):
+        return self.rows / max(time.monotonic() - self.started, 1e-9)
+
+    def finish(self):
+        elapsed = time.monotonic() - self.started
+        skipped = f", {self.resumed_at} already done" if self.resumed_at else ""
+        print(f"Migrated {self.rows} {self.source} rows in {elapsed:.1f}s ({self.rate():.0f} rows/s{skipped}).")
+
+# Each source turns a chunk of CSV rows into inserts and folds every row
+# (including ones skipped on resume) into the expected totals for verify().
+
+def user_rows(rows):
+    return [(row['user_id'], row['email'], row['password_hash'], row['name'],
+             row['phone'], row['address'], row['created_at']) for row in rows]
+
+def write_users(db, rows):
+    db.executemany(
+        "INSERT OR IGNORE INTO users (user_id, email, password_hash, name, phone, address, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        user_rows(rows)
+    )
+
+def write_menu(db, rows):
+    db.executemany(
+        "INSERT OR IGNORE INTO menu_items (item_id, name, description, price, category, image) VALUES (?, ?, ?, ?, ?, ?)",
+        [(row['item_id'], row['name'], row['description'], row['price'], row['category'], row.get('image', ''))
+         for row in rows]
+    )
+
+def write_coupons(db, rows):
+    db.executemany(
+        "INSERT OR IGNORE INTO coupons (code, discount_type, discount_value, min_order, max_discount, usage_limit, used_count, expiry_date, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(row['code'], row['discount_type'], row['discount_value'], row.get('min_order') or 0,
+          blank(row.get('max_discount')), blank(row.get('usage_limit')), row.get('used_count') or 0,
+          blank(row.get('expiry_date')), 1 if (row.get('is_active') or 'true').lower() == 'true' else 0)
+         for row in rows]
+    )
+
+def parse_items(row):
+    try:
+        return json.loads(row['items'] or '[]')
+    except json.JSONDecodeError:
+        print(f"Failed to parse items for order {row['order_id']}")
+        return []
+
+def write_orders(db, rows):
+    ids = [int(row['order_id']) for row in rows]
+    # Items only go in for orders this chunk actually inserts
+    existing = {r[0] for r in db.execute(
+        f"SELECT order_id FROM orders WHERE order_id IN ({','.join(['?'] * len(ids))})", ids
+    ).fetchall()}
+    db.executemany(
+        """INSERT OR IGNORE INTO orders
+           (order_id, user_id, subtotal, tax, delivery_fee, tip, total, status, coupon_code, discount, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        [(row['order_id'], row['user_id'], row['subtotal'], row['tax'], row['delivery_fee'], row['tip'],
+          row['total'], row['status'], blank(row.get('coupon_code')), row.get('discount') or 0, row['created_at'])
+         for row in rows]
+    )
+    db.executemany(
+        """INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [(row['order_id'], item.get('item_id'), item['name'], item['price'], item['quantity'], item.get('allergies', ''))
+         for row in rows if int(row['order_id']) not in existing
+         for item in row['_items']]
+    )
+    # History and latency reports start from the status the order arrived in
+    seed_initial_events(db, [i for i in ids if i not in existing], actor='migrate_data')
+
+def expect_orders(expected, row):
+    row['_items'] = parse_items(row)
+    expected['total'] = expected.get('total', 0) + float(row['total'] or 0)
+    expected['items'] = expected.get('items', 0) + sum(int(item['quantity']) for item in row['_items'])
+
+# source -> (csv file, table, key column, writer, extra expectations)
+CSV_SOURCES = [
+    ('users', 'users.csv', 'users', 'user_id', write_users, None),
+    ('menu', 'menu.csv', 'menu_items', 'item_id', write_menu, None),
+    ('coupons', 'coupons.csv', 'coupons', 'code', write_coupons, None),
+    ('orders', 'orders.csv', 'orders', 'order_id', write_orders, expect_orders),
+]
 
-def migrate():
+def migrate_csv(db, source, path, key, write, expect, chunk_size):
+    """Stream ``path`` into the database; returns the expected totals for verify()."""
+    rows_done, completed = get_checkpoint(db, source)
+    expected = {'rows': 0, 'min': None, 'max': None}
+    progress = Progress(source, rows_done)
+    numeric = key != 'code'
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                break
+            for row in chunk:
+                value = int(row[key]) if numeric else row[key]
+                expected['min'] = value if expected['min'] is None else min(expected['min'], value)
+                expected['max'] = value if expected['max'] is None else max(expected['max'], value)
+                if expect:
+                    expect(expected, row)
+            start = expected['rows']
+            expected['rows'] += len(chunk)
+            # Rows before the checkpoint were committed by an earlier run
+            pending = chunk[max(0, rows_done - start):]
+            if not pending or completed:
+                continue
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                write(db, pending)
+                save_checkpoint(db, source, expected['rows'])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            progress.add(len(pending))
+
+    if not completed:
+        save_checkpoint(db, source, expected['rows'], completed=True)
+        db.commit()
+        progress.finish()
+    else:
+        print(f"Skipping {source}: already migrated ({rows_done} rows).")
+    return expected
+
+def migrate_employees(db, old_db_path):
+    """Copy employees and attendance from the old SQLite file in one transaction."""
+    _, completed = get_checkpoint(db, 'employees')
+    if completed:
+        print("Skipping employees: already migrated.")
+        return
+    print("Migrating employees...")
+    started = time.monotonic()
+    # Attach old DB (ATTACH cannot run inside a transaction)
+    db.execute("ATTACH DATABASE ? AS old_db", (old_db_path,))
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        # We need to handle schema differences carefully.
+        # The new schema has 'schedule' as TEXT (JSON), same as old.
+        # We'll select common columns.
+        db.execute("""
+            INSERT OR IGNORE INTO main.employees
+            (employee_id, first_name, last_name, email, gender, dob, mobile, address, job_title, notes, status, schedule, hours_this_period, last_paid_date, profile_picture, hourly_rate, created_at)
+            SELECT
+                employee_id, first_name, last_name, email, gender, dob, mobile, address, job_title, notes, status, schedule, hours_this_period, last_paid_date, profile_picture, hourly_rate, created_at
+            FROM old_db.employees
+        """)
+
+        # Copy Attendance
+        db.execute("""
+            INSERT OR IGNORE INTO main.attendance
+            (employee_id, date, check_in_time, check_out_time, hours_worked, created_at)
+            SELECT
+                employee_id, date, check_in_time, check_out_time, hours_worked, created_at
+            FROM old_db.attendance
+        """)
+        count = db.execute("SELECT count(*) FROM old_db.employees").fetchone()[0]
+        save_checkpoint(db, 'employees', count, completed=True)
+        db.commit()
+        print(f"Migrated employees and attendance in {time.monotonic() - started:.1f}s.")
+    except sqlite3.Error as e:
+        db.rollback()
+        print(f"Error migrating employees: {e}")
+    finally:
+        db.execute("DETACH DATABASE old_db")
+
+def verify(db, results, old_db_path):
+    """Compare source counts/totals with the database; returns the number of mismatches."""
+    print("Verifying...")
+    problems = 0
+
+    def check(label, expected, actual):
+        nonlocal problems
+        ok = abs(expected - actual) < 0.005 if isinstance(expected, float) else expected == actual
+        problems += not ok
+        print(f"  {'ok      ' if ok else 'MISMATCH'} {label}: source {expected}, database {actual}")
+
+    for source, _, table, key, _, _ in CSV_SOURCES:
+        expected = results.get(source)
+        if not expected or expected['min'] is None:
+            continue
+        bounds = (expected['min'], expected['max'])
+        actual = db.execute(f"SELECT count(*) FROM {table} WHERE {key} BETWEEN ? AND ?", bounds).fetchone()[0]
+        check(f"{source} rows", expected['rows'], actual)
+        if source == 'orders':
+            total, items = db.execute(
+                """SELECT round(coalesce(sum(total), 0), 2),
+                          (SELECT coalesce(sum(quantity), 0) FROM order_items WHERE order_id BETWEEN ? AND ?)
+                   FROM orders WHERE order_id BETWEEN ? AND ?""",
+                bounds + bounds
+            ).fetchone()
+            check("order totals", round(expected['total'], 2), total)
+            check("order item quantities", expected['items'], items)
+
+    if old_db_path:
+        old = sqlite3.connect(old_db_path)
+        try:
+            for table in ('employees', 'attendance'):
+                check(f"{table} rows", old.execute(f"SELECT count(*) FROM {table}").fetchone()[0],
+                      db.execute(f"SELECT count(*) FROM {table}").fetchone()[0])
+        finally:
+            old.close()
+    return problems
+
+def migrate(chunk_size=CHUNK_SIZE, restart=False, data_dir=None):
     app = create_app()
     with app.app_context():
         print("Initializing new database...")
         init_db()
         db = get_db()
-        
-        data_dir = app.config['DATA_DIR']
-        
-        # 1. Migrate Users
-        users_csv = os.path.join(data_dir, 'users.csv')
-        if os.path.exists(users_csv):
-            print("Migrating users...")
-            with open(users_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                users = []
-                for row in reader:
-                    users.append((
-                        row['user_id'],
-                        row['email'],
-                        row['password_hash'],
-                        row['name'],
-                        row['phone'],
-                        row['address'],
-                        row['created_at']
-                    ))
-                db.executemany(
-                    "INSERT OR IGNORE INTO users (user_id, email, password_hash, name, phone, address, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    users
-                )
-                print(f"Migrated {len(users)} users.")
-
-        # 2. Migrate Menu Items
-        menu_csv = os.path.join(data_dir, 'menu.csv')
-        if os.path.exists(menu_csv):
-            print("Migrating menu items...")
-            with open(menu_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                items = []
-                for row in reader:
-                    items.append((
-                        row['item_id'],
-                        row['name'],
-                        row['description'],
-                        row['price'],
-                        row['category'],
-                        row.get('image', '')
-                    ))
-                db.executemany(
-                    "INSERT OR IGNORE INTO menu_items (item_id, name, description, price, category, image) VALUES (?, ?, ?, ?, ?, ?)",
-                    items
-                )
-                print(f"Migrated {len(items)} menu items.")
-
-        # 3. Migrate Coupons
-        coupons_csv = os.path.join(data_dir, 'coupons.csv')
-        if os.path.exists(coupons_csv):
-            print("Migrating coupons...")
-            with open(coupons_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                coupons = []
-                for row in reader:
-                    coupons.append((
-                        row['code'],
-                        row['discount_type'],
-                        row['discount_value'],
-                        row.get('min_order', 0),
-                        row.get('max_discount'),
-                        row.get('usage_limit'),
-                        row.get('used_count', 0),
-                        row.get('expiry_date'),
-                        1 if row.get('is_active', 'true').lower() == 'true' else 0
-                    ))
-                db.executemany(
-                    "INSERT OR IGNORE INTO coupons (code, discount_type, discount_value, min_order, max_discount, usage_limit, used_count, expiry_date, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    coupons
-                )
-                print(f"Migrated {len(coupons)} coupons.")
-
-        # 4. Migrate Orders & Order Items
-        orders_csv = os.path.join(data_dir, 'orders.csv')
-        if os.path.exists(orders_csv):
-            print("Migrating orders...")
-            with open(orders_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                count = 0
-                for row in reader:
-                    # Insert Order
-                    cursor = db.execute(
-                        """INSERT OR IGNORE INTO orders 
-                           (order_id, user_id, subtotal, tax, delivery_fee, tip, total, status, coupon_code, discount, created_at) 
-                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                        (
-                            row['order_id'],
-                            row['user_id'],
-                            row['subtotal'],
-                            row['tax'],
-                            row['delivery_fee'],
-                            row['tip'],
-                            row['total'],
-                            row['status'],
-                            row.get('coupon_code'),
-                            row.get('discount', 0),
-                            row['created_at']
-                        )
-                    )
-                    
-                    # Insert Order Items
-                    try:
-                        items = json.loads(row['items'])
-                        for item in items:
-                            db.execute(
-                                """INSERT INTO order_items (order_id, item_id, name, price, quantity, allergies)
-                                   VALUES (?, ?, ?, ?, ?, ?)""",
-                                (
-                                    row['order_id'],
-                                    item.get('item_id'),
-                                    item['name'],
-                                    item['price'],
-                                    item['quantity'],
-                                    item.get('allergies', '')
-                                )
-                            )
-                    except json.JSONDecodeError:
-                        print(f"Failed to parse items for order {row['order_id']}")
-                    
-                    count += 1
-                print(f"Migrated {count} orders.")
-
-        # 5. Migrate Employees (from old SQLite)
+        db.execute(CHECKPOINT_TABLE)
+        if restart:
+            db.execute("DELETE FROM migration_checkpoints")
+        db.commit()
+
+        data_dir = data_dir or app.config['DATA_DIR']
+        results = {}
+
+        for source, filename, table, key, write, expect in CSV_SOURCES:
+            path = os.path.join(data_dir, filename)
+            if os.path.exists(path):
+                print(f"Migrating {source}...")
+                results[source] = migrate_csv(db, source, path, key, write, expect, chunk_size)
+
         old_db_path = os.path.join(data_dir, 'employees.db')
-        if os.path.exists(old_db_path):
-            print("Migrating employees...")
-            # Attach old DB
-            db.execute(f"ATTACH DATABASE '{old_db_path}' AS old_db")
-            
-            # Copy Employees
-            # We need to handle schema differences carefully. 
-            # The new schema has 'schedule' as TEXT (JSON), same as old.
-            # We'll select common columns.
-            try:
-                db.execute("""
-                    INSERT OR IGNORE INTO main.employees 
-                    (employee_id, first_name, last_name, email, gender, dob, mobile, address, job_title, notes, status, schedule, hours_this_period, last_paid_date, profile_picture, hourly_rate, created_at)
-                    SELECT 
-                        employee_id, first_name, last_name, email, gender, dob, mobile, address, job_title, notes, status, schedule, hours_this_period, last_paid_date, profile_picture, hourly_rate, created_at
-                    FROM old_db.employees
-                """)
-                
-                # Copy Attendance
-                db.execute("""
-                    INSERT OR IGNORE INTO main.attendance
-                    (employee_id, date, check_in_time, check_out_time, hours_worked, created_at)
-                    SELECT 
-                        employee_id, date, check_in_time, check_out_time, hours_worked, created_at
-                    FROM old_db.attendance
-                """)
-                print("Migrated employees and attendance.")
-            except sqlite3.Error as e:
-                print(f"Error migrating employees: {e}")
-            finally:
-                db.execute("DETACH DATABASE old_db")
+        if not os.path.exists(old_db_path):
+            old_db_path = None
+        else:
+            migrate_employees(db, old_db_path)
 
-        db.commit()
+        if 'orders' in results:
+            # Migrated orders bypass checkout, so recompute the dashboard rollups
+            rebuild(db)
+
+        problems = verify(db, results, old_db_path)
+        if problems:
+            print(f"Migration finished with {problems} mismatch(es).")
+            return 1
         print("Migration complete!")
+        return 0
 
 if __name__ == '__main__':
-    migrate()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per transaction.')
+    parser.add_argument('--restart', action='store_true', help='Ignore saved checkpoints and start over.')
+    parser.add_argument('--data-dir', help='Directory holding the legacy files (default: DATA_DIR).')
+    args = parser.parse_args()
+    sys.exit(migrate(args.chunk_size, args.restart, args.data_dir))
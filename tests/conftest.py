@@ -0,0 +1,26 @@
+import pytest
+from config import Config
+from app import create_app
+from app.db import get_db, init_db
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        GEOCODER = 'none'
+
+        @staticmethod
+        def init_app(app):
+            pass
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        init_db()
+    return app
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield get_db()
@@ -0,0 +1,69 @@
+"""Driver dispatch on an install without a geocoder: no order has coordinates."""
+from datetime import datetime
+import pytest
+from app.dispatch import assign_pending, rebalance
+from app.routes import driver as driver_routes
+
+@pytest.fixture
+def rendered(monkeypatch):
+    # Only the view's context matters here, not the markup
+    calls = {}
+    def render(name, **context):
+        calls[name] = context
+        return name
+    monkeypatch.setattr(driver_routes, 'render_template', render)
+    return calls
+
+@pytest.fixture
+def orders(db):
+    db.execute("INSERT INTO users (email, password_hash, name, phone, address) VALUES ('c@example.com', 'x', 'Cy', '1', '1 Main St')")
+    db.executemany(
+        "INSERT INTO employees (employee_id, first_name, last_name, email, job_title) VALUES (?, ?, 'Lee', ?, 'Delivery Driver')",
+        [('D1', 'Ann', 'd1@example.com'), ('D2', 'Bob', 'd2@example.com')]
+    )
+    db.executemany(
+        "INSERT INTO orders (user_id, subtotal, tax, delivery_fee, total, status) VALUES (1, 10, 1, 2, 13, 'out_for_delivery')",
+        [()] * 3
+    )
+    db.commit()
+    return [1, 2, 3]
+
+def check_in(db, *employee_ids):
+    now = datetime.now()
+    db.executemany(
+        "INSERT INTO attendance (employee_id, date, check_in_time) VALUES (?, ?, ?)",
+        [(employee_id, now.strftime('%Y-%m-%d'), now.strftime('%Y-%m-%d %H:%M:%S')) for employee_id in employee_ids]
+    )
+    db.commit()
+
+def dashboard(app, employee_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['driver_id'] = employee_id
+    assert client.get('/driver/dashboard').status_code == 200
+
+def test_unlocated_orders_go_to_least_loaded_driver(db, orders):
+    check_in(db, 'D1', 'D2')
+    result = assign_pending(db)
+    assert sorted(result['assigned']) == orders and result['unassigned'] == []
+    assert sorted(result['assigned'].values()) == ['D1', 'D1', 'D2']
+
+def test_rebalance_places_unlocated_orders(db, orders):
+    check_in(db, 'D1', 'D2')
+    result = rebalance(db)
+    assert sorted(len(route) for route in result['routes'].values()) == [1, 2]
+    assert result['unassigned'] == []
+
+def test_on_shift_driver_sees_open_orders(app, db, orders, rendered):
+    check_in(db, 'D1')
+    assign_pending(db)
+    dashboard(app, 'D1')
+    context = rendered['driver/dashboard.html']
+    assert [order['order_id'] for order in context['pending_orders']] == orders
+    assert context['waiting_orders'] == []
+
+def test_driver_off_shift_still_sees_waiting_orders(app, db, orders, rendered):
+    dashboard(app, 'D2')
+    context = rendered['driver/dashboard.html']
+    assert context['pending_orders'] == [] and not context['on_shift']
+    assert [order['order_id'] for order in context['waiting_orders']] == orders
@@ -0,0 +1,23 @@
+"""Hot-path query plans against a freshly migrated database.
+
+Run with ``python -m pytest`` from the project root. The plans come from the
+schema alone, so an empty database is enough to catch a dropped or missing
+index before it reaches production.
+"""
+import pytest
+from app.query_plans import assert_hot_paths_indexed, assert_indexed
+
+def test_hot_paths_are_indexed(db):
+    assert_hot_paths_indexed(db)
+
+def test_assert_indexed_single_call(db):
+    from app import lifecycle
+    assert_indexed(db, lambda db: lifecycle.queue(db, 'pending'))
+
+def test_dropped_index_is_reported(db):
+    # Guards the audit itself: without its indexes an order's event history scans
+    for index in ('idx_order_events_order', 'idx_order_events_order_event'):
+        db.execute(f"DROP INDEX {index}")
+    db.commit()
+    with pytest.raises(AssertionError, match='orders.events'):
+        assert_hot_paths_indexed(db, names=['orders.events'])